@@ -1,171 +1,270 @@
 import json
 import os
+import sys
+import heapq
 import pandas as pd
 import geopandas as gpd
-from shapely.validation import explain_validity
 import numpy as np
-import matplotlib.pyplot as plt
-from pathlib import Path
+import shapely
+from geojson_stream import iter_feature_chunks
+from geometry_cache import cached_feature_chunks
+from parallel_validate import validate_chunks
+from topology_checks import find_duplicates, find_nearby_pairs, find_overlaps, polygon_rings
 
-# Path to the dataset
+# Path to the dataset (a .json file, or a .zip archive containing one)
 data_path = '/Users/pranavpai/Code/Data Sci Project/DS-Group-Project-21/Pai_Analysis/Pai_EDA_Area/data_unzipped/areas/osm-osm-traffic-a-2021-na/osm-osm-traffic-a-2021-na.json'
 
-# Check if file exists
-if not os.path.exists(data_path):
-    print(f"File not found: {data_path}")
-    exit(1)
-
-# Load the data
-print(f"Loading data from {data_path}")
-try:
-    with open(data_path, 'r') as f:
-        data = json.load(f)
-    
-    print("\nData type:", type(data))
-    print("Keys in the dictionary:", data.keys())
-    print(f"Number of features: {len(data['features'])}")
-    
-    # Create a GeoDataFrame
-    gdf = gpd.GeoDataFrame.from_features(data['features'])
-    print("\nGeoDataFrame created successfully")
-    print(f"CRS: {gdf.crs}")
-    print(f"Shape: {gdf.shape}")
-    print(f"Columns: {gdf.columns.tolist()}")
-    print(f"Geometry types: {gdf.geometry.type.value_counts()}")
-    
-    # Print property columns statistics
-    print("\nProperty statistics:")
-    for col in gdf.columns:
-        if col != 'geometry':
-            print(f"{col}: {gdf[col].nunique()} unique values")
-    
-    # Check for basic topology issues
-    print("\nChecking for basic topology issues...")
-    invalid_geoms = ~gdf.is_valid
-    if invalid_geoms.any():
-        print(f"Found {invalid_geoms.sum()} invalid geometries")
-        
-        # Sample a few invalid geometries to understand the issues
-        invalid_sample = gdf[invalid_geoms].head(5)
-        for idx, row in invalid_sample.iterrows():
-            print(f"Invalid geometry at index {idx}: {explain_validity(row.geometry)}")
-    else:
-        print("All geometries are valid")
-    
-    # Additional topological checks
-    print("\nAdditional topological properties:")
-    
-    # Check for empty geometries
-    empty_geoms = gdf[gdf.geometry.is_empty]
-    print(f"Empty geometries: {len(empty_geoms)}")
-    
-    # Check for duplicated geometries
-    dup_geoms = gdf[gdf.geometry.duplicated()]
-    print(f"Duplicated geometries: {len(dup_geoms)}")
-    
-    # Check for self-intersections in a sample
-    print("\nChecking for self-intersections in a sample of 100 geometries...")
-    sample_gdf = gdf.sample(min(100, len(gdf)))
-    self_intersections = 0
-    for geom in sample_gdf.geometry:
-        try:
-            if not geom.is_simple:
-                self_intersections += 1
-        except:
-            # Some complex geometries might error on is_simple
-            pass
-    print(f"Self-intersections detected: {self_intersections} out of 100 sampled")
-    
-    # Check for very small or zero-area geometries
-    small_area_threshold = 1e-10
-    small_areas = gdf[gdf.geometry.area < small_area_threshold]
-    print(f"Very small area geometries: {len(small_areas)}")
-    
-    # Check for overlapping geometries in a small sample
-    print("\nChecking for overlapping geometries in a sample...")
-    sample_size = min(50, len(gdf))
-    sample_gdf = gdf.sample(sample_size)
-    
-    overlaps = 0
-    for i in range(sample_size):
-        for j in range(i+1, sample_size):
-            geom1 = sample_gdf.iloc[i].geometry
-            geom2 = sample_gdf.iloc[j].geometry
-            try:
-                if geom1.intersects(geom2) and not geom1.touches(geom2):
-                    overlaps += 1
-                    if overlaps <= 5:  # Only show first 5 examples
-                        print(f"Overlap between features at indices {sample_gdf.index[i]} and {sample_gdf.index[j]}")
-            except:
-                # Skip if error in intersection check
-                pass
-    
-    print(f"Found {overlaps} overlapping geometries in the sample")
-    
-    # Extract a subset for AI analysis
-    print("\nExtracting a subset for AI analysis...")
-    
-    # If some invalid geometries found, include them in the subset
-    if invalid_geoms.any():
-        subset = gdf[invalid_geoms].head(10)
-        print("Including 10 invalid geometries in the subset")
-    else:
-        # Try to find interesting cases for topology analysis
-        # Look for features with the most complex geometries (many points)
-        gdf['point_count'] = gdf.geometry.apply(lambda g: sum(len(list(p.exterior.coords)) for p in g.geoms))
-        complex_geoms = gdf.sort_values('point_count', ascending=False).head(5)
-        
-        # Look for features that are nearby each other (potential topology issues)
-        sample_indices = gdf.sample(min(50, len(gdf))).index
-        nearby_candidates = []
-        
-        for i in sample_indices:
-            for j in sample_indices:
-                if i != j:
-                    try:
-                        if gdf.loc[i, 'geometry'].distance(gdf.loc[j, 'geometry']) < 0.0001:
-                            nearby_candidates.append((i, j))
-                    except:
-                        pass
-        
-        print(f"Found {len(nearby_candidates)} nearby geometry pairs")
-        
-        # Create a subset with complex geometries and some nearby features
-        subset_indices = list(complex_geoms.index)
-        for i, j in nearby_candidates[:5]:  # Take first 5 pairs
-            if i not in subset_indices:
-                subset_indices.append(i)
-            if j not in subset_indices:
-                subset_indices.append(j)
-        
-        subset = gdf.loc[subset_indices]
-        print(f"Created a subset with {len(subset)} features")
-    
-    # Save the subset to a file for AI analysis
-    subset_file = 'subset_for_ai.json'
-    subset_geojson = json.loads(subset.to_json())
-    with open(subset_file, 'w') as f:
-        json.dump(subset_geojson, f)
-    
-    print(f"Saved subset to {subset_file}")
-    
-    # Example potential topological questions for the AI
-    print("\nPotential topological questions for AI analysis:")
-    questions = [
-        "Can you identify any invalid geometries in this dataset and explain why they're invalid?",
-        "How would you fix self-intersecting polygons in this dataset?",
-        "What are the best practices for handling overlapping polygons in geospatial data?",
-        "Can you identify any polygons with holes that may cause topological issues?",
-        "How would you validate if a MultiPolygon has the correct orientation (exterior ring counter-clockwise, holes clockwise)?",
-        "What methods would you use to simplify complex geometries while preserving topology?",
-        "How would you detect and fix sliver polygons in this dataset?",
-        "What approaches would you recommend for fixing gaps between adjacent polygons?",
-        "How would you ensure topological consistency when merging adjacent polygons?",
-        "Can you identify any potential precision issues in the coordinates of these geometries?"
-    ]
-    
-    for i, q in enumerate(questions):
-        print(f"{i+1}. {q}")
-
-except Exception as e:
-    print(f"Error analyzing data: {e}") 
\ No newline at end of file
+# Features are read in chunks so the properties and the per-feature checks only need
+# memory for one chunk. The whole-dataset duplicate, overlap and nearby-pair checks
+# still keep every geometry (without properties) in memory
+chunk_size = 10000
+
+# Distinct values are counted exactly up to this many per column; above it the
+# count is reported as "at least" the limit, so id-like columns don't grow without bound
+unique_values_limit = 100000
+
+# Number of worker processes for the per-feature checks (None uses every core)
+workers = None
+
+# Features closer than this (in degrees) are reported as nearby pairs
+nearby_tolerance = 0.0001
+
+# Geometries within this Hausdorff distance (in degrees) of each other count as duplicates
+duplicate_tolerance = 1e-9
+
+# Polygon parts below both of these are slivers: Polsby-Popper compactness (4 pi area / perimeter^2)
+# and thinness (short side / long side of the minimum rotated rectangle)
+sliver_compactness = 0.1
+sliver_thinness = 0.1
+
+# Read features from the binary cache in GeometryCache/ (built on the first run and
+# rebuilt when the file changes) instead of parsing the GeoJSON text every time
+use_geometry_cache = True
+
+
+def rows_by_index(chunks, indices):
+    """Rows with the given global indices, collected from a stream of chunks (stops once all are found)"""
+    wanted = set(indices)
+    rows = {}
+    for chunk in chunks:
+        if len(rows) == len(wanted):
+            break
+        for idx in chunk.index.intersection(list(wanted)):
+            rows[idx] = chunk.loc[[idx]]
+    return rows
+
+
+def analyze_data(data_path):
+    """Run the data quality checks on a GeoJSON file and extract a subset for AI analysis"""
+    # Check if file exists
+    if not os.path.exists(data_path):
+        print(f"File not found: {data_path}")
+        exit(1)
+
+    # Load the data
+    print(f"Loading data from {data_path} in chunks of {chunk_size} features")
+    try:
+        total_features = 0
+        geometry_types = pd.Series(dtype='int64')
+        unique_values = {}
+        invalid_count = 0
+        invalid_examples = []
+        invalid_rows = []
+        empty_count = 0
+        small_area_count = 0
+        small_area_threshold = 1e-10
+        complex_heap = []
+        sliver_count = 0
+        sliver_heap = []
+        self_intersections = 0
+        overlap_geometries = []
+        columns = []
+
+        # Validity, simplicity and area are checked on a process pool, one chunk per task
+        read_chunks = cached_feature_chunks if use_geometry_cache else iter_feature_chunks
+        for chunk, checks in validate_chunks(read_chunks(data_path, chunk_size), workers, small_area_threshold,
+                                             sliver_compactness, sliver_thinness):
+            if total_features == 0:
+                print("\nGeoDataFrame chunks created successfully")
+                print(f"CRS: {chunk.crs}")
+            columns = columns + [c for c in chunk.columns if c not in columns]
+            geometry_types = geometry_types.add(chunk.geometry.type.value_counts(), fill_value=0)
+
+            # Property values are collected per column (up to the limit) to count unique values over all chunks
+            for col in chunk.columns:
+                if col != 'geometry':
+                    values = unique_values.setdefault(col, set())
+                    if len(values) < unique_values_limit:
+                        values.update(chunk[col].dropna().unique().tolist())
+
+            # Check for basic topology issues
+            invalid_geoms = ~checks['is_valid']
+            invalid_count += int(invalid_geoms.sum())
+            for idx, reason in checks.loc[invalid_geoms, 'validity_reason'].items():
+                if len(invalid_examples) < 5:
+                    invalid_examples.append((idx, reason))
+                if len(invalid_rows) < 10:
+                    invalid_rows.append(chunk.loc[[idx]])
+
+            # Check for empty geometries
+            empty_count += int(checks['is_empty'].sum())
+
+            # Check for self-intersections in every geometry
+            self_intersections += int((~checks['is_simple']).sum())
+
+            # Check for very small or zero-area geometries
+            small_area_count += int(checks['is_small'].sum())
+
+            # Keep the least compact slivers seen so far
+            slivers = checks[checks['is_sliver']]
+            sliver_count += len(slivers)
+            for idx, compactness in slivers['compactness'].items():
+                if len(sliver_heap) < 5:
+                    heapq.heappush(sliver_heap, (-compactness, idx, chunk.loc[[idx]]))
+                elif -compactness > sliver_heap[0][0]:
+                    heapq.heapreplace(sliver_heap, (-compactness, idx, chunk.loc[[idx]]))
+
+            # Keep the most complex geometries (many points) seen so far
+            # (exterior ring points for polygons, all points for lines and other geometry types)
+            rings, ring_feature, _, ring_number = polygon_rings(chunk.geometry.values)
+            exterior = ring_number == 0
+            point_counts = np.bincount(ring_feature[exterior], weights=shapely.get_num_coordinates(rings[exterior]),
+                                       minlength=len(chunk)).astype(int)
+            polygonal = np.isin(shapely.get_type_id(chunk.geometry.values), (3, 6))
+            point_counts = np.where(polygonal, point_counts, shapely.get_num_coordinates(chunk.geometry.values))
+            chunk['point_count'] = point_counts
+            for idx, count in zip(chunk.index, point_counts):
+                if len(complex_heap) < 5:
+                    heapq.heappush(complex_heap, (count, idx, chunk.loc[[idx]]))
+                elif count > complex_heap[0][0]:
+                    heapq.heapreplace(complex_heap, (count, idx, chunk.loc[[idx]]))
+
+            # Only the geometries are kept for the exhaustive duplicate, overlap and proximity checks, not the
+            # properties; this is the one part of the analysis whose memory grows with the dataset
+            overlap_geometries.append(chunk.geometry)
+            total_features += len(chunk)
+
+        print(f"Number of features: {total_features}")
+        print(f"Shape: ({total_features}, {len(columns)})")
+        print(f"Columns: {columns}")
+        print(f"Geometry types: {geometry_types.astype(int)}")
+
+        # Print property columns statistics
+        print("\nProperty statistics:")
+        for col in columns:
+            if col != 'geometry':
+                count = len(unique_values.get(col, ()))
+                if count >= unique_values_limit:
+                    print(f"{col}: at least {unique_values_limit} unique values")
+                else:
+                    print(f"{col}: {count} unique values")
+
+        print("\nChecking for basic topology issues...")
+        if invalid_count > 0:
+            print(f"Found {invalid_count} invalid geometries")
+
+            # Sample a few invalid geometries to understand the issues
+            for idx, reason in invalid_examples:
+                print(f"Invalid geometry at index {idx}: {reason}")
+        else:
+            print("All geometries are valid")
+
+        # Additional topological checks
+        print("\nAdditional topological properties:")
+        print(f"Empty geometries: {empty_count}")
+
+        # Duplicates are found over the whole dataset, including copies with another vertex order or tiny noise
+        all_geometries = pd.concat(overlap_geometries) if overlap_geometries else []
+        duplicates = find_duplicates(all_geometries, duplicate_tolerance)
+        match_counts = duplicates['match'].value_counts()
+        print(f"Duplicated geometries: {len(duplicates)} ({int(match_counts.get('exact', 0))} exact, "
+              f"{int(match_counts.get('normalized', 0))} with another vertex order, "
+              f"{int(match_counts.get('near', 0))} within {duplicate_tolerance})")
+        for row in duplicates.head(5).itertuples():
+            print(f"Geometry at index {row.index} duplicates index {row.duplicate_of} ({row.match})")
+
+        print("\nChecking for self-intersections in every geometry...")
+        print(f"Self-intersections detected: {self_intersections} out of {total_features} checked")
+        print(f"Very small area geometries: {small_area_count}")
+        print(f"Sliver polygons (compactness < {sliver_compactness}, thinness < {sliver_thinness}): {sliver_count}")
+        for compactness, idx, _ in sorted(sliver_heap, reverse=True):
+            print(f"Sliver at index {idx} (compactness {-compactness:.4f})")
+
+        # Check for overlapping geometries across the whole dataset using a spatial index
+        print("\nChecking for overlapping geometries...")
+        overlap_results = find_overlaps(all_geometries)
+        overlap_results = overlap_results[overlap_results['error'].isna()]
+        overlaps = len(overlap_results)
+        for row in overlap_results.head(5).itertuples():  # Only show first 5 examples
+            print(f"Overlap between features at indices {row.index_1} and {row.index_2} (area {row.intersection_area})")
+
+        print(f"Found {overlaps} overlapping geometry pairs")
+
+        # Look for features that are nearby each other (potential topology issues) across the whole dataset
+        print("\nChecking for nearby geometries...")
+        nearby_pairs = find_nearby_pairs(all_geometries, nearby_tolerance)
+        print(f"Found {len(nearby_pairs)} nearby geometry pairs (closer than {nearby_tolerance})")
+
+        # Extract a subset for AI analysis
+        print("\nExtracting a subset for AI analysis...")
+
+        # If some invalid geometries found, include them in the subset
+        if invalid_count > 0:
+            subset = pd.concat(invalid_rows)
+            print("Including 10 invalid geometries in the subset")
+        else:
+            # Try to find interesting cases for topology analysis
+            # Look for features with the most complex geometries (many points)
+            complex_geoms = pd.concat([row for _, _, row in complex_heap]).sort_values('point_count', ascending=False)
+
+            # Add the features of the 5 closest nearby pairs, read back from the file
+            nearby_candidates = list(zip(nearby_pairs['index_1'], nearby_pairs['index_2']))[:5]
+            nearby_rows = rows_by_index(read_chunks(data_path, chunk_size),
+                                        [idx for pair in nearby_candidates for idx in pair])
+
+            # Create a subset with complex geometries, the worst slivers and some nearby features
+            subset_rows = {idx: complex_geoms.loc[[idx]] for idx in complex_geoms.index}
+            for _, idx, row in sorted(sliver_heap, reverse=True):
+                subset_rows.setdefault(idx, row)
+            for i, j in nearby_candidates:
+                if i not in subset_rows:
+                    subset_rows[i] = nearby_rows[i]
+                if j not in subset_rows:
+                    subset_rows[j] = nearby_rows[j]
+
+            subset = pd.concat(subset_rows.values())
+            print(f"Created a subset with {len(subset)} features")
+
+        # Save the subset to a file for AI analysis
+        subset_file = 'subset_for_ai.json'
+        subset = gpd.GeoDataFrame(subset.drop(columns=['id']), geometry='geometry', crs=subset.crs)
+        subset_geojson = json.loads(subset.to_json())
+        with open(subset_file, 'w') as f:
+            json.dump(subset_geojson, f)
+
+        print(f"Saved subset to {subset_file}")
+
+        # Example potential topological questions for the AI
+        print("\nPotential topological questions for AI analysis:")
+        questions = [
+            "Can you identify any invalid geometries in this dataset and explain why they're invalid?",
+            "How would you fix self-intersecting polygons in this dataset?",
+            "What are the best practices for handling overlapping polygons in geospatial data?",
+            "Can you identify any polygons with holes that may cause topological issues?",
+            "How would you validate if a MultiPolygon has the correct orientation (exterior ring counter-clockwise, holes clockwise)?",
+            "What methods would you use to simplify complex geometries while preserving topology?",
+            "How would you detect and fix sliver polygons in this dataset?",
+            "What approaches would you recommend for fixing gaps between adjacent polygons?",
+            "How would you ensure topological consistency when merging adjacent polygons?",
+            "Can you identify any potential precision issues in the coordinates of these geometries?"
+        ]
+
+        for i, q in enumerate(questions):
+            print(f"{i+1}. {q}")
+
+    except Exception as e:
+        print(f"Error analyzing data: {e}")
+
+
+if __name__ == "__main__":
+    analyze_data(sys.argv[1] if len(sys.argv) > 1 else data_path)
@@ -1,196 +1,233 @@
-import json
-import geopandas as gpd
-from shapely.geometry import shape
-import shapely.ops
-import os
+import sys
 import pandas as pd
-import numpy as np
+from geojson_stream import iter_feature_chunks, FeatureCollectionWriter
+from geometry_cache import cached_feature_chunks
+from parallel_validate import validate_chunks
+from topology_checks import find_overlaps, vertex_precision_check, ring_orientation_check, orient_rings, rank_slivers
+from line_checks import line_checks, line_issues
 
-# Load the subset data
+# Load the subset data (any GeoJSON file or .zip archive can be passed instead)
 subset_file = 'subset_for_ai.json'
-with open(subset_file, 'r') as f:
-    geospatial_data = json.load(f)
-
-print(f"Analyzing {len(geospatial_data['features'])} features from the dataset...")
-print("=" * 50)
-
-# Convert to GeoDataFrame for analysis
-gdf = gpd.GeoDataFrame.from_features(geospatial_data['features'])
-print(f"Dataset contains {len(gdf)} features")
-print(f"CRS: {gdf.crs}")
-print(f"Geometry types: {gdf.geometry.type.value_counts()}")
-
-# Check for basic validity
-valid_geoms = gdf.is_valid
-print(f"\n1. VALIDITY CHECK:")
-print(f"   - Valid geometries: {valid_geoms.sum()} out of {len(gdf)}")
-print(f"   - Invalid geometries: {(~valid_geoms).sum()} out of {len(gdf)}")
-
-# If any invalid geometries, analyze them in more detail
-if (~valid_geoms).any():
-    invalid_indices = gdf[~valid_geoms].index.tolist()
-    print("   - Invalid geometries at indices:", invalid_indices)
-    for idx in invalid_indices:
-        geom = gdf.loc[idx, 'geometry']
-        try:
-            reason = shapely.validation.explain_validity(geom)
-            print(f"   - Issue at index {idx}: {reason}")
-        except:
-            print(f"   - Issue at index {idx}: (Could not determine specific reason)")
-
-# Check for self-intersections in all geometries
-print("\n2. SELF-INTERSECTION CHECK:")
-self_intersections = 0
-for idx, geom in enumerate(gdf.geometry):
-    try:
-        # Check if the geometry is simple (no self-intersections)
-        if not geom.is_simple:
+
+# Set to a file name to also write the features with corrected ring orientation
+reoriented_file = None
+
+ORIENTATION_NAMES = {'cw': 'clockwise', 'ccw': 'counter-clockwise'}
+
+# Features are read in chunks so the properties and the per-feature checks only need
+# memory for one chunk. The whole-dataset overlap check still keeps every geometry
+# (without properties) in memory
+chunk_size = 10000
+
+# Number of worker processes for the per-feature checks (None uses every core)
+workers = None
+
+# Read features from the binary cache in GeometryCache/ (built on the first run and
+# rebuilt when the file changes) instead of parsing the GeoJSON text every time
+use_geometry_cache = True
+
+def analyze_topology(subset_file):
+    """Run the topology checks on every feature of a GeoJSON file"""
+    print(f"Analyzing features from {subset_file} in chunks of {chunk_size}...")
+    print("=" * 50)
+
+    total_features = 0
+    crs = None
+    geometry_types = pd.Series(dtype='int64')
+    invalid_indices = []
+    invalid_messages = []
+    self_intersections = 0
+    self_intersection_messages = []
+    orientation_issues = 0
+    orientation_messages = []
+    precision_messages = []
+    close_vertices_threshold = 1e-8  # Threshold for "too close" vertices
+    close_vertices_count = 0
+    duplicate_vertices = 0
+    small_area_threshold = 1e-10
+    small_area_count = 0
+    small_area_messages = []
+    sliver_compactness = 0.1  # Polsby-Popper compactness below which a thin part is a sliver
+    sliver_thinness = 0.1  # Minimum rotated rectangle short side / long side
+    sliver_results = []
+    overlap_geometries = []
+    decimal_places = []
+    decimal_geoms_checked = 0
+    line_results = []
+
+    reoriented_writer = FeatureCollectionWriter(reoriented_file) if reoriented_file else None
+
+    # Validity, simplicity and area are checked on a process pool, one chunk per task
+    read_chunks = cached_feature_chunks if use_geometry_cache else iter_feature_chunks
+    for gdf, checks in validate_chunks(read_chunks(subset_file, chunk_size), workers, small_area_threshold,
+                                        sliver_compactness, sliver_thinness):
+        if total_features == 0:
+            crs = gdf.crs
+        geometry_types = geometry_types.add(gdf.geometry.type.value_counts(), fill_value=0)
+
+        # Check for basic validity, analysing any invalid geometries in more detail
+        invalid = checks[~checks['is_valid']]
+        invalid_indices.extend(invalid.index.tolist())
+        for idx, reason in invalid['validity_reason'].items():
+            invalid_messages.append(f"   - Issue at index {idx}: {reason}")
+
+        # Check for self-intersections in all geometries
+        for idx in checks.index[~checks['is_simple']]:
             self_intersections += 1
-            print(f"   - Self-intersection found at index {idx}")
-    except Exception as e:
-        print(f"   - Could not check self-intersection at index {idx}: {e}")
-
-print(f"   - Self-intersections found: {self_intersections} out of {len(gdf)}")
-
-# Check for ring orientation (exterior should be clockwise, holes counter-clockwise)
-print("\n3. RING ORIENTATION CHECK:")
-orientation_issues = 0
-for idx, geom in enumerate(gdf.geometry):
-    try:
-        # Multi-part geometries need to be checked part by part
-        if geom.geom_type == 'MultiPolygon':
-            for i, part in enumerate(geom.geoms):
-                # Check exterior ring
-                if part.exterior.is_ccw:  # Counter-clockwise exterior (should be clockwise)
-                    orientation_issues += 1
-                    print(f"   - Incorrect orientation at index {idx} (part {i}): exterior ring is counter-clockwise")
-                # Check any interior rings (holes)
-                for j, interior in enumerate(part.interiors):
-                    if not interior.is_ccw:  # Clockwise interior (should be counter-clockwise)
-                        orientation_issues += 1
-                        print(f"   - Incorrect orientation at index {idx} (part {i}, hole {j}): interior ring is clockwise")
-        elif geom.geom_type == 'Polygon':
-            # Check exterior ring
-            if geom.exterior.is_ccw:  # Counter-clockwise exterior (should be clockwise)
-                orientation_issues += 1
-                print(f"   - Incorrect orientation at index {idx}: exterior ring is counter-clockwise")
-            # Check any interior rings (holes)
-            for j, interior in enumerate(geom.interiors):
-                if not interior.is_ccw:  # Clockwise interior (should be counter-clockwise)
-                    orientation_issues += 1
-                    print(f"   - Incorrect orientation at index {idx} (hole {j}): interior ring is clockwise")
-    except Exception as e:
-        print(f"   - Could not check ring orientation at index {idx}: {e}")
-
-print(f"   - Orientation issues found: {orientation_issues}")
-
-# Check for precision issues
-print("\n4. PRECISION ISSUES CHECK:")
-# Count very close vertices (potential precision issues)
-close_vertices_threshold = 1e-8  # Threshold for "too close" vertices
-close_vertices_count = 0
-duplicate_vertices = 0
-
-for idx, geom in enumerate(gdf.geometry):
-    try:
-        if geom.geom_type == 'MultiPolygon':
-            for i, part in enumerate(geom.geoms):
-                coords = list(part.exterior.coords)
-                # Check for consecutive vertices that are very close
-                for j in range(len(coords) - 1):
-                    if j+1 < len(coords):
-                        dist = np.sqrt((coords[j][0] - coords[j+1][0])**2 + (coords[j][1] - coords[j+1][1])**2)
-                        if dist < close_vertices_threshold and dist > 0:
-                            close_vertices_count += 1
-                        if dist == 0:
-                            duplicate_vertices += 1
-        elif geom.geom_type == 'Polygon':
-            coords = list(geom.exterior.coords)
-            # Check for consecutive vertices that are very close
-            for j in range(len(coords) - 1):
-                if j+1 < len(coords):
-                    dist = np.sqrt((coords[j][0] - coords[j+1][0])**2 + (coords[j][1] - coords[j+1][1])**2)
-                    if dist < close_vertices_threshold and dist > 0:
-                        close_vertices_count += 1
-                    if dist == 0:
-                        duplicate_vertices += 1
-    except Exception as e:
-        print(f"   - Could not check precision issues at index {idx}: {e}")
-
-print(f"   - Very close vertices found: {close_vertices_count}")
-print(f"   - Duplicate consecutive vertices found: {duplicate_vertices}")
-
-# Check for very small geometries (potentially causing precision issues)
-print("\n5. VERY SMALL GEOMETRIES CHECK:")
-areas = gdf.geometry.area
-small_area_threshold = 1e-10
-small_areas = areas[areas < small_area_threshold]
-print(f"   - Very small geometries (area < {small_area_threshold}): {len(small_areas)}")
-if len(small_areas) > 0:
-    for idx in small_areas.index:
-        print(f"   - Small geometry at index {idx}, area: {areas[idx]}")
-
-# Check for overlapping geometries (topology errors)
-print("\n6. OVERLAPPING GEOMETRIES CHECK:")
-overlaps = 0
-# For efficiency, only check a subset of geometries for overlap
-sample_size = min(20, len(gdf))
-sample_indices = np.random.choice(gdf.index, sample_size, replace=False)
-sample_gdf = gdf.loc[sample_indices]
-
-for i in range(sample_size):
-    for j in range(i+1, sample_size):
-        idx1 = sample_indices[i]
-        idx2 = sample_indices[j]
-        geom1 = sample_gdf.iloc[i].geometry
-        geom2 = sample_gdf.iloc[j].geometry
-        try:
-            if geom1.intersects(geom2) and not geom1.touches(geom2):
-                # Check if the overlap is significant (not just a boundary touch)
-                intersection = geom1.intersection(geom2)
-                if intersection.area > 0:
-                    overlaps += 1
-                    print(f"   - Overlap between features at indices {idx1} and {idx2}")
-                    print(f"     Intersection area: {intersection.area}")
-        except Exception as e:
-            print(f"   - Could not check overlap between indices {idx1} and {idx2}: {e}")
-
-print(f"   - Overlapping geometries found in sample: {overlaps} out of {sample_size*(sample_size-1)//2} pairs checked")
-
-# Check for coordinate precision issues
-print("\n7. COORDINATE PRECISION CHECK:")
-# Count the number of decimal places in coordinates
-decimal_places = []
-for idx, geom in enumerate(gdf.geometry.head(5)):  # Check first 5 geometries for efficiency
-    if geom.geom_type == 'MultiPolygon':
-        coords = list(geom.geoms[0].exterior.coords)
-    elif geom.geom_type == 'Polygon':
-        coords = list(geom.exterior.coords)
-    else:
-        continue
-    
-    # Check first few coordinates
-    for i, coord in enumerate(coords[:5]):
-        for val in coord:
-            str_val = str(val)
-            if '.' in str_val:
-                decimal_count = len(str_val.split('.')[1])
-                decimal_places.append(decimal_count)
-
-if decimal_places:
-    avg_decimals = sum(decimal_places) / len(decimal_places)
-    print(f"   - Average decimal places in coordinates: {avg_decimals:.2f}")
-    print(f"   - Maximum decimal places in coordinates: {max(decimal_places)}")
-    if max(decimal_places) > 10:
-        print("   - WARNING: High coordinate precision may cause computation issues")
-
-print("\n" + "=" * 50)
-print("SUMMARY OF TOPOLOGICAL ISSUES:")
-print(f"1. Invalid geometries: {(~valid_geoms).sum()}")
-print(f"2. Self-intersections: {self_intersections}")
-print(f"3. Ring orientation issues: {orientation_issues}")
-print(f"4. Very close vertices: {close_vertices_count}")
-print(f"5. Duplicate vertices: {duplicate_vertices}")
-print(f"6. Very small geometries: {len(small_areas)}")
-print(f"7. Overlapping geometries in sample: {overlaps}")
-print("=" * 50) 
\ No newline at end of file
+            self_intersection_messages.append(f"   - Self-intersection found at index {idx}")
+
+        # Check for ring orientation (exterior should be clockwise, holes counter-clockwise)
+        rings = ring_orientation_check(gdf.geometry, exterior='cw')
+        wrong = rings[rings['expected'] != rings['actual']]
+        orientation_issues += len(wrong)
+        for row in wrong.itertuples():
+            if row.ring == 0:
+                orientation_messages.append(f"   - Incorrect orientation at index {row.index} (part {row.part}): exterior ring is {ORIENTATION_NAMES[row.actual]}")
+            else:
+                orientation_messages.append(f"   - Incorrect orientation at index {row.index} (part {row.part}, hole {row.ring - 1}): interior ring is {ORIENTATION_NAMES[row.actual]}")
+
+        # Optionally write the features back out with every ring correctly oriented
+        if reoriented_writer is not None:
+            gdf['geometry'] = orient_rings(gdf.geometry, exterior='cw')
+            reoriented_writer.write_geodataframe(gdf)
+
+        # Count very close and duplicate consecutive vertices in every ring, holes included
+        precision = vertex_precision_check(gdf.geometry, close_vertices_threshold)
+        close_vertices_count += int(precision['close_vertices'].sum())
+        duplicate_vertices += int(precision['duplicate_vertices'].sum())
+        for idx, row in precision[(precision['close_vertices'] > 0) | (precision['duplicate_vertices'] > 0)].iterrows():
+            precision_messages.append(f"   - Precision issues at index {idx}: {int(row['duplicate_vertices'])} duplicate, "
+                                      f"{int(row['close_vertices'])} very close vertices")
+
+        # Check for very small geometries (potentially causing precision issues)
+        areas = checks['area']
+        small_areas = areas[checks['is_small']]
+        small_area_count += len(small_areas)
+        for idx in small_areas.index:
+            small_area_messages.append(f"   - Small geometry at index {idx}, area: {areas[idx]}")
+
+        # Slivers (long, thin polygon parts) are ranked over the whole dataset at the end
+        sliver_results.append(checks.loc[checks['is_sliver'], ['compactness', 'thinness', 'is_sliver']])
+
+        # Lines get their own checks (zero-length segments, repeated vertices, self-overlaps, degenerate parts)
+        lines = line_checks(gdf.geometry, close_vertices_threshold)
+        if len(lines):
+            line_results.append(lines)
+
+        # Only the geometries are kept for the exhaustive overlap check, not the properties;
+        # this is the one part of the analysis whose memory grows with the dataset
+        overlap_geometries.append(gdf.geometry)
+        total_features += len(gdf)
+
+        # Count the number of decimal places in coordinates
+        for idx, geom in gdf.geometry.items():
+            if decimal_geoms_checked >= 5:  # Check first 5 geometries for efficiency
+                break
+            decimal_geoms_checked += 1
+            if geom.geom_type == 'MultiPolygon':
+                coords = list(geom.geoms[0].exterior.coords)
+            elif geom.geom_type == 'Polygon':
+                coords = list(geom.exterior.coords)
+            else:
+                continue
+
+            # Check first few coordinates
+            for i, coord in enumerate(coords[:5]):
+                for val in coord:
+                    str_val = str(val)
+                    if '.' in str_val:
+                        decimal_count = len(str_val.split('.')[1])
+                        decimal_places.append(decimal_count)
+
+    if reoriented_writer is not None:
+        reoriented_writer.close()
+        print(f"Wrote {reoriented_writer.count} re-oriented features to {reoriented_file}")
+
+    print(f"Dataset contains {total_features} features")
+    print(f"CRS: {crs}")
+    print(f"Geometry types: {geometry_types.astype(int)}")
+
+    invalid_count = len(invalid_indices)
+    print(f"\n1. VALIDITY CHECK:")
+    print(f"   - Valid geometries: {total_features - invalid_count} out of {total_features}")
+    print(f"   - Invalid geometries: {invalid_count} out of {total_features}")
+    if invalid_messages:
+        print("   - Invalid geometries at indices:", invalid_indices)
+        for message in invalid_messages:
+            print(message)
+
+    print("\n2. SELF-INTERSECTION CHECK:")
+    for message in self_intersection_messages:
+        print(message)
+    print(f"   - Self-intersections found: {self_intersections} out of {total_features}")
+
+    print("\n3. RING ORIENTATION CHECK:")
+    for message in orientation_messages:
+        print(message)
+    print(f"   - Orientation issues found: {orientation_issues}")
+
+    print("\n4. PRECISION ISSUES CHECK:")
+    for message in precision_messages:
+        print(message)
+    print(f"   - Very close vertices found: {close_vertices_count}")
+    print(f"   - Duplicate consecutive vertices found: {duplicate_vertices}")
+
+    print("\n5. VERY SMALL GEOMETRIES CHECK:")
+    print(f"   - Very small geometries (area < {small_area_threshold}): {small_area_count}")
+    for message in small_area_messages:
+        print(message)
+
+    slivers = rank_slivers(pd.concat(sliver_results)) if sliver_results else pd.DataFrame()
+    print(f"\n   Sliver polygons (compactness < {sliver_compactness}, thinness < {sliver_thinness}): {len(slivers)}")
+    for idx, row in slivers.head(10).iterrows():
+        print(f"   - Sliver at index {idx}: compactness {row['compactness']:.4f}, thinness {row['thinness']:.4f}")
+
+    # Check for overlapping geometries (topology errors)
+    print("\n6. OVERLAPPING GEOMETRIES CHECK:")
+    # Every pair in the dataset is checked, using a spatial index to find candidate pairs
+    overlap_results = find_overlaps(pd.concat(overlap_geometries) if overlap_geometries else [])
+    overlaps = 0
+    for row in overlap_results.itertuples():
+        if row.error is not None:
+            print(f"   - Could not check overlap between indices {row.index_1} and {row.index_2}: {row.error}")
+            continue
+        overlaps += 1
+        print(f"   - Overlap between features at indices {row.index_1} and {row.index_2}")
+        print(f"     Intersection area: {row.intersection_area}")
+
+    print(f"   - Overlapping geometries found: {overlaps} across all {total_features} features")
+
+    print("\n7. COORDINATE PRECISION CHECK:")
+    if decimal_places:
+        avg_decimals = sum(decimal_places) / len(decimal_places)
+        print(f"   - Average decimal places in coordinates: {avg_decimals:.2f}")
+        print(f"   - Maximum decimal places in coordinates: {max(decimal_places)}")
+        if max(decimal_places) > 10:
+            print("   - WARNING: High coordinate precision may cause computation issues")
+
+    if line_results:
+        lines = pd.concat(line_results)
+        flagged = lines[line_issues(lines)]
+        print(f"\n8. LINE GEOMETRY CHECK ({len(lines)} line features):")
+        for idx, row in flagged.iterrows():
+            print(f"   - Line issues at index {idx}: {row['zero_length_segments']} zero-length segments, "
+                  f"{row['repeated_vertices']} repeated vertices, {row['self_overlaps']} self-overlaps, "
+                  f"{row['degenerate_parts']} degenerate parts{'' if row['is_simple'] else ', not simple'}")
+        print(f"   - Lines with issues: {len(flagged)} out of {len(lines)}")
+
+    print("\n" + "=" * 50)
+    print("SUMMARY OF TOPOLOGICAL ISSUES:")
+    print(f"1. Invalid geometries: {invalid_count}")
+    print(f"2. Self-intersections: {self_intersections}")
+    print(f"3. Ring orientation issues: {orientation_issues}")
+    print(f"4. Very close vertices: {close_vertices_count}")
+    print(f"5. Duplicate vertices: {duplicate_vertices}")
+    print(f"6. Very small geometries: {small_area_count} (slivers: {len(slivers)})")
+    print(f"7. Overlapping geometries: {overlaps}")
+    if line_results:
+        print(f"8. Lines with issues: {len(flagged)}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    analyze_topology(sys.argv[1] if len(sys.argv) > 1 else subset_file)
@@ -0,0 +1,335 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+from geojson_stream import iter_features
+from topology_checks import find_overlaps, vertex_precision_check, ring_orientation_check
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# The scalar (original per-feature loop) versions are skipped above this size
+SCALAR_MAX_FEATURES = 100000
+
+# Features generated per block (bounds the temporary coordinate arrays of generate_dataset)
+GENERATE_BLOCK_SIZE = 50000
+
+# The per-feature checks run over blocks of this many features, as the analysis scripts read them
+# in chunks; the checks over the whole dataset (overlaps and the samples) always see every feature
+CHECK_CHUNK_SIZE = 100000
+WHOLE_DATASET_CHECKS = {'overlaps_sample_20', 'overlaps', 'coordinate_precision'}
+
+# analyze_data.py end to end (which writes the dataset to GeoJSON first) is skipped above this size
+PIPELINE_MAX_FEATURES = 100000
+
+
+def generate_dataset(n_features, seed=0, vertices=32, max_parts=3, centers=None):
+    """
+    Generate a GeoSeries of random star-shaped MultiPolygons with numpy only.
+    Features are placed at random positions, or at the given centers (for
+    example points from the Lines/transport extract) when provided.
+    """
+    rng = np.random.default_rng(seed)
+    if centers is None:
+        side = np.sqrt(n_features) * 0.01
+        centers = rng.uniform(0, side, (n_features, 2))
+    else:
+        centers = np.asarray(centers)[rng.integers(0, len(centers), n_features)]
+
+    # One polygon per part; a feature has 1..max_parts parts placed next to each other
+    parts_per_feature = rng.integers(1, max_parts + 1, n_features)
+    part_feature = np.repeat(np.arange(n_features), parts_per_feature)
+    n_parts = len(part_feature)
+    offset = np.arange(n_parts) - np.searchsorted(part_feature, part_feature)
+    part_centers = centers[part_feature] + np.column_stack([offset * 0.006, np.zeros(n_parts)])
+
+    angles = rng.uniform(0, 2 * np.pi, (n_parts, vertices))
+    angles.sort(axis=1)
+    radius = rng.random((n_parts, vertices))
+    radius *= 0.4
+    radius += 0.6
+    radius *= 0.002
+
+    # The rings are built block by block of features, so only the finished
+    # geometries of the whole dataset are held in memory at once
+    multipolygons = np.empty(n_features, dtype=object)
+    part_start = np.concatenate([[0], np.cumsum(parts_per_feature)])
+    for start in range(0, n_features, GENERATE_BLOCK_SIZE):
+        stop = min(start + GENERATE_BLOCK_SIZE, n_features)
+        parts = slice(part_start[start], part_start[stop])
+        # Clockwise exteriors, closed rings
+        ring = np.empty((parts.stop - parts.start, vertices + 1, 2))
+        ring[:, :vertices, 0] = (part_centers[parts, :1] + radius[parts] * np.cos(angles[parts]))[:, ::-1]
+        ring[:, :vertices, 1] = (part_centers[parts, 1:] + radius[parts] * np.sin(angles[parts]))[:, ::-1]
+        ring[:, vertices] = ring[:, 0]
+        multipolygons[start:stop] = shapely.multipolygons(shapely.polygons(ring),
+                                                          indices=part_feature[parts] - start)
+    return gpd.GeoSeries(multipolygons, crs="EPSG:4326")
+
+
+def transport_centers(path):
+    """Load the point coordinates of the Lines/transport extract (a .json file or Lines.zip)"""
+    coords = []
+    for feature in iter_features(path):
+        geometry = feature.get('geometry') or {}
+        coords.extend(shapely.get_coordinates(shapely.geometry.shape(geometry)).tolist() if geometry else [])
+    return np.array(coords)
+
+
+# Scalar implementations, as the checks were originally written in analyze_topology.py
+
+def scalar_validity(gdf):
+    return int((~gdf.is_valid).sum())
+
+
+def scalar_self_intersections(gdf):
+    count = 0
+    for geom in gdf.geometry:
+        if not geom.is_simple:
+            count += 1
+    return count
+
+
+def scalar_orientation(gdf):
+    issues = 0
+    for geom in gdf.geometry:
+        for part in geom.geoms:
+            if part.exterior.is_ccw:
+                issues += 1
+            for interior in part.interiors:
+                if not interior.is_ccw:
+                    issues += 1
+    return issues
+
+
+def scalar_precision(gdf, threshold=1e-8):
+    close, duplicate = 0, 0
+    for geom in gdf.geometry:
+        for part in geom.geoms:
+            coords = list(part.exterior.coords)
+            for j in range(len(coords) - 1):
+                dist = np.sqrt((coords[j][0] - coords[j+1][0])**2 + (coords[j][1] - coords[j+1][1])**2)
+                if 0 < dist < threshold:
+                    close += 1
+                if dist == 0:
+                    duplicate += 1
+    return close, duplicate
+
+
+def scalar_small_areas(gdf, threshold=1e-10):
+    with warnings.catch_warnings():
+        # The original check measures areas in degrees on purpose
+        warnings.filterwarnings('ignore', 'Geometry is in a geographic CRS')
+        return int((gdf.geometry.area < threshold).sum())
+
+
+def overlap_sample(gdf, sample_size=20):
+    """The random sample of features the original overlap check compares"""
+    return gdf.geometry.sample(min(sample_size, len(gdf)), random_state=0)
+
+
+def scalar_overlaps(gdf, sample_size=20):
+    # The original check only compares a random sample of 20 features
+    sample = overlap_sample(gdf, sample_size).tolist()
+    overlaps = 0
+    for i in range(len(sample)):
+        for j in range(i + 1, len(sample)):
+            if sample[i].intersects(sample[j]) and not sample[i].touches(sample[j]):
+                if sample[i].intersection(sample[j]).area > 0:
+                    overlaps += 1
+    return overlaps
+
+
+def coordinate_precision(gdf):
+    decimal_places = []
+    for geom in gdf.geometry.head(5):
+        for coord in list(geom.geoms[0].exterior.coords)[:5]:
+            for val in coord:
+                str_val = str(val)
+                if '.' in str_val:
+                    decimal_places.append(len(str_val.split('.')[1]))
+    return max(decimal_places) if decimal_places else 0
+
+
+# Current (vectorised) implementations
+
+def vectorized_validity(gdf):
+    return int((~shapely.is_valid(gdf.geometry.values)).sum())
+
+
+def vectorized_self_intersections(gdf):
+    return int((~shapely.is_simple(gdf.geometry.values)).sum())
+
+
+def vectorized_orientation(gdf):
+    rings = ring_orientation_check(gdf.geometry, exterior='cw')
+    return int((rings['expected'] != rings['actual']).sum())
+
+
+def vectorized_precision(gdf, threshold=1e-8):
+    result = vertex_precision_check(gdf.geometry, threshold)
+    return int(result['close_vertices'].sum()), int(result['duplicate_vertices'].sum())
+
+
+def vectorized_small_areas(gdf, threshold=1e-10):
+    return int((shapely.area(gdf.geometry.values) < threshold).sum())
+
+
+def vectorized_overlaps(gdf):
+    return len(find_overlaps(gdf.geometry))
+
+
+def vectorized_sample_overlaps(gdf, sample_size=20):
+    # The current check on the original sample, so both implementations see the same input
+    return len(find_overlaps(overlap_sample(gdf, sample_size)))
+
+
+def analyze_data_pipeline(gdf):
+    """Run analyze_data.py end to end on the dataset written to a temporary GeoJSON file"""
+    import analyze_data
+
+    # Parse the GeoJSON every time, as the recorded baseline does
+    analyze_data.use_geometry_cache = False
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'dataset.json')
+        gdf.to_file(path, driver='GeoJSON')
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                analyze_data.analyze_data(path)
+        finally:
+            os.chdir(cwd)
+
+
+# The original overlap check only compares a sample of 20 features, so it is timed against the
+# current check on that same sample ('overlaps_sample_20'); the exhaustive current check over every
+# feature ('overlaps') has no scalar counterpart
+CHECKS = [
+    ('validity', scalar_validity, vectorized_validity),
+    ('self_intersection', scalar_self_intersections, vectorized_self_intersections),
+    ('ring_orientation', scalar_orientation, vectorized_orientation),
+    ('precision', scalar_precision, vectorized_precision),
+    ('small_area', scalar_small_areas, vectorized_small_areas),
+    ('overlaps_sample_20', scalar_overlaps, vectorized_sample_overlaps),
+    ('overlaps', None, vectorized_overlaps),
+    ('coordinate_precision', coordinate_precision, coordinate_precision),
+]
+
+
+def in_chunks(function, gdf, chunk_size=CHECK_CHUNK_SIZE):
+    """Run a per-feature check over consecutive blocks of features"""
+    for start in range(0, len(gdf), chunk_size):
+        function(gdf.iloc[start:start + chunk_size])
+
+
+def measure(function, *args):
+    """
+    Time one call, then call it again under tracemalloc to record the peak
+    memory allocated through Python (numpy arrays included, GEOS internals
+    not). Tracing slows Python loops down, so it is kept out of the timing.
+    """
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def run_benchmarks(sizes, implementations=('scalar', 'vectorized'), seed=0, centers=None,
+                   include_pipeline=False, scalar_max_features=SCALAR_MAX_FEATURES,
+                   pipeline_max_features=PIPELINE_MAX_FEATURES):
+    records = []
+    for n in sizes:
+        gdf = gpd.GeoDataFrame(geometry=generate_dataset(n, seed, centers=centers))
+        print(f"\nDataset with {n} features ({shapely.get_num_coordinates(gdf.geometry.values).sum()} vertices)")
+        for name, scalar, vectorized in CHECKS:
+            for implementation in implementations:
+                function = scalar if implementation == 'scalar' else vectorized
+                if function is None or (implementation == 'scalar' and n > scalar_max_features):
+                    continue
+                if name in WHOLE_DATASET_CHECKS:
+                    seconds, peak_mb = measure(function, gdf)
+                else:
+                    seconds, peak_mb = measure(in_chunks, function, gdf)
+                records.append({'check': name, 'implementation': implementation, 'n_features': n,
+                                'seconds': round(seconds, 6), 'peak_memory_mb': round(peak_mb, 3)})
+                print(f"   - {name:<22} {implementation:<11} {seconds:10.4f} s {peak_mb:10.1f} MB")
+        if include_pipeline and n <= pipeline_max_features:
+            seconds, peak_mb = measure(analyze_data_pipeline, gdf)
+            records.append({'check': 'analyze_data_pipeline', 'implementation': 'current', 'n_features': n,
+                            'seconds': round(seconds, 6), 'peak_memory_mb': round(peak_mb, 3)})
+            print(f"   - {'analyze_data_pipeline':<22} {'current':<11} {seconds:10.4f} s {peak_mb:10.1f} MB")
+    return records
+
+
+def write_results(records, output_file, seed):
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seed,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'shapely': shapely.__version__,
+            'geopandas': gpd.__version__,
+            'pandas': pd.__version__,
+        },
+        'results': records,
+    }
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def compare(results_file, baseline_file, threshold=1.5):
+    """Print the checks that got slower than threshold times the baseline"""
+    with open(results_file) as f:
+        current = pd.DataFrame(json.load(f)['results'])
+    with open(baseline_file) as f:
+        baseline = pd.DataFrame(json.load(f)['results'])
+    merged = current.merge(baseline, on=['check', 'implementation', 'n_features'], suffixes=('', '_baseline'))
+    merged['ratio'] = merged['seconds'] / merged['seconds_baseline']
+    regressions = merged[merged['ratio'] > threshold]
+    for row in regressions.itertuples():
+        print(f"REGRESSION: {row.check} ({row.implementation}, {row.n_features} features): "
+              f"{row.seconds_baseline:.4f} s -> {row.seconds:.4f} s ({row.ratio:.1f}x)")
+    if regressions.empty:
+        print(f"No regressions above {threshold}x compared to {baseline_file}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the topology checks across dataset sizes")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--implementations', nargs='+', default=['scalar', 'vectorized'])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--transport', help="Place features at the points of the Lines/transport extract (.json or Lines.zip)")
+    parser.add_argument('--pipeline', action='store_true', help="Also time analyze_data.py end to end")
+    parser.add_argument('--output', default='Benchmarks/results.json')
+    parser.add_argument('--baseline', help="Baseline results file to compare against")
+    args = parser.parse_args()
+
+    centers = transport_centers(args.transport) if args.transport else None
+    records = run_benchmarks(args.sizes, args.implementations, args.seed, centers, args.pipeline)
+    write_results(records, args.output, args.seed)
+    print(f"\nResults saved to {args.output}")
+
+    if args.baseline:
+        compare(args.output, args.baseline)
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from shapely import STRtree
+
+from geojson_stream import FeatureCollectionWriter
+from geometry_cache import open_cache, CACHE_DIR
+from topology_checks import polygon_rings
+
+# Gaps narrower than this (in degrees, about 1 m) between neighbouring polygons are errors
+GAP_WIDTH = 1e-5
+
+# Side of the square tiles the dataset is processed in (in degrees)
+TILE_SIZE = 0.1
+
+
+def feature_bounds(cache, chunk_size=10000):
+    """Bounding box of every feature of a GeometryCache, read chunk by chunk"""
+    bounds = [shapely.bounds(cache.geometries(start, start + chunk_size))
+              for start in range(0, len(cache), chunk_size)]
+    return np.concatenate(bounds) if bounds else np.empty((0, 4))
+
+
+def iter_tiles(bounds, tile_size=TILE_SIZE):
+    """
+    Split features into square tiles by the centre of their bounding box, so
+    every feature belongs to exactly one tile. Yields (tile box, positions of
+    the features of the tile). Missing and empty geometries are left out.
+    """
+    present = np.isfinite(bounds).all(axis=1)
+    positions = np.flatnonzero(present)
+    if len(positions) == 0:
+        return
+    centres = (bounds[positions, :2] + bounds[positions, 2:]) / 2
+    origin = centres.min(axis=0)
+    cells = np.floor((centres - origin) / tile_size).astype(np.int64)
+    keys = cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    keys, positions, cells = keys[order], positions[order], cells[order]
+    runs = np.flatnonzero(np.diff(keys)) + 1
+    for tile_positions, tile_cells in zip(np.split(positions, runs), np.split(cells, runs)):
+        x, y = origin + tile_cells[0] * tile_size
+        yield (x, y, x + tile_size, y + tile_size), tile_positions
+
+
+def coverage_errors(geoms, owned, tile, gap_width=GAP_WIDTH):
+    """
+    Coverage errors among one tile's features and their neighbours.
+
+    geoms are the tile's features plus every feature close enough to share
+    an edge with them; owned marks the tile's own features, and only their
+    errors are reported, so tiles never report the same error twice.
+
+    - Invalid edges come from shapely.coverage_invalid_edges: edges that do
+      not match the neighbouring edge exactly (different vertices, overlaps)
+      or that face a neighbour across a gap narrower than gap_width.
+    - Gaps are holes of the union of the polygons that are bounded by at
+      least two different features (a courtyard inside one feature is not a
+      gap) and that vanish when shrunk by gap_width / 2, i.e. are narrower
+      than gap_width. A gap is reported by the tile holding its centre.
+
+    Invalid polygons are left out, since coverage rules are only defined
+    for valid ones. Returns (edges, gaps): DataFrames with the positions of
+    the offending features (within geoms) and the offending geometries.
+    """
+    polygonal = np.isin(shapely.get_type_id(geoms), (3, 6)) & shapely.is_valid(geoms)
+    positions = np.flatnonzero(polygonal)
+    polygons = geoms[positions]
+
+    invalid = shapely.coverage_invalid_edges(polygons, gap_width=gap_width)
+    bad = ~shapely.is_missing(invalid) & ~shapely.is_empty(invalid) & owned[positions]
+    edges = pd.DataFrame({
+        'position': positions[bad],
+        'geometry': invalid[bad],
+        'length': shapely.length(invalid[bad]),
+    })
+
+    union = shapely.union_all(polygons)
+    rings, _, _, ring_number = polygon_rings(np.array([union], dtype=object))
+    holes = shapely.polygons(rings[ring_number > 0])
+    narrow = shapely.is_empty(shapely.buffer(holes, -gap_width / 2))
+    holes = holes[narrow]
+
+    # A gap is bounded by at least two features (sharing more than a corner with it)
+    hole, feature = STRtree(polygons).query(holes, predicate='intersects')
+    shared = shapely.length(shapely.intersection(shapely.boundary(holes[hole]), polygons[feature])) > 0
+    hole, feature = hole[shared], feature[shared]
+    bounding = np.bincount(hole, minlength=len(holes))
+    centres = shapely.get_coordinates(shapely.point_on_surface(holes))
+    inside = ((centres[:, 0] >= tile[0]) & (centres[:, 0] < tile[2])
+              & (centres[:, 1] >= tile[1]) & (centres[:, 1] < tile[3])) if len(holes) else np.zeros(0, dtype=bool)
+    keep = (bounding >= 2) & inside
+    neighbours = pd.Series(positions[feature]).groupby(hole).agg(list)
+    gaps = pd.DataFrame({
+        'geometry': holes[keep],
+        'area': shapely.area(holes[keep]),
+        'positions': [neighbours.get(k, []) for k in np.flatnonzero(keep)],
+    })
+    return edges, gaps
+
+
+def coverage_report(path, member=None, tile_size=TILE_SIZE, gap_width=GAP_WIDTH, cache_dir=CACHE_DIR):
+    """
+    Validate the coverage of a polygon dataset tile by tile.
+
+    The dataset is read through the memory-mapped geometry cache, so only
+    the bounding boxes of all features and the geometries of one tile (plus
+    its neighbours from the surrounding tiles) are in memory at a time.
+    Returns (edges, gaps) as GeoDataFrames: the invalid edges of each
+    offending feature (with its id) and the narrow gap polygons (with the
+    ids of the features around them).
+    """
+    cache = open_cache(path, member, cache_dir)
+    ids = cache.read_properties(columns=['id'])['id'].to_numpy(dtype=object)
+    bounds = feature_bounds(cache)
+    present = np.isfinite(bounds).all(axis=1)
+    tree = STRtree(shapely.box(*bounds[present].T))
+    tree_positions = np.flatnonzero(present)
+
+    edges, gaps = [], []
+    for tile, tile_positions in iter_tiles(bounds, tile_size):
+        # Everything within gap_width of the tile's features is needed to judge their edges
+        extent = bounds[tile_positions]
+        region = shapely.box(extent[:, 0].min() - gap_width, extent[:, 1].min() - gap_width,
+                             extent[:, 2].max() + gap_width, extent[:, 3].max() + gap_width)
+        context = np.union1d(tile_positions, tree_positions[tree.query(region)])
+        owned = np.isin(context, tile_positions)
+
+        tile_edges, tile_gaps = coverage_errors(cache.take(context), owned, tile, gap_width)
+        tile_edges['id'] = ids[context[tile_edges['position'].to_numpy(dtype=np.int64)]]
+        tile_gaps['ids'] = [[ids[context[k]] for k in positions] for positions in tile_gaps['positions']]
+        edges.append(tile_edges.drop(columns='position'))
+        gaps.append(tile_gaps.drop(columns='positions'))
+
+    edges = pd.concat(edges, ignore_index=True) if edges else pd.DataFrame(columns=['geometry', 'length', 'id'])
+    gaps = pd.concat(gaps, ignore_index=True) if gaps else pd.DataFrame(columns=['geometry', 'area', 'ids'])
+    return gpd.GeoDataFrame(edges, geometry='geometry'), gpd.GeoDataFrame(gaps, geometry='geometry')
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Find narrow gaps and mismatched shared edges between polygons")
+    parser.add_argument('dataset')
+    parser.add_argument('member', nargs='?')
+    parser.add_argument('--tile-size', type=float, default=TILE_SIZE)
+    parser.add_argument('--gap-width', type=float, default=GAP_WIDTH)
+    parser.add_argument('--output', default='Coverage')
+    args = parser.parse_args()
+
+    start = time.time()
+    edges, gaps = coverage_report(args.dataset, args.member, args.tile_size, args.gap_width)
+    print(f"Checked coverage in {time.time() - start:.2f} seconds")
+    print(f"   - Features with invalid (mismatched or gapped) edges: {edges['id'].nunique()}")
+    print(f"   - Gaps narrower than {args.gap_width}: {len(gaps)}")
+    for row in gaps.head(10).itertuples():
+        print(f"   - Gap of area {row.area:.3e} between features {', '.join(map(str, row.ids))}")
+
+    os.makedirs(args.output, exist_ok=True)
+    with FeatureCollectionWriter(os.path.join(args.output, 'invalid_edges.json')) as writer:
+        writer.write_geodataframe(edges)
+    with FeatureCollectionWriter(os.path.join(args.output, 'gaps.json')) as writer:
+        writer.write_geodataframe(gaps.assign(ids=gaps['ids'].apply(lambda ids: ', '.join(map(str, ids)))))
+    print(f"Invalid edges and gaps saved to {args.output}/")
@@ -1,20 +1,33 @@
-import json
-import os
-import copy
 import math
 
+from geojson_stream import FeatureCollectionWriter, iter_features
+
 # Load the GeoJSON file
 input_file = 'subset_for_ai.json'
 output_file = 'subset_with_error.json'
 
+def copy_first_ring(feature):
+    """
+    Copy-on-write copy of a MultiPolygon feature: only the containers on the
+    path to the first ring of the first polygon are new, everything else
+    (properties, other rings and polygons, the coordinate pairs themselves)
+    is shared with the original feature.
+    """
+    coordinates = feature['geometry']['coordinates']
+    first_polygon = [list(coordinates[0][0])] + coordinates[0][1:]
+    return {
+        **feature,
+        'geometry': {**feature['geometry'], 'coordinates': [first_polygon] + coordinates[1:]},
+    }
+
 def create_self_intersection(feature, feature_index):
     """Create a self-intersection in a feature's geometry"""
     
-    # Make a deep copy of the feature for modification
-    modified_feature = copy.deepcopy(feature)
-    
     # Check if it's a MultiPolygon
     if feature['geometry']['type'] == 'MultiPolygon':
+        # Copy only the ring that changes; points are replaced, never modified in place
+        modified_feature = copy_first_ring(feature)
+        
         # Get the first polygon, first ring
         original_coords = feature['geometry']['coordinates'][0][0]
         modified_coords = modified_feature['geometry']['coordinates'][0][0]
@@ -83,40 +96,33 @@ def create_self_intersection(feature, feature_index):
         print(f"Feature {feature_index} is not a MultiPolygon, it's a {feature['geometry']['type']}")
         return None  # Skip this feature
 
-# Main code execution
-with open(input_file, 'r') as f:
-    data = json.load(f)
+# Main code execution: stream the features from the input to the output file,
+# so only the feature being processed is held in memory. Top-level members of
+# the input such as "crs" are collected while streaming and copied to the output
+modified_count = 0
+feature_count = 0
+collection_members = {}
 
-# Make sure we have features
-if 'features' in data and len(data['features']) > 0:
-    # Make a deep copy of the original data
-    modified_data = copy.deepcopy(data)
-    
-    # Count of successful modifications
-    modified_count = 0
-    
-    # Process the first 3 features (or fewer if less are available)
-    features_to_process = min(3, len(data['features']))
-    
-    for i in range(features_to_process):
-        # Get the feature
-        feature = data['features'][i]
-        
-        print(f"\nProcessing feature {i+1}/{features_to_process}: ID {feature.get('id', 'unknown')}")
+with FeatureCollectionWriter(output_file, collection_members) as writer:
+    for i, feature in enumerate(iter_features(input_file, members=collection_members)):
+        feature_count += 1
         
-        # Create a self-intersection
-        modified_feature = create_self_intersection(feature, i)
+        # Process the first 3 features (or fewer if less are available)
+        if i < 3:
+            print(f"\nProcessing feature {i+1}: ID {feature.get('id', 'unknown')}")
+            
+            # Create a self-intersection
+            modified_feature = create_self_intersection(feature, i)
+            
+            # If modification was successful, write the modified feature instead
+            if modified_feature:
+                feature = modified_feature
+                modified_count += 1
         
-        # If modification was successful, update the feature in our modified data
-        if modified_feature:
-            modified_data['features'][i] = modified_feature
-            modified_count += 1
-    
-    # Save modified GeoJSON to a new file
-    with open(output_file, 'w') as f:
-        json.dump(modified_data, f)
-    
+        writer.write_feature(feature)
+
+if feature_count > 0:
     print(f"\nModified {modified_count} features with self-intersections")
     print(f"Modified GeoJSON saved to {output_file}")
 else:
-    print("No features found in the GeoJSON file") 
\ No newline at end of file
+    print("No features found in the GeoJSON file")
@@ -0,0 +1,278 @@
+import numpy as np
+import pandas as pd
+import shapely
+
+ERROR_TYPES = ('swap', 'spike', 'bowtie', 'duplicate_vertex', 'ring_reversal', 'unclosed_ring', 'sliver', 'overlap')
+
+# Rings need at least this many distinct vertices to take every error type
+MIN_RING_VERTICES = 8
+
+# Factor applied to the y extent of a part around its mean to make a sliver
+SLIVER_FACTOR = 1e-4
+
+
+class PackedPolygons:
+    """
+    MultiPolygons stored as one flat coordinate array with offset arrays,
+    the layout of shapely.to_ragged_array: ring k uses
+    coords[ring_offsets[k]:ring_offsets[k + 1]], part p uses rings
+    part_offsets[p]:part_offsets[p + 1] and feature f uses parts
+    geometry_offsets[f]:geometry_offsets[f + 1]. Errors are injected by
+    editing these arrays, never per-feature Python objects.
+    """
+
+    def __init__(self, coords, ring_offsets, part_offsets, geometry_offsets):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.geometry_offsets = geometry_offsets
+
+    @classmethod
+    def from_geometries(cls, geoms):
+        """Pack an array of Polygons/MultiPolygons (other types become empty)"""
+        geoms = np.asarray(geoms, dtype=object)
+        parts, part_feature = shapely.get_parts(geoms, return_index=True)
+        is_polygon = shapely.get_type_id(parts) == 3
+        parts, part_feature = parts[is_polygon], part_feature[is_polygon]
+        geometry_offsets = np.concatenate([[0], np.cumsum(np.bincount(part_feature, minlength=len(geoms)))])
+
+        rings, ring_part = shapely.get_rings(parts, return_index=True)
+        part_offsets = np.concatenate([[0], np.cumsum(np.bincount(ring_part, minlength=len(parts)))])
+        counts = shapely.get_num_coordinates(rings)
+        ring_offsets = np.concatenate([[0], np.cumsum(counts)])
+        coords = shapely.get_coordinates(rings)
+        return cls(coords, ring_offsets, part_offsets, geometry_offsets)
+
+    def __len__(self):
+        return len(self.geometry_offsets) - 1
+
+    def to_geometries(self):
+        """
+        Build MultiPolygons from the packed arrays. Shapely always closes
+        rings, so unclosed rings only survive in feature_geometry output.
+        """
+        return shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, self.coords,
+                                         (self.ring_offsets, self.part_offsets, self.geometry_offsets))
+
+    def feature_geometry(self, index):
+        """GeoJSON geometry dict of one feature, written straight from the packed arrays"""
+        coordinates = []
+        for part in range(self.geometry_offsets[index], self.geometry_offsets[index + 1]):
+            polygon = []
+            for ring in range(self.part_offsets[part], self.part_offsets[part + 1]):
+                polygon.append(self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]].tolist())
+            coordinates.append(polygon)
+        return {"type": "MultiPolygon", "coordinates": coordinates}
+
+
+def _insert_vertices(packed, positions):
+    """Duplicate the vertices at positions (global coordinate indices) in place of a copy"""
+    positions = np.sort(positions)
+    packed.coords = np.insert(packed.coords, positions, packed.coords[positions], axis=0)
+    packed.ring_offsets = packed.ring_offsets + np.searchsorted(positions, packed.ring_offsets, side='left')
+
+
+def _delete_vertices(packed, positions):
+    positions = np.sort(positions)
+    packed.coords = np.delete(packed.coords, positions, axis=0)
+    packed.ring_offsets = packed.ring_offsets - np.searchsorted(positions, packed.ring_offsets, side='left')
+
+
+def inject_errors(packed, fraction=0.1, error_types=ERROR_TYPES, weights=None, seed=0):
+    """
+    Inject one error into a random fraction of the features of a
+    PackedPolygons, choosing the error type of each feature with the given
+    weights (uniform by default). Every error is applied to the exterior ring
+    of a random part of the feature:
+
+    - swap: two vertices far apart on the ring trade places
+    - spike: a vertex is pushed outwards, past the vertex a quarter ring away
+    - bowtie: a vertex is moved across the segment after next, making a figure-8
+    - duplicate_vertex: a vertex is repeated
+    - ring_reversal: the ring runs the other way round
+    - unclosed_ring: the closing vertex is removed
+    - sliver: the whole part is flattened to a sliver of almost no area
+    - overlap: the whole feature is moved on top of another feature
+
+    Features whose chosen ring has fewer than MIN_RING_VERTICES vertices are
+    left alone. The arrays are modified in place; returns a DataFrame of
+    labels with the feature, error, part, ring and vertex of every injection.
+    """
+    rng = np.random.default_rng(seed)
+    error_types = list(error_types)
+    unknown = set(error_types) - set(ERROR_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown error types: {sorted(unknown)}")
+
+    n = len(packed)
+    parts_per_feature = np.diff(packed.geometry_offsets)
+    selected = np.flatnonzero((rng.random(n) < fraction) & (parts_per_feature > 0))
+    part = packed.geometry_offsets[selected] + (rng.random(len(selected)) * parts_per_feature[selected]).astype(int)
+    ring = packed.part_offsets[part]
+    start = packed.ring_offsets[ring]
+    # Number of distinct vertices (the closing vertex repeats the first)
+    m = packed.ring_offsets[ring + 1] - start - 1
+    big_enough = m >= MIN_RING_VERTICES
+    selected, part, ring, start, m = selected[big_enough], part[big_enough], ring[big_enough], start[big_enough], m[big_enough]
+
+    probabilities = None if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+    error = np.asarray(error_types)[rng.choice(len(error_types), len(selected), p=probabilities)]
+    vertex = np.full(len(selected), -1)
+    coords = packed.coords
+
+    # Edits that keep the number of coordinates; applied in place
+    is_swap = error == 'swap'
+    i = 1 + (rng.random(len(selected)) * (m // 2 - 1)).astype(int)
+    j = i + 2 + (rng.random(len(selected)) * (m - i - 2)).astype(int)
+    a, b = start[is_swap] + i[is_swap], start[is_swap] + j[is_swap]
+    coords[a], coords[b] = coords[b].copy(), coords[a].copy()
+    vertex[is_swap] = i[is_swap]
+
+    # Vertex k moves past the middle of segment (k + 1, k + 2) on the line from
+    # vertex k - 1, so segment (k - 1, k) always crosses segment (k + 1, k + 2)
+    is_bowtie = error == 'bowtie'
+    k = 1 + (rng.random(len(selected)) * (m - 3)).astype(int)
+    at = start[is_bowtie] + k[is_bowtie]
+    middle = (coords[at + 1] + coords[at + 2]) / 2
+    coords[at] = middle + 0.5 * (middle - coords[at - 1])
+    vertex[is_bowtie] = k[is_bowtie]
+
+    # The vertex moves 0.8 times its distance from the vertex a quarter ring back, away from it
+    is_spike = error == 'spike'
+    tip = start[is_spike] + k[is_spike]
+    base = start[is_spike] + (k[is_spike] - m[is_spike] // 4) % m[is_spike]
+    coords[tip] = coords[tip] + 0.8 * (coords[tip] - coords[base])
+    vertex[is_spike] = k[is_spike]
+
+    is_reversal = error == 'ring_reversal'
+    lengths = m[is_reversal] + 1
+    ring_start = np.repeat(start[is_reversal], lengths)
+    position = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    coords[ring_start + position] = coords[ring_start + np.repeat(lengths, lengths) - 1 - position]
+
+    is_sliver = error == 'sliver'
+    _flatten_parts(packed, part[is_sliver])
+
+    is_overlap = error == 'overlap'
+    _move_onto_others(packed, selected[is_overlap], rng)
+
+    # Edits that change the number of coordinates, applied last so the
+    # indices above stay valid. Insert positions are shifted by the deletions before them
+    is_unclosed = error == 'unclosed_ring'
+    deleted = np.sort(start[is_unclosed] + m[is_unclosed])
+    _delete_vertices(packed, deleted)
+    vertex[is_unclosed] = m[is_unclosed]
+
+    is_duplicate = error == 'duplicate_vertex'
+    inserted = start[is_duplicate] + k[is_duplicate]
+    _insert_vertices(packed, inserted - np.searchsorted(deleted, inserted))
+    vertex[is_duplicate] = k[is_duplicate]
+
+    return pd.DataFrame({
+        'feature': selected,
+        'error': error,
+        'part': part - packed.geometry_offsets[selected],
+        'ring': 0,
+        'vertex': vertex,
+    })
+
+
+def _coordinate_ranges(starts, ends):
+    """Concatenated np.arange(start, end) for every pair, plus the pair number of each index"""
+    lengths = ends - starts
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + starts[owner], owner
+
+
+def _flatten_parts(packed, parts):
+    starts = packed.ring_offsets[packed.part_offsets[parts]]
+    ends = packed.ring_offsets[packed.part_offsets[parts + 1]]
+    index, owner = _coordinate_ranges(starts, ends)
+    y = packed.coords[index, 1]
+    mean_y = np.bincount(owner, weights=y, minlength=len(parts)) / np.maximum(ends - starts, 1)
+    packed.coords[index, 1] = mean_y[owner] + (y - mean_y[owner]) * SLIVER_FACTOR
+
+
+def _feature_centres(packed, features, first_coord):
+    starts, ends = first_coord[features], first_coord[features + 1]
+    index, owner = _coordinate_ranges(starts, ends)
+    counts = np.maximum(ends - starts, 1)[:, None]
+    centre = np.column_stack([np.bincount(owner, weights=packed.coords[index, axis], minlength=len(features))
+                              for axis in (0, 1)]) / counts
+    spread = np.column_stack([np.bincount(owner, weights=np.abs(packed.coords[index, axis] - centre[owner, axis]),
+                                          minlength=len(features)) for axis in (0, 1)]) / counts
+    return index, owner, centre, spread
+
+
+def _move_onto_others(packed, features, rng):
+    if len(features) == 0 or len(packed) < 2:
+        return
+    first_coord = packed.ring_offsets[packed.part_offsets[packed.geometry_offsets]]
+    n = len(packed)
+    other = (features + 1 + (rng.random(len(features)) * (n - 1)).astype(int)) % n
+    has_coords = (first_coord[features + 1] > first_coord[features]) & (first_coord[other + 1] > first_coord[other])
+    features, other = features[has_coords], other[has_coords]
+
+    index, owner, centre, spread = _feature_centres(packed, features, first_coord)
+    _, _, other_centre, _ = _feature_centres(packed, other, first_coord)
+    # Centre the feature on the other one, off by a fraction of its own size so they don't coincide
+    shift = other_centre - centre + spread * rng.uniform(-0.5, 0.5, (len(features), 2))
+    packed.coords[index] += shift[owner]
+
+
+def generate_corpus(geoms, fraction=0.1, error_types=ERROR_TYPES, weights=None, seed=0):
+    """Pack geometries, inject errors and return (PackedPolygons, labels)"""
+    packed = PackedPolygons.from_geometries(geoms)
+    labels = inject_errors(packed, fraction, error_types, weights, seed)
+    return packed, labels
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from geojson_stream import FeatureCollectionWriter, iter_features
+    from shapely.geometry import shape
+
+    parser = argparse.ArgumentParser(description="Inject labelled geometry errors into a dataset")
+    parser.add_argument('input', nargs='?', default='subset_for_ai.json', help="GeoJSON file (or .zip)")
+    parser.add_argument('--synthetic', type=int, help="Use this many synthetic features (benchmark.py) instead of input")
+    parser.add_argument('--output', default='Json/injected_errors.json')
+    parser.add_argument('--labels', default='Json/injected_errors_labels.csv')
+    parser.add_argument('--fraction', type=float, default=0.1)
+    parser.add_argument('--types', nargs='+', default=list(ERROR_TYPES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-geojson', action='store_true', help="Only write the labels")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.synthetic:
+        from benchmark import generate_dataset
+        geoms = generate_dataset(args.synthetic, args.seed).values
+        ids = [str(i) for i in range(len(geoms))]
+        properties = [{} for _ in ids]
+    else:
+        features = list(iter_features(args.input))
+        geoms = np.array([shape(f['geometry']) if f.get('geometry') else None for f in features], dtype=object)
+        ids = [f.get('id') for f in features]
+        properties = [f.get('properties', {}) for f in features]
+    print(f"Loaded {len(geoms)} features in {time.time() - start:.2f} seconds")
+
+    start = time.time()
+    packed, labels = generate_corpus(geoms, args.fraction, args.types, seed=args.seed)
+    print(f"Injected {len(labels)} errors in {time.time() - start:.2f} seconds")
+    print(labels['error'].value_counts().to_string())
+
+    import os
+    os.makedirs(os.path.dirname(args.labels) or '.', exist_ok=True)
+    labels.insert(1, 'id', [ids[i] for i in labels['feature']])
+    labels.to_csv(args.labels, index=False)
+    print(f"Labels saved to {args.labels}")
+
+    if not args.no_geojson:
+        start = time.time()
+        with FeatureCollectionWriter(args.output) as writer:
+            for i in range(len(packed)):
+                writer.write_feature({"type": "Feature", "id": ids[i], "properties": properties[i],
+                                      "geometry": packed.feature_geometry(i)})
+        print(f"Corpus saved to {args.output} in {time.time() - start:.2f} seconds")
@@ -0,0 +1,216 @@
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+from geojson_stream import iter_feature_chunks
+from response_parser import ISSUES
+from results_store import ResultsStore
+from topology_checks import polygon_rings, ring_orientation_check, vertex_precision_check
+from triage import EXTERIOR
+
+ISSUE_FIELDS = [field for field, _, _ in ISSUES]
+
+# Consecutive vertices closer than this are a precision issue
+CLOSE_VERTICES_THRESHOLD = 1e-8
+
+
+def exact_ground_truth(geometries, exterior=EXTERIOR, close_threshold=CLOSE_VERTICES_THRESHOLD):
+    """
+    Compute the expected answer for each of the four categories of the
+    system prompt in test.py, for every geometry at once:
+
+    - self_intersection: a ring of the feature crosses or touches itself
+    - invalid_geometry: the geometry is not valid (GEOS validity rules)
+    - ring_orientation: an exterior does not run in the exterior direction
+      or a hole runs in it (clockwise exteriors by default, the convention
+      triage forwards features by and the system prompt asks about)
+    - precision: non-finite or out-of-range (longitude/latitude) coordinates,
+      or duplicate/near-duplicate consecutive vertices
+
+    Returns a boolean DataFrame with one row per geometry, indexed like the
+    input when it is a GeoSeries.
+    """
+    index = geometries.index if hasattr(geometries, 'index') else None
+    geoms = np.asarray(geometries, dtype=object)
+    n = len(geoms)
+    present = ~shapely.is_missing(geoms)
+
+    rings, ring_feature, _, _ = polygon_rings(geoms)
+    self_intersection = np.bincount(ring_feature, weights=~shapely.is_simple(rings), minlength=n) > 0
+
+    orientation = ring_orientation_check(geoms, exterior=exterior)
+    wrong = orientation['index'].to_numpy(dtype=int)[(orientation['expected'] != orientation['actual']).to_numpy()]
+    ring_orientation = np.bincount(wrong, minlength=n) > 0
+
+    coords, coord_feature = shapely.get_coordinates(geoms, return_index=True)
+    out_of_range = ~np.isfinite(coords).all(axis=1) | (np.abs(coords[:, 0]) > 180) | (np.abs(coords[:, 1]) > 90)
+    precision = np.bincount(coord_feature, weights=out_of_range, minlength=n) > 0
+    vertices = vertex_precision_check(geoms, close_threshold)
+    precision |= ((vertices['duplicate_vertices'] > 0) | (vertices['close_vertices'] > 0)).to_numpy()
+
+    return pd.DataFrame({
+        'self_intersection': self_intersection,
+        'invalid_geometry': present & ~shapely.is_valid(geoms),
+        'ring_orientation': ring_orientation,
+        'precision': precision,
+    }, index=index)
+
+
+def feature_ground_truth(features, exterior=EXTERIOR):
+    """Ground truth for a list of GeoJSON features as {feature id: {issue: bool}}"""
+    geoms = [shape(f['geometry']) if f.get('geometry') else None for f in features]
+    truth = exact_ground_truth(np.array(geoms, dtype=object), exterior)
+    truth.index = [str(feature.get('id')) for feature in features]
+    return truth.to_dict('index')
+
+
+def dataset_ground_truth(path, chunk_size=10000, feature_ids=None, exterior=EXTERIOR):
+    """
+    Ground truth for every feature of a GeoJSON file (or only feature_ids),
+    streamed in chunks. Returns a DataFrame indexed by feature id (as str).
+    """
+    wanted = None if feature_ids is None else {str(feature_id) for feature_id in feature_ids}
+    frames = []
+    for chunk in iter_feature_chunks(path, chunk_size):
+        ids = chunk['id'].astype(str)
+        if wanted is not None:
+            keep = ids.isin(wanted).to_numpy()
+            chunk, ids = chunk[keep], ids[keep]
+        if len(chunk):
+            truth = exact_ground_truth(chunk.geometry.values, exterior)
+            truth.index = ids.to_numpy()
+            frames.append(truth)
+    if not frames:
+        return pd.DataFrame(columns=ISSUE_FIELDS, dtype=bool)
+    truth = pd.concat(frames)
+    truth.index.name = 'feature_id'
+    return truth
+
+
+def score_verdicts(verdicts, truth):
+    """
+    Join verdicts (a long DataFrame with model, feature_id, issue and
+    predicted columns) with the ground truth and count, per model and issue,
+    true/false positives/negatives. Verdicts for features without ground
+    truth are left out. Returns one row per (model, issue) with the counts,
+    precision, recall, F1 and accuracy.
+    """
+    long_truth = truth[ISSUE_FIELDS].rename_axis('feature_id').reset_index().melt(
+        id_vars='feature_id', var_name='issue', value_name='actual')
+    long_truth['feature_id'] = long_truth['feature_id'].astype(str)
+    joined = verdicts.assign(feature_id=verdicts['feature_id'].astype(str)).merge(
+        long_truth, on=['feature_id', 'issue'], how='inner')
+
+    predicted = joined['predicted'].to_numpy().astype(bool)
+    actual = joined['actual'].to_numpy().astype(bool)
+    counts = pd.DataFrame({
+        'model': joined['model'].to_numpy(),
+        'issue': joined['issue'].to_numpy(),
+        'true_positives': predicted & actual,
+        'false_positives': predicted & ~actual,
+        'false_negatives': ~predicted & actual,
+        'true_negatives': ~predicted & ~actual,
+    }).groupby(['model', 'issue'], sort=True).sum()
+
+    tp, fp = counts['true_positives'], counts['false_positives']
+    fn, tn = counts['false_negatives'], counts['true_negatives']
+    counts['precision'] = tp / (tp + fp).replace(0, np.nan)
+    counts['recall'] = tp / (tp + fn).replace(0, np.nan)
+    counts['f1'] = 2 * counts['precision'] * counts['recall'] / (counts['precision'] + counts['recall'])
+    counts['accuracy'] = (tp + tn) / (tp + fp + fn + tn)
+    return counts.reset_index()
+
+
+def latency_by_model(responses):
+    """Mean, median and 95th percentile request latency per model (cached answers excluded)"""
+    live = responses[responses['cached'] == 0]
+    return live.groupby('model')['latency'].describe(percentiles=[0.5, 0.95])[['count', 'mean', '50%', '95%']] \
+        .rename(columns={'count': 'answers', '50%': 'median', '95%': 'p95'}).reset_index()
+
+
+def coverage_by_model(responses):
+    """Number of answers and share of them that parsed into a verdict, per model"""
+    return responses.groupby('model')['valid'].agg(answers='count', valid='sum') \
+        .assign(coverage=lambda counts: counts['valid'] / counts['answers']).reset_index()
+
+
+def confusion_matrix_text(scores, model, issue):
+    """Two-by-two confusion matrix of one model and issue as printable text"""
+    row = scores[(scores['model'] == model) & (scores['issue'] == issue)].iloc[0]
+    return (f"                 actual yes  actual no\n"
+            f"predicted yes    {row.true_positives:>10}  {row.false_positives:>9}\n"
+            f"predicted no     {row.false_negatives:>10}  {row.true_negatives:>9}")
+
+
+def evaluate(dataset, store_file='Results/results.sqlite', run_ids=None, output_dir='Evaluation', exterior=EXTERIOR):
+    """
+    Score the stored model verdicts of the given runs (all runs by default)
+    against exact ground truth computed from the dataset, with the ring
+    orientation convention used by triage (exterior). Only verdicts of
+    valid answers are scored; failed requests are reported separately as
+    coverage. Writes scores.csv, coverage.csv, latency.csv and
+    ground_truth.csv to output_dir and returns (scores, coverage, latency).
+    """
+    with ResultsStore(store_file) as store:
+        where, params = "", ()
+        if run_ids is not None:
+            run_ids = list(run_ids)
+            where = f"WHERE r.run_id IN ({', '.join('?' * len(run_ids))})"
+            params = tuple(run_ids)
+        verdicts = store.query(
+            f"""SELECT v.model, v.feature_id, v.issue, v.predicted
+                FROM verdicts v JOIN responses r
+                ON r.run_id = v.run_id AND r.model = v.model AND r.feature_id = v.feature_id AND r.valid = 1
+                {where}""", params)
+        responses = store.query(f"SELECT model, valid, latency, cached FROM responses r {where}", params)
+
+    truth = dataset_ground_truth(dataset, feature_ids=verdicts['feature_id'].unique(), exterior=exterior)
+    scores = score_verdicts(verdicts, truth)
+    coverage = coverage_by_model(responses)
+    latency = latency_by_model(responses)
+
+    os.makedirs(output_dir, exist_ok=True)
+    scores.to_csv(os.path.join(output_dir, 'scores.csv'), index=False)
+    coverage.to_csv(os.path.join(output_dir, 'coverage.csv'), index=False)
+    latency.to_csv(os.path.join(output_dir, 'latency.csv'), index=False)
+    truth.to_csv(os.path.join(output_dir, 'ground_truth.csv'))
+    return scores, coverage, latency
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Score stored model verdicts against shapely ground truth")
+    parser.add_argument('dataset', nargs='?', default='subset_with_error.json')
+    parser.add_argument('--store', default='Results/results.sqlite')
+    parser.add_argument('--runs', type=int, nargs='+', help="Run ids to include (default: all runs)")
+    parser.add_argument('--output', default='Evaluation')
+    parser.add_argument('--exterior', choices=('cw', 'ccw'), default=EXTERIOR,
+                        help="Orientation of exterior rings the models were asked about")
+    args = parser.parse_args()
+
+    start = time.time()
+    scores, coverage, latency = evaluate(args.dataset, args.store, args.runs, args.output, args.exterior)
+    print(f"Scored {int(scores[['true_positives', 'false_positives', 'false_negatives', 'true_negatives']].sum().sum())} "
+          f"verdicts in {time.time() - start:.2f} seconds\n")
+
+    for row in coverage.itertuples():
+        print(f"{row.model}: {row.valid} of {row.answers} answers valid (coverage {row.coverage:.2f})")
+    print()
+
+    for model in scores['model'].unique():
+        print(f"=== {model} ===")
+        for issue in ISSUE_FIELDS:
+            if ((scores['model'] == model) & (scores['issue'] == issue)).any():
+                row = scores[(scores['model'] == model) & (scores['issue'] == issue)].iloc[0]
+                print(f"{issue}: precision {row.precision:.2f}, recall {row.recall:.2f}, accuracy {row.accuracy:.2f}")
+                print(confusion_matrix_text(scores, model, issue))
+        print()
+
+    print("Latency per model (seconds):")
+    print(latency.to_string(index=False))
+    print(f"\nScores saved to {args.output}/")
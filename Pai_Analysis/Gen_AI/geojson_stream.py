@@ -0,0 +1,227 @@
+import io
+import json
+import zipfile
+
+import geopandas as gpd
+import shapely
+
+# Number of characters read from the file at a time while scanning for features
+READ_BLOCK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def open_geojson(path, member=None):
+    """
+    Open a GeoJSON file for reading as text. If the path is a .zip archive the
+    file is read directly from inside the archive without extracting it.
+    When no member is given the archive must contain exactly one .json file.
+    """
+    if not str(path).lower().endswith('.zip'):
+        return open(path, 'r', encoding='utf-8')
+
+    archive = zipfile.ZipFile(path)
+    if member is None:
+        candidates = [name for name in archive.namelist()
+                      if name.lower().endswith(('.json', '.geojson'))]
+        if len(candidates) != 1:
+            archive.close()
+            raise ValueError(f"Expected one GeoJSON file in {path}, found {len(candidates)}: {candidates}")
+        member = candidates[0]
+    return io.TextIOWrapper(archive.open(member), encoding='utf-8')
+
+
+class _Reader:
+    """Buffered character reader that lets raw_decode work on a sliding window."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        # Drop what has already been consumed before appending the next block
+        block = self.f.read(READ_BLOCK_SIZE)
+        if not block:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise ValueError("Unexpected end of GeoJSON input")
+        return self.buf[self.pos]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}, found '{self.buf[self.pos]}'")
+        self.pos += 1
+
+    def decode_value(self):
+        """Decode the next complete JSON value, reading more input until it fits."""
+        self.skip_whitespace()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # The value is probably cut off at the end of the buffer
+                if self.fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may still be incomplete
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_features(path, member=None, members=None):
+    """
+    Yield the features of a GeoJSON FeatureCollection one at a time.
+    Only the feature currently being decoded is held in memory, so files much
+    larger than RAM can be processed. Other top-level members such as "crs"
+    are decoded and discarded, or stored in the members dict if one is given
+    (the ones after "features" only once every feature has been yielded).
+    """
+    with open_geojson(path, member) as f:
+        reader = _Reader(f)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.decode_value()
+            reader.expect(':')
+            if key == 'features':
+                reader.expect('[')
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield reader.decode_value()
+                        if reader.peek() == ',':
+                            reader.pos += 1
+                            continue
+                        reader.expect(']')
+                        break
+            else:
+                value = reader.decode_value()
+                if members is not None and key != 'type':
+                    members[key] = value
+
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect('}')
+            return
+
+
+def iter_feature_chunks(path, chunk_size=10000, member=None, members=None):
+    """
+    Yield GeoDataFrames of at most chunk_size features from a GeoJSON file.
+    Each chunk keeps a global index (position of the feature in the file) and
+    the feature id in an "id" column, so results from different chunks can be
+    combined without collisions. Top-level members go into the members dict
+    if one is given, as in iter_features.
+    """
+    start = 0
+    batch = []
+    for feature in iter_features(path, member, members):
+        batch.append(feature)
+        if len(batch) >= chunk_size:
+            yield _to_geodataframe(batch, start)
+            start += len(batch)
+            batch = []
+    if batch:
+        yield _to_geodataframe(batch, start)
+
+
+def _to_geodataframe(features, start):
+    gdf = gpd.GeoDataFrame.from_features(features)
+    gdf.index = range(start, start + len(features))
+    if 'id' not in gdf.columns:
+        gdf['id'] = [feature.get('id') for feature in features]
+    return gdf
+
+
+class FeatureCollectionWriter:
+    """
+    Write a GeoJSON FeatureCollection to disk one feature at a time, so the
+    output never has to be assembled in memory. Can be used as a context manager.
+
+    members are extra top-level members such as "crs". They are written after
+    the features when the writer is closed, so a dict that iter_features is
+    still filling while the features stream through is passed on complete.
+    """
+
+    def __init__(self, path, members=None):
+        self.path = path
+        self.members = members
+        self.count = 0
+        self.f = open(path, 'w', encoding='utf-8')
+        self.f.write('{"type": "FeatureCollection", "features": [')
+
+    def __enter__(self):
+        return self
+
+    def write_feature(self, feature):
+        self._write(json.dumps(feature))
+
+    def write_geodataframe(self, gdf):
+        """
+        Write a chunk, using its "id" column (if any) as the feature ids.
+        Geometries are encoded by GEOS in one vectorised call, which is much
+        faster than building coordinate lists for json.
+        """
+        ids = gdf['id'].tolist() if 'id' in gdf.columns else gdf.index.tolist()
+        properties = gdf.drop(columns=[column for column in ('id', gdf.geometry.name) if column in gdf.columns])
+        # to_dict('records') returns no rows at all when there are no columns
+        properties = (properties.astype(object).where(properties.notna(), None).to_dict('records')
+                      if len(properties.columns) else [{}] * len(gdf))
+        geometries = shapely.to_geojson(gdf.geometry.values.to_numpy())
+        for feature_id, feature_properties, geometry in zip(ids, properties, geometries):
+            self._write('{"type": "Feature", "properties": %s, "geometry": %s, "id": %s}'
+                        % (json.dumps(feature_properties), geometry or 'null', json.dumps(feature_id)))
+
+    def _write(self, text):
+        if self.count:
+            self.f.write(', ')
+        self.f.write(text)
+        self.count += 1
+
+    def close(self):
+        self.f.write(']')
+        for key, value in (self.members or {}).items():
+            if key not in ('type', 'features'):
+                self.f.write(', %s: %s' % (json.dumps(key), json.dumps(value)))
+        self.f.write('}')
+        self.f.close()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python geojson_stream.py <file.json|archive.zip> [member]")
+        sys.exit(1)
+
+    count = 0
+    for chunk in iter_feature_chunks(sys.argv[1], member=sys.argv[2] if len(sys.argv) > 2 else None):
+        count += len(chunk)
+        print(f"Read chunk ending at feature {count}: {chunk.geometry.type.value_counts().to_dict()}")
+    print(f"Total features: {count}")
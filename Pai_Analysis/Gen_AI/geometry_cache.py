@@ -0,0 +1,394 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+from geojson_stream import iter_feature_chunks
+
+CACHE_DIR = 'GeometryCache'
+
+# Bumped whenever the layout of the cache files changes
+CACHE_VERSION = 4
+
+# Single geometry types are stored as their multi type (type id -> multi type id)
+MULTI_TYPES = {0: 4, 1: 5, 2: 5, 3: 6, 4: 4, 5: 5, 6: 6}
+
+# Missing and empty geometries are stored as an empty multi geometry; empty
+# single geometries get their type back on load from the is_multi flag
+EMPTY_MULTI = {4: 'MULTIPOINT EMPTY', 5: 'MULTILINESTRING EMPTY', 6: 'MULTIPOLYGON EMPTY'}
+EMPTY_SINGLE = {4: 'POINT EMPTY', 5: 'LINESTRING EMPTY', 6: 'POLYGON EMPTY'}
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(path, member=None, cache_dir=CACHE_DIR):
+    """
+    Directory holding the cache of one source file (and zip member). The name
+    carries a hash of the absolute path, so different files with the same
+    name get different caches.
+    """
+    source = os.path.abspath(path) + (f"::{member}" if member else '')
+    name = os.path.basename(path) + (f"_{member}" if member else '')
+    key = hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', name) + '_' + key)
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_valid(path, member=None, cache_dir=CACHE_DIR):
+    """
+    Check that the cache of a source file exists and matches it. Size and
+    modification time are compared first; only when they differ is the file
+    hashed, so an unchanged file is never read. A touched but identical file
+    keeps its cache.
+    """
+    directory = cache_path(path, member, cache_dir)
+    meta_file = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta.get('version') != CACHE_VERSION:
+        return False
+
+    stat = _source_stat(path)
+    if stat['size'] == meta['size'] and stat['mtime_ns'] == meta['mtime_ns']:
+        return True
+    if stat['size'] != meta['size'] or file_digest(path) != meta['sha256']:
+        return False
+    meta.update(stat)
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return True
+
+
+class _CacheWriter:
+    """
+    Writes the cache files of build_cache one chunk at a time. Every array is
+    a raw file that chunks are appended to, so memory is bounded by the
+    chunk size. Geometries are stored in the ragged layout while every
+    geometry seen so far has the same multi type and dimension and no multi
+    geometry has an empty part (from_ragged_array crashes on those); the
+    first chunk breaking that converts what was written so far to WKB.
+    """
+
+    def __init__(self, directory, chunk_size):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.files = {}
+        self.count = 0
+        self.layout = None
+        self.columns = {}
+        self.column_ends = {}
+
+    def _append(self, name, array):
+        if name not in self.files:
+            self.files[name] = open(os.path.join(self.directory, name), 'ab')
+        self.files[name].write(np.ascontiguousarray(array).tobytes())
+
+    def _close_files(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    def write_chunk(self, chunk):
+        geoms = chunk.geometry.values.to_numpy()
+        missing = shapely.is_missing(geoms)
+        self._append('missing.bin', missing)
+        self._write_properties(chunk.drop(columns=chunk.geometry.name))
+
+        present = ~missing & ~shapely.is_empty(geoms)
+        types = {MULTI_TYPES.get(t) for t in shapely.get_type_id(geoms[~missing])}
+        dims = set(np.where(shapely.has_z(geoms[present]), 3, 2).tolist())
+        empty_parts = shapely.is_empty(shapely.get_parts(geoms[present & (shapely.get_type_id(geoms) >= 4)])).any()
+        if self.layout is None and present.any():
+            if len(types) == 1 and None not in types and len(dims) == 1 and not empty_parts:
+                self._start_ragged(types.pop(), dims.pop())
+            else:
+                self._start_wkb()
+        elif self.layout is not None and self.layout['format'] == 'ragged' and (
+                types - {self.layout['geometry_type']} or dims - {self.layout['dims']} or empty_parts):
+            self._ragged_to_wkb()
+
+        if self.layout is not None:
+            self._write_geometries(geoms, missing)
+        self.count += len(geoms)
+
+    def _start_ragged(self, geometry_type, dims):
+        self.layout = {'format': 'ragged', 'geometry_type': int(geometry_type), 'dims': dims,
+                       'levels': {4: 1, 5: 2, 6: 3}[geometry_type]}
+        self.totals = [0] * self.layout['levels']
+        for level in range(self.layout['levels']):
+            self._append(f'offsets_{level}.bin', np.zeros(1, dtype=np.int64))
+        # Features before the first geometry were all missing or empty
+        self._append(f"offsets_{self.layout['levels'] - 1}.bin", np.zeros(self.count, dtype=np.int64))
+        self._append('is_multi.bin', np.zeros(self.count, dtype=bool))
+
+    def _start_wkb(self, empty=None):
+        self.layout = {'format': 'wkb'}
+        self.wkb_total = 0
+        # Features before the first geometry were all missing or empty
+        self._append('wkb_offsets.bin', np.zeros((self.count if empty is None else empty) + 1, dtype=np.int64))
+
+    def _ragged_to_wkb(self):
+        """Re-encode the features written so far as WKB, reading them back chunk by chunk"""
+        self._close_files()
+        written = GeometryCache(self.directory, self._meta(self.count))
+        ragged_files = ['coords.bin', 'is_multi.bin'] + [f'offsets_{level}.bin' for level in range(len(self.totals))]
+        self._start_wkb(0)
+        for start in range(0, self.count, self.chunk_size):
+            self._write_wkb(written.geometries(start, start + self.chunk_size))
+        del written
+        for name in ragged_files:
+            os.remove(os.path.join(self.directory, name))
+
+    def _write_geometries(self, geoms, missing):
+        if self.layout['format'] == 'wkb':
+            self._write_wkb(geoms)
+            return
+        geometry_type = self.layout['geometry_type']
+        promote = {4: shapely.multipoints, 5: shapely.multilinestrings, 6: shapely.multipolygons}[geometry_type]
+        is_multi = shapely.get_type_id(geoms) >= 4
+        # Each non-empty single geometry becomes a multi geometry with one part
+        multi = geoms.copy()
+        empty = missing | shapely.is_empty(geoms)
+        single = ~empty & ~is_multi
+        if single.any():
+            multi[single] = promote(geoms[single], indices=np.arange(single.sum()))
+        multi[empty] = shapely.from_wkt(EMPTY_MULTI[geometry_type])
+        _, coords, offsets = shapely.to_ragged_array(multi, include_z=(self.layout['dims'] == 3))
+        self._append('coords.bin', coords.astype(np.float64))
+        # Chunk offsets start at 0; shift them past everything already written
+        for level, offset in enumerate(offsets):
+            self._append(f'offsets_{level}.bin', offset[1:].astype(np.int64) + self.totals[level])
+            self.totals[level] += int(offset[-1])
+        self._append('is_multi.bin', is_multi)
+
+    def _write_wkb(self, geoms):
+        wkb = shapely.to_wkb(geoms)
+        lengths = np.array([0 if w is None else len(w) for w in wkb], dtype=np.int64)
+        self._append('wkb.bin', np.frombuffer(b''.join(w for w in wkb if w is not None), dtype=np.uint8))
+        self._append('wkb_offsets.bin', self.wkb_total + np.cumsum(lengths))
+        self.wkb_total += int(lengths.sum())
+
+    def _write_properties(self, properties):
+        """
+        Append every property column as JSON cells, each followed by a comma,
+        plus the offset of every cell end, so any slice of rows decodes with
+        one json.loads. A column first seen in a later chunk is backfilled
+        with nulls.
+        """
+        rows = len(properties)
+        values = properties.astype(object).where(properties.notna(), None)
+        for name in list(properties.columns) + [name for name in self.columns if name not in properties.columns]:
+            if name not in self.columns:
+                self.columns[name] = len(self.columns)
+                self.column_ends[name] = 5 * self.count
+                self._append(f'property_{self.columns[name]}_offsets.bin', np.arange(self.count + 1, dtype=np.int64) * 5)
+                self._append(f'property_{self.columns[name]}.bin', np.frombuffer(b'null,' * self.count, dtype=np.uint8))
+            cells = [json.dumps(value) + ',' for value in values[name]] if name in properties.columns else ['null,'] * rows
+            # json.dumps escapes non-ASCII characters, so string and byte lengths agree
+            ends = self.column_ends[name] + np.cumsum([len(cell) for cell in cells], dtype=np.int64)
+            self._append(f'property_{self.columns[name]}.bin', np.frombuffer(''.join(cells).encode('ascii'), dtype=np.uint8))
+            self._append(f'property_{self.columns[name]}_offsets.bin', ends)
+            self.column_ends[name] = int(ends[-1]) if rows else self.column_ends[name]
+
+    def _meta(self, count):
+        layout = self.layout or {'format': 'wkb'}
+        return {'version': CACHE_VERSION, 'features': count, **layout,
+                'columns': sorted(self.columns, key=self.columns.get)}
+
+    def finish(self):
+        """Write what is left and return the layout of the cache for meta.json"""
+        if 'id' not in self.columns:
+            self._write_properties(pd.DataFrame({'id': []}))
+        if self.layout is None:
+            self._start_wkb()
+        self._close_files()
+        return self._meta(self.count)
+
+
+def build_cache(path, member=None, cache_dir=CACHE_DIR, chunk_size=10000):
+    """
+    Convert a GeoJSON file into the binary cache, one chunk at a time: one
+    flat coordinate array plus the offset arrays of shapely.to_ragged_array,
+    and every property column as JSON cells with their offsets, all as raw
+    files that are memory-mapped on load. Single geometries are stored as
+    their multi type and restored on load. Files mixing points, lines and
+    polygons are stored as WKB instead.
+    """
+    directory = cache_path(path, member, cache_dir)
+    stat = _source_stat(path)
+    sha256 = file_digest(path)
+
+    tmp = directory + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    writer = _CacheWriter(tmp, chunk_size)
+    members = {}
+    for chunk in iter_feature_chunks(path, chunk_size, member, members):
+        writer.write_chunk(chunk)
+    layout = writer.finish()
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({**layout, 'source': path, 'member': member, 'sha256': sha256, 'members': members, **stat},
+                  f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+    return directory
+
+
+class GeometryCache:
+    """
+    A cache opened with every array memory-mapped, so opening is independent
+    of the dataset size; geometries and properties are only built for the
+    rows asked for.
+    """
+
+    def __init__(self, directory, meta=None):
+        self.directory = directory
+        if meta is None:
+            with open(os.path.join(directory, 'meta.json')) as f:
+                meta = json.load(f)
+        self.meta = meta
+        self.missing = self._load('missing.bin', bool)
+        if self.meta['format'] == 'ragged':
+            self.coords = self._load('coords.bin', np.float64).reshape(-1, self.meta['dims'])
+            self.offsets = [self._load(f'offsets_{level}.bin', np.int64) for level in range(self.meta['levels'])]
+            self.is_multi = self._load('is_multi.bin', bool)
+        else:
+            self.wkb = self._load('wkb.bin', np.uint8)
+            self.wkb_offsets = self._load('wkb_offsets.bin', np.int64)
+        self.columns = self.meta['columns']
+
+    def _load(self, name, dtype):
+        path = os.path.join(self.directory, name)
+        # Empty files can't be memory-mapped
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return self.meta['features']
+
+    def read_properties(self, start=0, stop=None, columns=None):
+        """DataFrame of the given property columns (all by default) of features start..stop"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        data = {}
+        for name in (self.columns if columns is None else columns):
+            k = self.columns.index(name)
+            offsets = self._load(f'property_{k}_offsets.bin', np.int64)
+            cells = self._load(f'property_{k}.bin', np.uint8)[offsets[start]:offsets[stop]].tobytes()
+            data[name] = pd.Series(json.loads('[' + cells[:-1].decode('ascii') + ']'), dtype=None)
+        return pd.DataFrame(data, index=range(stop - start))
+
+    def geometries(self, start=0, stop=None):
+        """Shapely geometries of features start..stop"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if self.meta['format'] == 'wkb':
+            offsets = self.wkb_offsets[start:stop + 1]
+            buffer = self.wkb[offsets[0]:offsets[-1]].tobytes()
+            base = offsets[0]
+            geoms = shapely.from_wkb([buffer[a - base:b - base] or None for a, b in zip(offsets[:-1], offsets[1:])])
+        else:
+            # Slice the offset arrays from the outermost level inwards, rebasing each to 0
+            lo, hi = start, stop
+            offsets = []
+            for offset in reversed(self.offsets):
+                part = np.asarray(offset[lo:hi + 1])
+                offsets.append(part - part[0])
+                lo, hi = part[0], part[-1]
+            geoms = shapely.from_ragged_array(self.meta['geometry_type'], self.coords[lo:hi], tuple(reversed(offsets)))
+            self._restore_singles(geoms, ~np.asarray(self.is_multi[start:stop]))
+        geoms[np.asarray(self.missing[start:stop])] = None
+        return geoms
+
+    def take(self, indices):
+        """Shapely geometries of the features at the given positions, in that order"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.meta['format'] == 'wkb':
+            return shapely.from_wkb([self.wkb[self.wkb_offsets[i]:self.wkb_offsets[i + 1]].tobytes() or None
+                                     for i in indices])
+        # Gather the selected ranges level by level, from the outermost offsets inwards
+        selected = indices
+        offsets = []
+        for offset in reversed(self.offsets):
+            starts, stops = np.asarray(offset[selected]), np.asarray(offset[selected + 1])
+            counts = stops - starts
+            offsets.append(np.concatenate([[0], np.cumsum(counts)]))
+            selected = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(counts.sum())
+        geoms = shapely.from_ragged_array(self.meta['geometry_type'], np.asarray(self.coords[selected]),
+                                          tuple(reversed(offsets)))
+        self._restore_singles(geoms, ~np.asarray(self.is_multi[indices]))
+        geoms[np.asarray(self.missing[indices])] = None
+        return geoms
+
+    def _restore_singles(self, geoms, single):
+        """Turn the stored multi geometries of single features back into their first part"""
+        parts = shapely.get_geometry(geoms[single], 0)
+        # Empty single geometries were stored as an empty multi geometry, which has no first part
+        parts[shapely.is_missing(parts)] = shapely.from_wkt(EMPTY_SINGLE[self.meta['geometry_type']])
+        geoms[single] = parts
+
+    def iter_chunks(self, chunk_size=10000):
+        """GeoDataFrame chunks with a global index and an "id" column, like iter_feature_chunks"""
+        for start in range(0, len(self), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            chunk = self.read_properties(start, stop)
+            chunk.index = range(start, stop)
+            yield gpd.GeoDataFrame(chunk, geometry=self.geometries(start, stop))
+
+
+def open_cache(path, member=None, cache_dir=CACHE_DIR):
+    """Open the cache of a source file, building or rebuilding it if needed"""
+    if not is_valid(path, member, cache_dir):
+        print(f"Building geometry cache for {path}...")
+        build_cache(path, member, cache_dir)
+    return GeometryCache(cache_path(path, member, cache_dir))
+
+
+def cached_feature_chunks(path, chunk_size=10000, member=None, members=None, cache_dir=CACHE_DIR):
+    """Drop-in replacement for iter_feature_chunks that reads from the cache"""
+    cache = open_cache(path, member, cache_dir)
+    if members is not None:
+        members.update(cache.meta['members'])
+    return cache.iter_chunks(chunk_size)
+
+
+def read_geodataframe(path, member=None, cache_dir=CACHE_DIR):
+    """The whole file as one GeoDataFrame (with an "id" column), read from the cache"""
+    cache = open_cache(path, member, cache_dir)
+    return gpd.GeoDataFrame(cache.read_properties(), geometry=cache.geometries())
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python geometry_cache.py <file.json|archive.zip> [member]")
+        sys.exit(1)
+
+    source, source_member = sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None
+    start = time.time()
+    cache = open_cache(source, source_member)
+    print(f"Opened cache of {len(cache)} features in {time.time() - start:.3f} seconds ({cache.directory})")
+    start = time.time()
+    geoms = cache.geometries()
+    print(f"Built {len(geoms)} geometries in {time.time() - start:.3f} seconds")
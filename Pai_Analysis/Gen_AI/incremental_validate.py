@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from geojson_stream import iter_feature_chunks
+from topology_checks import find_overlaps
+from triage import triage_geometries, CLOSE_VERTICES_THRESHOLD, SMALL_AREA_THRESHOLD
+
+STATE_DIR = 'ValidationState'
+
+# Bumped whenever the checks or the layout of the state file change
+STATE_VERSION = 1
+
+# Orientation convention of analyze_topology.py
+EXTERIOR = 'cw'
+
+FEATURE_COLUMNS = ['hash', 'is_valid', 'validity_reason', 'is_simple', 'orientation_issues',
+                   'duplicate_vertices', 'close_vertices', 'min_vertex_distance', 'is_small']
+OVERLAP_COLUMNS = ['id_1', 'id_2', 'intersection_area', 'error']
+
+
+def state_path(path, state_dir=STATE_DIR):
+    """
+    State file kept for one dataset. The name carries a hash of the absolute
+    path (like geometry_cache.cache_path), so different files with the same
+    name get different states.
+    """
+    key = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(state_dir, re.sub(r'[^\w.-]', '_', os.path.basename(path)) + '_' + key + '.pkl')
+
+
+def load_state(state_file):
+    """Previous (features, overlaps), or empty tables when there is no usable state"""
+    if os.path.exists(state_file):
+        state = pd.read_pickle(state_file)
+        if state.get('version') == STATE_VERSION:
+            return state['features'], state['overlaps']
+    return pd.DataFrame(columns=FEATURE_COLUMNS), pd.DataFrame(columns=OVERLAP_COLUMNS)
+
+
+def save_state(state_file, features, overlaps):
+    os.makedirs(os.path.dirname(state_file) or '.', exist_ok=True)
+    pd.to_pickle({'version': STATE_VERSION, 'features': features, 'overlaps': overlaps}, state_file + '.tmp')
+    os.replace(state_file + '.tmp', state_file)
+
+
+def feature_keys(ids, hashes):
+    """
+    Feature ids as strings, used to match features between runs. Features
+    without an id fall back to their content hash (so they still match when
+    other features are added or removed before them) and repeated keys get an
+    occurrence suffix, so every key is unique.
+    """
+    keys = pd.Series([f"#{content:016x}" if feature_id is None or feature_id != feature_id else str(feature_id)
+                      for feature_id, content in zip(ids, hashes)])
+    occurrence = keys.groupby(keys).cumcount()
+    repeated = occurrence > 0
+    keys[repeated] = keys[repeated] + '#' + occurrence[repeated].astype(str)
+    return keys.to_numpy()
+
+
+def read_dataset(path, chunk_size=10000, read_chunks=iter_feature_chunks):
+    """Feature keys, geometries and content hashes (of the WKB) of every feature"""
+    ids, geometries = [], []
+    for chunk in read_chunks(path, chunk_size):
+        ids.append(chunk['id'].to_numpy(dtype=object))
+        geometries.append(chunk.geometry.values.to_numpy())
+    if not geometries:
+        return np.array([], dtype=object), np.array([], dtype=object), np.array([], dtype=np.uint64)
+    geoms = np.concatenate(geometries)
+    hashes = pd.util.hash_array(shapely.to_wkb(geoms))
+    return feature_keys(np.concatenate(ids), hashes), geoms, hashes
+
+
+def check_geometries(geoms, close_threshold=CLOSE_VERTICES_THRESHOLD, small_area_threshold=SMALL_AREA_THRESHOLD):
+    """Validity, simplicity, orientation, precision and area checks of analyze_topology.py"""
+    results = triage_geometries(geoms, exterior=EXTERIOR, close_threshold=close_threshold,
+                                small_area_threshold=small_area_threshold)
+    return results[FEATURE_COLUMNS[1:]]
+
+
+def incremental_validate(path, state_file=None, chunk_size=10000, read_chunks=iter_feature_chunks):
+    """
+    Validate a dataset, re-checking only what changed since the previous run.
+
+    Features are matched to the previous run by id and compared by a hash of
+    their geometry. Added and changed features, plus the unchanged features
+    whose geometry intersects one of them (their spatial neighbours), get the
+    per-feature checks again; every other feature keeps its stored result.
+    Overlaps are only recomputed for pairs involving a re-checked feature,
+    and pairs of removed or changed features are dropped. On the first run
+    (or when the state file is missing) everything is checked.
+
+    Returns (features, overlaps, changes): the check results of every
+    feature indexed by id, the overlapping pairs by id and a dict with the
+    added, changed, removed, neighbour and re-checked counts.
+    """
+    state_file = state_file or state_path(path)
+    keys, geoms, hashes = read_dataset(path, chunk_size, read_chunks)
+    previous, previous_overlaps = load_state(state_file)
+
+    old_hash = previous['hash'].reindex(keys).to_numpy()
+    added = pd.isna(old_hash)
+    changed = ~added & (old_hash != hashes)
+    removed = previous.index.difference(pd.Index(keys))
+    dirty = added | changed
+
+    # Unchanged features touching an added or changed feature are re-checked with it
+    tree = STRtree(geoms)
+    recheck = dirty.copy()
+    if dirty.any():
+        _, touched = tree.query(geoms[dirty], predicate='intersects')
+        recheck[touched] = True
+    neighbours = recheck & ~dirty
+
+    features = previous.reindex(keys)
+    features['hash'] = hashes
+    if recheck.any():
+        checks = check_geometries(geoms[recheck])
+        checks.index = keys[recheck]
+        features.loc[keys[recheck], FEATURE_COLUMNS[1:]] = checks
+    features = features.astype({'is_valid': bool, 'is_simple': bool, 'is_small': bool, 'orientation_issues': int,
+                                'duplicate_vertices': int, 'close_vertices': int,
+                                'min_vertex_distance': float})
+    features.index.name = 'id'
+
+    # Pairs involving a re-checked feature are recomputed against everything they may overlap
+    stale = set(keys[recheck]) | set(removed)
+    keep = ~(previous_overlaps['id_1'].isin(stale) | previous_overlaps['id_2'].isin(stale))
+    overlaps = [previous_overlaps[keep]]
+    if recheck.any():
+        _, candidates = tree.query(geoms[recheck], predicate='intersects')
+        local = np.union1d(np.flatnonzero(recheck), candidates)
+        pairs = find_overlaps(pd.Series(geoms[local], index=keys[local]))
+        pairs = pairs[pairs['index_1'].isin(stale) | pairs['index_2'].isin(stale)]
+        overlaps.append(pairs.rename(columns={'index_1': 'id_1', 'index_2': 'id_2'}))
+    overlaps = pd.concat(overlaps, ignore_index=True)[OVERLAP_COLUMNS]
+
+    save_state(state_file, features, overlaps)
+    changes = {
+        'features': len(keys),
+        'added': int(added.sum()),
+        'changed': int(changed.sum()),
+        'removed': len(removed),
+        'neighbours': int(neighbours.sum()),
+        'rechecked': int(recheck.sum()),
+    }
+    return features, overlaps, changes
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python incremental_validate.py <file.json|archive.zip> [state file]")
+        sys.exit(1)
+
+    start = time.time()
+    features, overlaps, changes = incremental_validate(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"{changes['features']} features: {changes['added']} added, {changes['changed']} changed, "
+          f"{changes['removed']} removed since the last run")
+    print(f"Re-checked {changes['rechecked']} features ({changes['neighbours']} of them spatial neighbours) "
+          f"in {time.time() - start:.2f} seconds")
+
+    print("\n" + "=" * 50)
+    print("SUMMARY OF TOPOLOGICAL ISSUES:")
+    print(f"1. Invalid geometries: {int((~features['is_valid']).sum())}")
+    print(f"2. Self-intersections: {int((~features['is_simple']).sum())}")
+    print(f"3. Ring orientation issues: {int(features['orientation_issues'].sum())}")
+    print(f"4. Very close vertices: {int(features['close_vertices'].sum())}")
+    print(f"5. Duplicate vertices: {int(features['duplicate_vertices'].sum())}")
+    print(f"6. Very small geometries: {int(features['is_small'].sum())}")
+    print(f"7. Overlapping geometries: {int(overlaps['error'].isna().sum())}")
+    print("=" * 50)
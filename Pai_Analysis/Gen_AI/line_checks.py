@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from geojson_stream import iter_feature_chunks
+from topology_checks import _as_geometry_array
+
+# Consecutive vertices closer than this (but not equal) are too close
+CLOSE_VERTICES_THRESHOLD = 1e-8
+
+LINE_TYPES = ('LineString', 'MultiLineString')
+
+
+def line_parts(geoms):
+    """
+    Explode lines and multilines into their linestrings. Returns the parts
+    plus, for every part, the position of its feature in geoms and the part
+    number within the feature. Other geometry types are left out.
+    """
+    parts, part_feature = shapely.get_parts(geoms, return_index=True)
+    is_line = shapely.get_type_id(parts) == 1
+    parts, part_feature = parts[is_line], part_feature[is_line]
+    part_number = np.arange(len(parts)) - np.searchsorted(part_feature, part_feature)
+    return parts, part_feature, part_number
+
+
+def _overlapping_segments(starts, coords, seg_part):
+    """
+    Find the pairs of segments of the same line that share a stretch of line
+    (not just a point), such as a line doubling back on itself. Candidates
+    come from a bounding-box query; a pair overlaps when both ends of one
+    segment lie on the line through the other and their extents along it
+    overlap, all tested with array arithmetic. Returns the part of each
+    overlapping pair.
+    """
+    if len(starts) < 2:
+        return np.array([], dtype=int)
+    a, b = coords[starts], coords[starts + 1]
+    boxes = shapely.box(*np.minimum(a, b).T, *np.maximum(a, b).T)
+    left, right = STRtree(boxes).query(boxes)
+    keep = (left < right) & (seg_part[left] == seg_part[right])
+    left, right = left[keep], right[keep]
+
+    direction = b[left] - a[left]
+    length2 = (direction ** 2).sum(axis=1)
+    cross = lambda p: direction[:, 0] * (p[:, 1] - a[left, 1]) - direction[:, 1] * (p[:, 0] - a[left, 0])
+    tolerance = 1e-12 * np.maximum(length2, 1e-300)
+    collinear = (np.abs(cross(a[right])) <= tolerance) & (np.abs(cross(b[right])) <= tolerance) & (length2 > 0)
+
+    # Positions of the other segment's ends along this one (0 at a, 1 at b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t1 = ((a[right] - a[left]) * direction).sum(axis=1) / length2
+        t2 = ((b[right] - a[left]) * direction).sum(axis=1) / length2
+    shared = np.minimum(np.maximum(t1, t2), 1) - np.maximum(np.minimum(t1, t2), 0)
+    return seg_part[left[collinear & (shared > 1e-12)]]
+
+
+def line_checks(geometries, close_threshold=CLOSE_VERTICES_THRESHOLD):
+    """
+    Run the line-geometry checks on every (multi)linestring at once.
+
+    All parts are flattened into one coordinate array and every segment is
+    examined in vectorised passes over it:
+
+    - zero_length_segments: consecutive repeated vertices (distance 0)
+    - close_vertices: consecutive vertices closer than close_threshold
+    - repeated_vertices: a vertex visited again later on the same part
+      (other than the end point of a closed line)
+    - self_overlaps: pairs of segments of a part sharing a stretch of line
+    - degenerate_parts: parts with fewer than two distinct vertices
+    - is_simple: the line does not cross or touch itself
+
+    Returns a DataFrame indexed like the input, with one row per line
+    feature; features of other geometry types are left out.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    is_line = np.isin(shapely.get_type_id(geoms), (1, 5))
+    parts, part_feature, _ = line_parts(geoms)
+
+    counts = shapely.get_num_coordinates(parts)
+    coords = shapely.get_coordinates(parts)
+    part_ids = np.repeat(np.arange(len(parts)), counts)
+    n = len(geoms)
+
+    # Segment k joins coordinate k to k + 1 when both are on the same part
+    starts = np.flatnonzero(part_ids[:-1] == part_ids[1:])
+    seg_part = part_ids[starts]
+    dist = np.hypot(*(coords[starts + 1] - coords[starts]).T)
+    seg_feature = part_feature[seg_part]
+    zero = np.bincount(seg_feature, weights=dist == 0, minlength=n).astype(int)
+    close = np.bincount(seg_feature, weights=(dist > 0) & (dist < close_threshold), minlength=n).astype(int)
+
+    # Distinct vertices per part, and how often each one occurs
+    keys = np.ascontiguousarray(np.column_stack([part_ids.astype(float), coords]))
+    keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * 3))).ravel()
+    _, first, occurrences = np.unique(keys, return_index=True, return_counts=True)
+    distinct = np.bincount(part_ids[first], minlength=len(parts))
+    revisits = np.bincount(part_ids[first], weights=occurrences - 1, minlength=len(parts))
+    zero_per_part = np.bincount(seg_part, weights=dist == 0, minlength=len(parts))
+    closed = shapely.is_closed(parts) & (counts > 2)
+    repeated = np.maximum(revisits - zero_per_part - closed, 0)
+
+    # Only lines that are not simple can overlap themselves
+    simple = shapely.is_simple(geoms)
+    suspect = ~simple[part_feature[seg_part]]
+    overlap_parts = _overlapping_segments(starts[suspect], coords, seg_part[suspect])
+
+    result = pd.DataFrame({
+        'parts': np.bincount(part_feature, minlength=n),
+        'vertices': np.bincount(part_feature, weights=counts, minlength=n).astype(int),
+        'length': shapely.length(geoms),
+        'zero_length_segments': zero,
+        'close_vertices': close,
+        'repeated_vertices': np.bincount(part_feature, weights=repeated, minlength=n).astype(int),
+        'self_overlaps': np.bincount(part_feature[overlap_parts], minlength=n),
+        'degenerate_parts': np.bincount(part_feature, weights=distinct < 2, minlength=n).astype(int),
+        'is_simple': simple,
+    }, index=labels)
+    return result[is_line]
+
+
+def line_issues(results):
+    """Boolean mask of the line features with at least one issue"""
+    return ((results['zero_length_segments'] > 0) | (results['close_vertices'] > 0)
+            | (results['repeated_vertices'] > 0) | (results['self_overlaps'] > 0)
+            | (results['degenerate_parts'] > 0) | ~results['is_simple'])
+
+
+def check_line_file(path, chunk_size=10000, member=None, close_threshold=CLOSE_VERTICES_THRESHOLD):
+    """
+    Stream a GeoJSON file once and run line_checks on every chunk. Returns
+    the results of all line features (with their "id") and the number of
+    features of each geometry type, so files without lines can be told apart.
+    """
+    results = []
+    geometry_types = pd.Series(dtype='int64')
+    for chunk in iter_feature_chunks(path, chunk_size, member):
+        geometry_types = geometry_types.add(chunk.geometry.type.value_counts(), fill_value=0)
+        checks = line_checks(chunk.geometry, close_threshold)
+        checks.insert(0, 'id', chunk.loc[checks.index, 'id'].values)
+        results.append(checks)
+    results = pd.concat(results) if results else line_checks([])
+    return results, geometry_types.astype(int)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python line_checks.py <file.json|archive.zip> [member]")
+        sys.exit(1)
+
+    start = time.time()
+    results, geometry_types = check_line_file(sys.argv[1], member=sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Checked {int(geometry_types.sum())} features in {time.time() - start:.2f} seconds")
+    print(f"Geometry types: {geometry_types.to_dict()}")
+    if results.empty:
+        print("No LineString or MultiLineString features found")
+        sys.exit(0)
+
+    flagged = results[line_issues(results)]
+    print(f"\nLINE GEOMETRY CHECK ({len(results)} line features):")
+    print(f"   - Zero-length segments: {int(results['zero_length_segments'].sum())}")
+    print(f"   - Very close vertices: {int(results['close_vertices'].sum())}")
+    print(f"   - Repeated vertices: {int(results['repeated_vertices'].sum())}")
+    print(f"   - Self-overlapping segment pairs: {int(results['self_overlaps'].sum())}")
+    print(f"   - Degenerate parts: {int(results['degenerate_parts'].sum())}")
+    print(f"   - Non-simple lines: {int((~results['is_simple']).sum())}")
+    print(f"   - Features with issues: {len(flagged)} out of {len(results)}")
+    for row in flagged.head(10).itertuples():
+        print(f"   - Feature {row.id}: {row.zero_length_segments} zero-length, {row.repeated_vertices} repeated, "
+              f"{row.self_overlaps} overlapping, {row.degenerate_parts} degenerate, simple: {row.is_simple}")
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+from response_cache import cache_key
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Async token bucket rate limiter. Allows bursts of up to `capacity`
+    requests, refilled at `rate` requests per second.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def has_content(text):
+    """
+    Whether a chat-completions response body carries an answer: a non-empty
+    choices[0].message.content. OpenRouter also answers some provider errors
+    with status 200 and an {"error": ...} body or no choices at all.
+    """
+    try:
+        content = json.loads(text)['choices'][0]['message']['content']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return False
+    return isinstance(content, str) and content.strip() != ''
+
+
+async def post_chat_completion(session, url, headers, payload, bucket, max_retries=5, backoff=1.0):
+    """
+    Send one chat-completions request, retrying 429/5xx responses and network
+    errors with exponential backoff (honouring Retry-After when given).
+    Returns a dict with the final status code, raw response text, error
+    message (if any), number of attempts and total latency in seconds.
+    """
+    start = time.monotonic()
+    status, text, error = None, '', None
+    for attempt in range(1, max_retries + 2):
+        await bucket.acquire()
+        try:
+            async with session.post(url, headers=headers, json=payload) as response:
+                status = response.status
+                text = await response.text()
+                retry_after = response.headers.get('Retry-After')
+            error = None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status, text, error, retry_after = None, '', f"Request error: {e}", None
+
+        if status is not None and status not in RETRY_STATUSES:
+            break
+        if attempt > max_retries:
+            break
+
+        delay = backoff * 2 ** (attempt - 1) * (0.5 + random.random())
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        await asyncio.sleep(delay)
+
+    return {
+        'status': status,
+        'text': text,
+        'error': error,
+        'attempts': attempt,
+        'latency': time.monotonic() - start,
+        'cached': False,
+    }
+
+
+async def run_requests(jobs, api_key, url=OPENROUTER_URL, requests_per_second=2.0,
+                       per_model_concurrency=4, max_connections=32, timeout=300, max_retries=5, cache=None,
+                       params=None):
+    """
+    Run every job concurrently and return {job key: result}.
+
+    Each job is a (key, model, messages) tuple. All requests share one
+    connection pool and one token bucket; the number of requests in flight for
+    the same model is capped by per_model_concurrency. When a ResponseCache is
+    given, cached responses are returned without any network call and new
+    successful responses (status 200 with message content, see has_content)
+    are added to it, so a transient error payload is never replayed. params holds extra request fields
+    (such as response_format) sent with every request.
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    bucket = TokenBucket(requests_per_second)
+    semaphores = {}
+    connector = aiohttp.TCPConnector(limit=max_connections)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        async def run_job(key, model, messages):
+            if cache is not None:
+                entry_key = cache_key(model, messages, params)
+                text = cache.get(entry_key)
+                if text is not None:
+                    return key, {'status': 200, 'text': text, 'error': None, 'attempts': 0, 'latency': 0.0, 'cached': True}
+
+            semaphore = semaphores.setdefault(model, asyncio.Semaphore(per_model_concurrency))
+            async with semaphore:
+                payload = {"model": model, "messages": messages, **(params or {})}
+                result = await post_chat_completion(session, url, headers, payload, bucket, max_retries)
+
+            if cache is not None and result['status'] == 200 and has_content(result['text']):
+                cache.put(entry_key, result['text'], model)
+            return key, result
+
+        results = await asyncio.gather(*(run_job(*job) for job in jobs))
+    return dict(results)
+
+
+def run_requests_sync(jobs, api_key, **kwargs):
+    """Blocking wrapper around run_requests for use from plain scripts"""
+    return asyncio.run(run_requests(jobs, api_key, **kwargs))
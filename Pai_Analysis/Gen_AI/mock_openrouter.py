@@ -0,0 +1,98 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+from aiohttp import web
+
+ISSUES = ["Self-intersections", "Invalid geometries", "Ring orientation issues", "Precision/coordinate issues"]
+JSON_KEYS = ["self_intersections", "invalid_geometries", "ring_orientation_issues", "precision_coordinate_issues"]
+
+
+def fake_answer(model, user_prompt, structured=False):
+    """
+    Build a deterministic answer in the format requested by the system prompt,
+    or as JSON when the request asked for structured output.
+    """
+    # Plain GeoJSON prompts carry "id" members, batched compact prompts FEATURE headers
+    feature_ids = (re.findall(r'"id":\s*"?([\w.]+)"?', user_prompt)
+                   or re.findall(r'^FEATURE ([\w.]+)', user_prompt, re.MULTILINE) or ["unknown"])
+    if structured:
+        answers = []
+        for feature_id in feature_ids:
+            digest = hashlib.sha256(f"{model}:{feature_id}".encode()).digest()
+            answer = {"id": feature_id}
+            for i, key in enumerate(JSON_KEYS):
+                answer[key] = bool(digest[i] % 2)
+            answer["explanation"] = "Mock explanation generated by mock_openrouter.py."
+            answers.append(answer)
+        return json.dumps({"features": answers})
+
+    lines = []
+    for feature_id in feature_ids:
+        digest = hashlib.sha256(f"{model}:{feature_id}".encode()).digest()
+        lines.append(f"FEATURE {feature_id}:")
+        for i, issue in enumerate(ISSUES):
+            lines.append(f"{issue}: {'Yes' if digest[i] % 2 else 'No'}")
+        lines.append("Mock explanation generated by mock_openrouter.py.\n")
+    return "\n".join(lines)
+
+
+def make_app(error_rate=0.0, rate_limit_rate=0.0, latency=0.05):
+    """
+    Create an aiohttp app that mimics the OpenRouter chat-completions endpoint.
+    A fraction of requests fail with 429 or 500 so retry logic can be exercised.
+    """
+    app = web.Application()
+    app['requests'] = 0
+
+    async def chat_completions(request):
+        app['requests'] += 1
+        payload = await request.json()
+        await asyncio.sleep(latency)
+
+        roll = random.random()
+        if roll < rate_limit_rate:
+            return web.json_response({"error": {"message": "Rate limit exceeded", "code": 429}},
+                                     status=429, headers={"Retry-After": "0.1"})
+        if roll < rate_limit_rate + error_rate:
+            return web.json_response({"error": {"message": "Internal error", "code": 500}}, status=500)
+
+        model = payload.get("model", "mock")
+        user_prompt = next((m["content"] for m in payload.get("messages", []) if m["role"] == "user"), "")
+        content = fake_answer(model, user_prompt, structured="response_format" in payload)
+        return web.json_response({
+            "id": f"gen-mock-{app['requests']}",
+            "provider": "Mock",
+            "model": model,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content},
+            }],
+            "usage": {
+                "prompt_tokens": sum(len(m["content"]) for m in payload.get("messages", [])) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (sum(len(m["content"]) for m in payload.get("messages", [])) + len(content)) // 4,
+            },
+        })
+
+    app.router.add_post("/api/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenRouter chat-completions API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds to wait before answering")
+    args = parser.parse_args()
+
+    print(f"Mock OpenRouter listening on http://localhost:{args.port}/api/v1/chat/completions")
+    web.run_app(make_app(args.error_rate, args.rate_limit_rate, args.latency), port=args.port, print=None)
@@ -0,0 +1,257 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from geojson_stream import iter_feature_chunks
+from line_checks import line_parts
+from topology_checks import _as_geometry_array, connected_components
+
+# Line ends closer than this (in degrees, about 1 cm) are the same junction
+SNAP_TOLERANCE = 1e-7
+
+# Dangling ends closer than this (in degrees, about 10 m) to another line are near misses
+NEAR_MISS_DISTANCE = 1e-4
+
+# The eight neighbouring cells of the spatial hash, plus the cell itself
+_CELL_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def spatial_hash_pairs(points, queries, tolerance):
+    """
+    Find every pair (query, point) closer than tolerance with a spatial hash.
+    Points are bucketed into square cells of side tolerance and sorted by
+    cell, so the candidates of a query are the points of its own cell and
+    the eight around it, found with binary searches. queries are positions
+    in points. Returns (query positions, point positions), self pairs left out.
+    """
+    if len(points) == 0 or len(queries) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    cells = np.floor(points / tolerance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    height = cells[:, 1].max() + 2
+    keys = cells[:, 0] * height + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    lefts, rights = [], []
+    for dx, dy in _CELL_OFFSETS:
+        neighbour = (cells[queries, 0] + dx) * height + cells[queries, 1] + dy
+        lo = np.searchsorted(sorted_keys, neighbour, side='left')
+        hi = np.searchsorted(sorted_keys, neighbour, side='right')
+        found = hi - lo
+        left = np.repeat(queries, found)
+        # Position of every candidate within its run of the sorted keys
+        run = np.arange(found.sum()) - np.repeat(np.cumsum(found) - found, found)
+        right = order[np.repeat(lo, found) + run]
+        lefts.append(left)
+        rights.append(right)
+    left, right = np.concatenate(lefts), np.concatenate(rights)
+    close = (left != right) & (np.hypot(*(points[left] - points[right]).T) <= tolerance)
+    return left[close], right[close]
+
+
+class LineNetwork:
+    """
+    Graph of a line layer. Vertices with identical coordinates are one node,
+    and line ends are snapped to any node within tolerance. The edges
+    are the segments of the lines, stored in CSR form: the neighbours of
+    node k are indices[indptr[k]:indptr[k + 1]].
+    """
+
+    def __init__(self, geometries, tolerance=SNAP_TOLERANCE):
+        geoms, self.labels = _as_geometry_array(geometries)
+        self.tolerance = tolerance
+        parts, self.part_feature, _ = line_parts(geoms)
+        counts = shapely.get_num_coordinates(parts)
+        parts, self.part_feature, counts = parts[counts >= 2], self.part_feature[counts >= 2], counts[counts >= 2]
+        self.coords = shapely.get_coordinates(parts)
+        self.vertex_part = np.repeat(np.arange(len(parts)), counts)
+        self.part_start = np.cumsum(counts) - counts
+        self.part_end = self.part_start + counts - 1
+
+        # Shared vertices become one node
+        keys = np.ascontiguousarray(self.coords).view(np.dtype((np.void, 16))).ravel()
+        _, first, exact_node = np.unique(keys, return_index=True, return_inverse=True)
+        exact_node = exact_node.ravel()
+        node_xy = self.coords[first]
+
+        # Line ends are snapped to every node within tolerance
+        ends = np.unique(exact_node[np.concatenate([self.part_start, self.part_end])])
+        left, right = spatial_hash_pairs(node_xy, ends, tolerance)
+        snapped = connected_components(len(node_xy), left, right)
+        _, node = np.unique(snapped, return_inverse=True)
+        self.vertex_node = node[exact_node]
+        self.node_count = int(self.vertex_node.max()) + 1 if len(self.vertex_node) else 0
+
+        # Segments, without the ones that collapse onto one node after snapping
+        starts = np.flatnonzero(self.vertex_part[:-1] == self.vertex_part[1:])
+        source, target = self.vertex_node[starts], self.vertex_node[starts + 1]
+        keep = source != target
+        self.segment_start = starts[keep]
+        source, target = source[keep], target[keep]
+
+        # CSR adjacency with both directions of every segment
+        both_source = np.concatenate([source, target])
+        both_target = np.concatenate([target, source])
+        order = np.argsort(both_source, kind='stable')
+        self.indices = both_target[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(both_source, minlength=self.node_count))])
+
+    def degree(self):
+        """Number of segments at every node"""
+        return np.diff(self.indptr)
+
+    def dangles(self):
+        """
+        Line ends that no other segment reaches. Returns a DataFrame with the
+        feature label, part, end ('start' or 'end'), node and coordinates of
+        each dangling end; a line end shared by several lines is reported once.
+        """
+        vertex = np.concatenate([self.part_start, self.part_end])
+        end = np.repeat(['start', 'end'], len(self.part_start))
+        node = self.vertex_node[vertex]
+        dangling = self.degree()[node] == 1
+        vertex, end, node = vertex[dangling], end[dangling], node[dangling]
+        part = self.vertex_part[vertex]
+        return pd.DataFrame({
+            'index': self.labels[self.part_feature[part]],
+            'part': part,
+            'end': end,
+            'node': node,
+            'x': self.coords[vertex, 0],
+            'y': self.coords[vertex, 1],
+            'vertex': vertex,
+        })
+
+    def near_misses(self, dangles=None, max_distance=NEAR_MISS_DISTANCE):
+        """
+        Dangling ends within max_distance of a segment they are not connected to.
+        An 'overshoot' crosses the other line before ending; an 'undershoot'
+        stops short of it. Returns the dangles that are near misses with the
+        kind, the label and part of the other line and the gap distance.
+        """
+        dangles = self.dangles() if dangles is None else dangles
+        columns = list(dangles.columns) + ['kind', 'other_index', 'other_part', 'distance']
+        if dangles.empty or len(self.segment_start) == 0:
+            return pd.DataFrame(columns=columns)
+
+        starts = self.segment_start
+        segments = shapely.linestrings(np.stack([self.coords[starts], self.coords[starts + 1]], axis=1))
+        points = shapely.points(dangles[['x', 'y']].to_numpy())
+        which, segment = STRtree(segments).query(points, predicate='dwithin', distance=max_distance)
+
+        # The last segment of every dangling line, from its neighbouring vertex to the end
+        vertex = dangles['vertex'].to_numpy()
+        inner = np.where(dangles['end'].to_numpy() == 'start', vertex + 1, vertex - 1)
+        tails = shapely.linestrings(np.stack([self.coords[inner], self.coords[vertex]], axis=1))
+
+        # Segments joined to that last segment are not a miss
+        segment_nodes = np.stack([self.vertex_node[starts[segment]], self.vertex_node[starts[segment] + 1]])
+        joined = ((segment_nodes == dangles['node'].to_numpy()[which]).any(axis=0)
+                  | (segment_nodes == self.vertex_node[inner][which]).any(axis=0))
+        which, segment = which[~joined], segment[~joined]
+        if len(which) == 0:
+            return pd.DataFrame(columns=columns)
+
+        # A dangle overshoots when its last segment reaches any of the other lines (within the snap tolerance)
+        reaches = shapely.dwithin(tails[which], segments[segment], self.tolerance)
+        crosses = np.bincount(which, weights=reaches, minlength=len(dangles)) > 0
+
+        # Keep the closest segment of every dangle
+        distance = shapely.distance(points[which], segments[segment])
+        order = np.lexsort((distance, which))
+        which, segment, distance = which[order], segment[order], distance[order]
+        first = np.concatenate([[True], which[1:] != which[:-1]])
+        which, segment, distance = which[first], segment[first], distance[first]
+        crosses = crosses[which]
+
+        result = dangles.iloc[which].reset_index(drop=True)
+        result['kind'] = np.where(crosses, 'overshoot', 'undershoot')
+        result['other_part'] = self.vertex_part[starts[segment]]
+        result['other_index'] = self.labels[self.part_feature[result['other_part'].to_numpy()]]
+        result['distance'] = distance
+        return result
+
+    def components(self, near_misses=None):
+        """
+        Connected component of every line part, numbered by size (0 is the
+        largest). Parts are joined when they share a node; with near_misses
+        the near-miss gaps are treated as joined too. Returns a DataFrame
+        with the feature label, part and component.
+        """
+        # Every part is linked to the first part seen at each of its nodes
+        order = np.argsort(self.vertex_node, kind='stable')
+        node_sorted = self.vertex_node[order]
+        first_at_node = order[np.searchsorted(node_sorted, node_sorted)]
+        left = self.vertex_part[first_at_node]
+        right = self.vertex_part[order]
+        if near_misses is not None and len(near_misses):
+            left = np.concatenate([left, near_misses['part'].to_numpy(dtype=np.int64)])
+            right = np.concatenate([right, near_misses['other_part'].to_numpy(dtype=np.int64)])
+        labels = connected_components(len(self.part_start), left, right)
+        _, component, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        rank = np.empty(len(sizes), dtype=np.int64)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+        return pd.DataFrame({
+            'index': self.labels[self.part_feature],
+            'part': np.arange(len(self.part_start)),
+            'component': rank[component.ravel()],
+        })
+
+
+def read_lines(path, chunk_size=10000, member=None):
+    """Line geometries (and their feature ids as index) of a GeoJSON file, streamed in chunks"""
+    geometries = []
+    for chunk in iter_feature_chunks(path, chunk_size, member):
+        lines = chunk[np.isin(shapely.get_type_id(chunk.geometry.values), (1, 5))]
+        geometries.append(pd.Series(lines.geometry.values, index=lines['id'].to_numpy()))
+    return pd.concat(geometries) if geometries else pd.Series([], dtype=object)
+
+
+def analyze_network(geometries, tolerance=SNAP_TOLERANCE, near_miss_distance=NEAR_MISS_DISTANCE):
+    """Build the network and return (network, dangles, near misses, components)"""
+    network = LineNetwork(geometries, tolerance)
+    dangles = network.dangles()
+    near_misses = network.near_misses(dangles, near_miss_distance)
+    components = network.components()
+    return network, dangles, near_misses, components
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python network_topology.py <file.json|archive.zip> [member] [snap tolerance] [near miss distance]")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    source_member = sys.argv[2] if len(sys.argv) > 2 else None
+    tolerance = float(sys.argv[3]) if len(sys.argv) > 3 else SNAP_TOLERANCE
+    near_miss_distance = float(sys.argv[4]) if len(sys.argv) > 4 else NEAR_MISS_DISTANCE
+
+    start = time.time()
+    lines = read_lines(source, member=source_member)
+    print(f"Read {len(lines)} line features in {time.time() - start:.2f} seconds")
+    if lines.empty:
+        print("No LineString or MultiLineString features found")
+        sys.exit(0)
+
+    start = time.time()
+    network, dangles, near_misses, components = analyze_network(lines, tolerance, near_miss_distance)
+    print(f"Built the network ({network.node_count} nodes, {len(network.indices) // 2} segments) and "
+          f"analysed it in {time.time() - start:.2f} seconds")
+
+    sizes = components['component'].value_counts().sort_index()
+    joined = network.components(near_misses)['component'].nunique()
+    print(f"\nNETWORK TOPOLOGY CHECK (snap tolerance {tolerance}, near misses within {near_miss_distance}):")
+    print(f"   - Dangling line ends: {len(dangles)}")
+    print(f"   - Undershoots: {int((near_misses['kind'] == 'undershoot').sum())}")
+    print(f"   - Overshoots: {int((near_misses['kind'] == 'overshoot').sum())}")
+    print(f"   - Connected components: {len(sizes)} ({joined} if the near misses were joined)")
+    print(f"   - Largest component: {sizes.iloc[0]} of {len(components)} line parts")
+    print(f"   - Isolated single-part components: {int((sizes == 1).sum())}")
+    for row in near_misses.head(10).itertuples():
+        print(f"   - {row.kind.capitalize()} at feature {row.index} ({row.x:.7f}, {row.y:.7f}): "
+              f"{row.distance:.2e} from feature {row.other_index}")
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from geojson_stream import iter_feature_chunks
+from topology_checks import sliver_check, SLIVER_COMPACTNESS, SLIVER_THINNESS
+
+SMALL_AREA_THRESHOLD = 1e-10
+
+
+def check_wkb_chunk(index, wkb, small_area_threshold=SMALL_AREA_THRESHOLD, max_compactness=SLIVER_COMPACTNESS,
+                    max_thinness=SLIVER_THINNESS):
+    """
+    Run the per-feature topology checks on one chunk of WKB-encoded geometries.
+    This runs inside a worker process; geometries travel between processes as
+    WKB bytes, which are much cheaper to pickle than shapely objects.
+    """
+    geoms = shapely.from_wkb(wkb)
+    valid = shapely.is_valid(geoms)
+
+    # explain_validity is only needed for the (usually few) invalid geometries
+    reason = np.full(len(geoms), None, dtype=object)
+    if not valid.all():
+        reason[~valid] = shapely.is_valid_reason(geoms[~valid])
+
+    # Only polygons can be too small; lines and points always have zero area
+    area = shapely.area(geoms)
+    polygonal = np.isin(shapely.get_type_id(geoms), (3, 6))
+    slivers = sliver_check(geoms, max_compactness, max_thinness)
+    return pd.DataFrame({
+        'is_valid': valid,
+        'validity_reason': reason,
+        'is_simple': shapely.is_simple(geoms),
+        'is_empty': shapely.is_empty(geoms),
+        'area': area,
+        'is_small': polygonal & (area < small_area_threshold),
+        'compactness': slivers['compactness'].to_numpy(),
+        'thinness': slivers['thinness'].to_numpy(),
+        'is_sliver': slivers['is_sliver'].to_numpy(),
+    }, index=index)
+
+
+def map_wkb_chunks(function, chunks, workers=None, *args):
+    """
+    Run function(index, wkb, *args) on a process pool for every GeoDataFrame
+    in chunks, shipping the geometries as WKB.
+
+    Yields (chunk, result) pairs in the original order, so callers can keep
+    doing their own per-chunk work in the main process. At most two chunks per
+    worker are in flight at a time, which keeps memory bounded.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in chunks:
+            wkb = shapely.to_wkb(chunk.geometry.values)
+            future = pool.submit(function, chunk.index.to_numpy(), wkb, *args)
+            pending.append((chunk, future))
+            if len(pending) >= 2 * workers:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+
+def validate_chunks(chunks, workers=None, small_area_threshold=SMALL_AREA_THRESHOLD, max_compactness=SLIVER_COMPACTNESS,
+                    max_thinness=SLIVER_THINNESS):
+    """Run check_wkb_chunk on a process pool for every chunk, see map_wkb_chunks"""
+    return map_wkb_chunks(check_wkb_chunk, chunks, workers, small_area_threshold, max_compactness, max_thinness)
+
+
+def validate_file(path, chunk_size=10000, workers=None, small_area_threshold=SMALL_AREA_THRESHOLD):
+    """Validate every feature of a GeoJSON file and return one merged report"""
+    reports = []
+    for chunk, results in validate_chunks(iter_feature_chunks(path, chunk_size), workers, small_area_threshold):
+        results.insert(0, 'id', chunk['id'].values)
+        reports.append(results)
+    if not reports:
+        return pd.DataFrame(columns=['id', 'is_valid', 'validity_reason', 'is_simple', 'is_empty', 'area', 'is_small',
+                                     'compactness', 'thinness', 'is_sliver'])
+    return pd.concat(reports)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python parallel_validate.py <file.json|archive.zip> [workers]")
+        sys.exit(1)
+
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    start = time.time()
+    report = validate_file(sys.argv[1], workers=workers)
+    elapsed = time.time() - start
+
+    print(f"Validated {len(report)} features in {elapsed:.2f} seconds")
+    print(f"   - Invalid geometries: {(~report['is_valid']).sum()}")
+    print(f"   - Self-intersections (not simple): {(~report['is_simple']).sum()}")
+    print(f"   - Empty geometries: {report['is_empty'].sum()}")
+    print(f"   - Very small geometries (area < {SMALL_AREA_THRESHOLD}): {report['is_small'].sum()}")
+    print(f"   - Sliver polygons: {report['is_sliver'].sum()}")
+    for idx, row in report[~report['is_valid']].head(10).iterrows():
+        print(f"   - Invalid geometry at index {idx}: {row['validity_reason']}")
@@ -0,0 +1,204 @@
+import json
+import re
+
+# Coordinates are quantised to integers at this many decimal places, the precision of the source data
+DEFAULT_DECIMALS = 8
+
+BATCH_INSTRUCTIONS = """
+Several features are provided in one message, each starting with a "FEATURE <ID>" header.
+Answer for EVERY feature, in the same order, using the FEATURE [ID] block format above for each.
+
+Coordinates use a compact encoding. Each ring is written as "part P ring R:" followed by
+semicolon-separated integer pairs. The first pair is the absolute position and every following
+pair is the change from the previous vertex (delta encoding). Divide by 10^{decimals} to get
+degrees. Ring 0 of a part is its exterior, higher rings are holes. Lines and points have no
+rings: each line or point is written as "part P:" followed by its vertices in the same encoding.
+"""
+
+POLYLINE_INSTRUCTIONS = """
+Several features are provided in one message, each starting with a "FEATURE <ID>" header.
+Answer for EVERY feature, in the same order, using the FEATURE [ID] block format above for each.
+
+Coordinates are encoded with the Google encoded polyline algorithm (latitude first) at
+precision {decimals}. Each ring is written as "part P ring R:" followed by its polyline string.
+Ring 0 of a part is its exterior, higher rings are holes. Lines and points have no rings: each
+line or point is written as "part P:" followed by the polyline string of its vertices.
+"""
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def quantize(coords, decimals=DEFAULT_DECIMALS):
+    """Quantise a list of [x, y] pairs to integers"""
+    scale = 10 ** decimals
+    return [(int(round(x * scale)), int(round(y * scale))) for x, y, *_ in coords]
+
+
+def delta_encode(coords, decimals=DEFAULT_DECIMALS):
+    """Encode a ring as 'x0,y0;dx1,dy1;...' with quantised integer deltas"""
+    points = quantize(coords, decimals)
+    if not points:
+        return ''
+    parts = [f"{points[0][0]},{points[0][1]}"]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        parts.append(f"{x1 - x0},{y1 - y0}")
+    return ';'.join(parts)
+
+
+def delta_decode(text, decimals=DEFAULT_DECIMALS):
+    """Inverse of delta_encode"""
+    if not text:
+        return []
+    scale = 10 ** decimals
+    coords = []
+    x = y = 0
+    for pair in text.split(';'):
+        dx, dy = (int(v) for v in pair.split(','))
+        x, y = x + dx, y + dy
+        coords.append([x / scale, y / scale])
+    return coords
+
+
+def _polyline_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def polyline_encode(coords, decimals=5):
+    """Encode a ring with the Google polyline algorithm (latitude, longitude order)"""
+    points = quantize(coords, decimals)
+    encoded = []
+    prev_x = prev_y = 0
+    for x, y in points:
+        encoded.append(_polyline_value(y - prev_y))
+        encoded.append(_polyline_value(x - prev_x))
+        prev_x, prev_y = x, y
+    return ''.join(encoded)
+
+
+def polyline_decode(text, decimals=5):
+    """Inverse of polyline_encode"""
+    values = []
+    value = shift = 0
+    for char in text:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    scale = 10 ** decimals
+    coords = []
+    x = y = 0
+    for dy, dx in zip(values[0::2], values[1::2]):
+        x, y = x + dx, y + dy
+        coords.append([x / scale, y / scale])
+    return coords
+
+
+def _coordinate_sequences(geometry):
+    """
+    (label, coordinates) of every ring, line or point of a geometry, or None
+    for geometries without a compact encoding (missing ones and collections)
+    """
+    geometry_type = (geometry or {}).get('type')
+    coordinates = (geometry or {}).get('coordinates')
+    if geometry_type == 'Polygon':
+        coordinates, geometry_type = [coordinates], 'MultiPolygon'
+    elif geometry_type in ('Point', 'LineString'):
+        coordinates, geometry_type = [coordinates], 'Multi' + geometry_type
+    if geometry_type == 'MultiPolygon':
+        return [(f"part {p} ring {r}", ring) for p, polygon in enumerate(coordinates) for r, ring in enumerate(polygon)]
+    if geometry_type == 'MultiLineString':
+        return [(f"part {p}", line) for p, line in enumerate(coordinates)]
+    if geometry_type == 'MultiPoint':
+        return [(f"part {p}", [point] if point else []) for p, point in enumerate(coordinates)]
+    return None
+
+
+def encode_feature(feature, encoding='delta', decimals=DEFAULT_DECIMALS):
+    """
+    Render one simplified feature as a compact text block for a batched prompt.
+    encoding is 'delta' (quantised delta integers), 'polyline' or 'json'
+    (the plain GeoJSON used for single-feature prompts). Polygon rings are
+    labelled "part P ring R", lines and points "part P"; geometries with no
+    compact encoding (collections, missing geometries) fall back to 'json'.
+    """
+    feature_id = feature.get('id')
+    fclass = (feature.get('properties') or {}).get('fclass')
+    geometry = feature.get('geometry')
+    sequences = _coordinate_sequences(geometry)
+    if encoding == 'json' or sequences is None:
+        return f"FEATURE {feature_id}:\n{json.dumps(feature, separators=(',', ':'))}"
+
+    encoder = delta_encode if encoding == 'delta' else polyline_encode
+    lines = [f"FEATURE {feature_id} ({geometry['type']}, fclass={fclass}):"]
+    for label, coords in sequences:
+        lines.append(f"{label}: {encoder(coords, decimals)}")
+    return '\n'.join(lines)
+
+
+def batch_instructions(encoding='delta', decimals=DEFAULT_DECIMALS):
+    """Extra system prompt text explaining the batch format and coordinate encoding"""
+    if encoding == 'polyline':
+        return POLYLINE_INSTRUCTIONS.format(decimals=decimals)
+    if encoding == 'json':
+        # Features are plain GeoJSON, only the batch format needs explaining
+        return BATCH_INSTRUCTIONS.split('\n\n')[0] + '\n'
+    return BATCH_INSTRUCTIONS.format(decimals=decimals)
+
+
+def pack_features(features, max_tokens=6000, encoding='delta', decimals=DEFAULT_DECIMALS):
+    """
+    Greedily pack encoded features into batches whose estimated size stays
+    under max_tokens. A feature that is larger than the budget on its own
+    gets a batch to itself. Returns a list of (feature ids, prompt body) pairs.
+    """
+    batches = []
+    ids, blocks, size = [], [], 0
+    for feature in features:
+        block = encode_feature(feature, encoding, decimals)
+        tokens = estimate_tokens(block)
+        if blocks and size + tokens > max_tokens:
+            batches.append((ids, '\n\n'.join(blocks)))
+            ids, blocks, size = [], [], 0
+        ids.append(str(feature.get('id')))
+        blocks.append(block)
+        size += tokens
+    if blocks:
+        batches.append((ids, '\n\n'.join(blocks)))
+    return batches
+
+
+def build_batch_prompt(body, count):
+    """User prompt for a batch of encoded features"""
+    return (f"Analyze these {count} GeoJSON features for topological issues. Pay special attention to "
+            f"self-intersections where a polygon boundary crosses over itself.\n\n"
+            f"{body}\n\n"
+            f"Answer with one FEATURE block per feature, covering all {count} features.")
+
+
+_FEATURE_HEADER = re.compile(r'^[\s#*]*FEATURE\s*\[?\s*([\w.:-]+?)\s*\]?\s*(?:\(|:|\*|$)', re.IGNORECASE | re.MULTILINE)
+
+
+def split_batch_response(response, feature_ids):
+    """
+    Split a batched model answer into one text per feature id. Text before
+    the first FEATURE header is dropped; ids the model did not answer are
+    missing from the result.
+    """
+    wanted = {str(feature_id) for feature_id in feature_ids}
+    matches = [m for m in _FEATURE_HEADER.finditer(response) if m.group(1) in wanted]
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(response)
+        sections.setdefault(match.group(1), response[match.start():end].strip())
+    return sections
@@ -0,0 +1,169 @@
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from geojson_stream import FeatureCollectionWriter, iter_feature_chunks
+from parallel_validate import map_wkb_chunks
+
+# Orientation convention of analyze_topology.py
+EXTERIOR = 'cw'
+
+# Grid the coordinates are snapped to; None leaves them as they are
+GRID_SIZE = None
+
+# Consecutive vertices closer than this are merged (0 only removes exact repeats)
+DEDUPE_TOLERANCE = 0.0
+
+REPAIR_STEPS = ('make_valid', 'dedupe', 'snap', 'orient')
+LOG_COLUMNS = ['id', 'actions', 'validity_reason', 'type_before', 'type_after', 'vertices_before', 'vertices_after',
+               'area_before', 'area_after', 'is_valid']
+
+
+def repair_geometries(geoms, exterior=EXTERIOR, grid_size=GRID_SIZE, dedupe_tolerance=DEDUPE_TOLERANCE):
+    """
+    Repair every geometry at once, in this order:
+
+    - make_valid: invalid geometries are rebuilt; polygons keep their
+      dimension (the 'structure' method drops collapsed parts)
+    - dedupe: consecutive vertices closer than dedupe_tolerance are merged
+    - snap: coordinates are snapped to a grid of grid_size (if given),
+      keeping the result valid (this rebuilds polygons in GEOS order, so
+      it may already fix orientation before the orient step)
+    - orient: exteriors run in the exterior direction, holes the other way
+
+    Returns the repaired geometries and a DataFrame with, for every input,
+    which steps changed it ("actions", separated by ';'), the validity
+    reason before the repair and the type, vertex count and area before
+    and after. Missing geometries are passed through untouched.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    present = ~shapely.is_missing(geoms)
+    valid = shapely.is_valid(geoms)
+    invalid = present & ~valid
+    reason = np.full(len(geoms), None, dtype=object)
+    reason[invalid] = shapely.is_valid_reason(geoms[invalid])
+
+    steps = {}
+    repaired = geoms.copy()
+    polygonal = np.isin(shapely.get_type_id(geoms), (3, 6))
+    fixed = invalid & polygonal
+    repaired[fixed] = shapely.make_valid(geoms[fixed], method='structure', keep_collapsed=False)
+    repaired[invalid & ~polygonal] = shapely.make_valid(geoms[invalid & ~polygonal])
+    steps['make_valid'] = invalid
+
+    # Every other step is recorded where it actually changed the geometry
+    before = repaired
+    repaired = shapely.remove_repeated_points(before, tolerance=dedupe_tolerance)
+    steps['dedupe'] = present & ~shapely.equals_identical(before, repaired)
+    if grid_size:
+        before = repaired
+        repaired = shapely.set_precision(before, grid_size)
+        steps['snap'] = present & ~shapely.equals_identical(before, repaired)
+    before = repaired
+    repaired = shapely.orient_polygons(before, exterior_cw=(exterior == 'cw'))
+    steps['orient'] = present & ~shapely.equals_identical(before, repaired)
+
+    actions = pd.Series('', index=range(len(geoms)))
+    for step in REPAIR_STEPS:
+        if step in steps:
+            actions[steps[step]] += step + ';'
+    log = pd.DataFrame({
+        'actions': actions.str.rstrip(';').to_numpy(),
+        'validity_reason': reason,
+        'type_before': shapely.get_type_id(geoms),
+        'type_after': shapely.get_type_id(repaired),
+        'vertices_before': shapely.get_num_coordinates(geoms),
+        'vertices_after': shapely.get_num_coordinates(repaired),
+        'area_before': shapely.area(geoms),
+        'area_after': shapely.area(repaired),
+        'is_valid': shapely.is_valid(repaired) | ~present,
+    })
+    return repaired, log
+
+
+def repair_wkb_chunk(index, wkb, exterior=EXTERIOR, grid_size=GRID_SIZE, dedupe_tolerance=DEDUPE_TOLERANCE):
+    """
+    Repair one chunk of WKB-encoded geometries inside a worker process.
+    Returns the repaired geometries as WKB and the log of the features that
+    changed, indexed by their global index.
+    """
+    repaired, log = repair_geometries(shapely.from_wkb(wkb), exterior, grid_size, dedupe_tolerance)
+    log.index = index
+    return shapely.to_wkb(repaired), log[log['actions'] != '']
+
+
+def repair_file(path, output, log_path, chunk_size=10000, workers=None, exterior=EXTERIOR, grid_size=GRID_SIZE,
+                dedupe_tolerance=DEDUPE_TOLERANCE, read_chunks=iter_feature_chunks):
+    """
+    Repair every feature of a GeoJSON file on a process pool.
+
+    The corrected FeatureCollection is streamed to output chunk by chunk
+    (ids, properties and top-level members such as "crs" kept) and the change log of the repaired features is
+    appended to the CSV file log_path as it goes, so neither is ever held in
+    memory. Returns the number of features read and the change log counts
+    per step.
+    """
+    for target in (output, log_path):
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    type_names = np.array(['Point', 'LineString', 'LinearRing', 'Polygon', 'MultiPoint', 'MultiLineString',
+                           'MultiPolygon', 'GeometryCollection'])
+
+    total = 0
+    counts = pd.Series(0, index=list(REPAIR_STEPS) + ['features', 'still_invalid'])
+    # Filled by the reader while the chunks stream through, written by the writer when it closes
+    members = {}
+    with FeatureCollectionWriter(output, members) as writer:
+        pd.DataFrame(columns=LOG_COLUMNS).to_csv(log_path, index=False)
+        chunks = read_chunks(path, chunk_size, members=members)
+        for chunk, (wkb, log) in map_wkb_chunks(repair_wkb_chunk, chunks, workers, exterior, grid_size,
+                                                dedupe_tolerance):
+            chunk = chunk.set_geometry(shapely.from_wkb(wkb))
+            writer.write_geodataframe(chunk)
+            total += len(chunk)
+
+            log.insert(0, 'id', chunk.loc[log.index, 'id'].values)
+            for column in ('type_before', 'type_after'):
+                log[column] = np.where(log[column] >= 0, type_names[log[column].clip(lower=0)], None)
+            log.to_csv(log_path, mode='a', header=False, index=False)
+            for step in REPAIR_STEPS:
+                counts[step] += int(log['actions'].str.contains(step).sum())
+            counts['features'] += len(log)
+            counts['still_invalid'] += int((~log['is_valid']).sum())
+    return total, counts
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Repair the geometries of a dataset and log every change")
+    parser.add_argument('dataset', help="GeoJSON file (or .zip)")
+    parser.add_argument('--output', default='Repaired/repaired.json')
+    parser.add_argument('--log', default='Repaired/changes.csv')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--exterior', choices=('cw', 'ccw'), default=EXTERIOR)
+    parser.add_argument('--grid-size', type=float, default=GRID_SIZE, help="Snap coordinates to this grid")
+    parser.add_argument('--dedupe-tolerance', type=float, default=DEDUPE_TOLERANCE)
+    parser.add_argument('--cache', action='store_true', help="Read the dataset through the geometry cache")
+    args = parser.parse_args()
+
+    read_chunks = iter_feature_chunks
+    if args.cache:
+        from geometry_cache import cached_feature_chunks
+        read_chunks = cached_feature_chunks
+
+    start = time.time()
+    total, counts = repair_file(args.dataset, args.output, args.log, args.chunk_size, args.workers, args.exterior,
+                                args.grid_size, args.dedupe_tolerance, read_chunks)
+    print(f"Repaired {total} features in {time.time() - start:.2f} seconds")
+    print(f"   - Features changed: {counts['features']}")
+    print(f"   - Made valid: {counts['make_valid']}")
+    print(f"   - Duplicate vertices removed: {counts['dedupe']}")
+    if args.grid_size:
+        print(f"   - Snapped to a {args.grid_size} grid: {counts['snap']}")
+    print(f"   - Re-oriented: {counts['orient']}")
+    print(f"   - Still invalid after repair: {counts['still_invalid']}")
+    print(f"Corrected dataset saved to {args.output}, change log to {args.log}")
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_CACHE_DIR = 'Cache'
+
+
+def cache_key(model, messages, params=None):
+    """
+    Hash of everything that determines a model's answer: the model name, the
+    system and user prompts, and any extra request parameters.
+    """
+    payload = json.dumps({"model": model, "messages": messages, "params": params or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of raw chat-completions responses.
+
+    Each entry is stored as Cache/<key[:2]>/<key>_response.json, containing the
+    raw response body exactly like the files in Logs/, next to a small
+    <key>_meta.json with the model and creation time. Entries older than
+    max_age_days are ignored and removed, and the least recently used entries
+    are evicted once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=500 * 1024 * 1024, max_age_days=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        folder = os.path.join(self.directory, key[:2])
+        return os.path.join(folder, f"{key}_response.json"), os.path.join(folder, f"{key}_meta.json")
+
+    def get(self, key):
+        """Return the cached raw response text for key, or None"""
+        response_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if self.max_age and time.time() - meta['created'] > self.max_age:
+                self._remove(key)
+                self.misses += 1
+                return None
+            with open(response_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        # Touch the entry so eviction removes the least recently used ones first
+        os.utime(response_path)
+        self.hits += 1
+        return text
+
+    def put(self, key, text, model=None):
+        """Store a raw response body under key"""
+        response_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(response_path), exist_ok=True)
+        with open(response_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        with open(meta_path, 'w') as f:
+            json.dump({"model": model, "created": time.time(), "size": len(text.encode('utf-8'))}, f)
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _entries(self):
+        for folder in os.listdir(self.directory):
+            folder_path = os.path.join(self.directory, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for name in os.listdir(folder_path):
+                if name.endswith('_response.json'):
+                    path = os.path.join(folder_path, name)
+                    stat = os.stat(path)
+                    yield name[:-len('_response.json')], stat.st_size, stat.st_mtime
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones until under max_bytes"""
+        now = time.time()
+        entries = []
+        for key, size, last_used in self._entries():
+            _, meta_path = self._paths(key)
+            try:
+                with open(meta_path, 'r') as f:
+                    created = json.load(f)['created']
+            except (OSError, ValueError, KeyError):
+                created = 0
+            if self.max_age and now - created > self.max_age:
+                self._remove(key)
+            else:
+                entries.append((last_used, size, key))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for last_used, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,148 @@
+import json
+import re
+from dataclasses import dataclass, asdict
+
+from prompt_batching import split_batch_response
+
+# (record field, heading used in the system prompt, label used in the summaries)
+ISSUES = [
+    ('self_intersection', 'Self-intersections', 'Self-intersection'),
+    ('invalid_geometry', 'Invalid geometries', 'Invalid geometry'),
+    ('ring_orientation', 'Ring orientation issues', 'Ring orientation issue'),
+    ('precision', 'Precision/coordinate issues', 'Precision/coordinate issue'),
+]
+
+# One pattern for all four headings, compiled once: "<heading>: <rest of line>",
+# allowing markdown emphasis around the heading
+_ISSUE_LINE = re.compile(
+    r'(' + '|'.join(re.escape(heading) for _, heading, _ in ISSUES) + r')\**\s*:(.*)',
+    re.IGNORECASE)
+_YES = re.compile(r'\byes\b', re.IGNORECASE)
+_FIELD_BY_HEADING = {heading.lower(): field for field, heading, _ in ISSUES}
+_JSON_BLOCK = re.compile(r'```(?:json)?\s*(\{.*\})\s*```', re.DOTALL)
+
+# Extra system prompt text and request parameter for structured (JSON) output
+JSON_INSTRUCTIONS = """
+Instead of the headings above, reply with JSON only, in this form:
+{"features": [{"id": "<ID>", "self_intersections": true/false, "invalid_geometries": true/false,
+"ring_orientation_issues": true/false, "precision_coordinate_issues": true/false, "explanation": "..."}]}
+"""
+
+_JSON_KEYS = {
+    'self_intersection': 'self_intersections',
+    'invalid_geometry': 'invalid_geometries',
+    'ring_orientation': 'ring_orientation_issues',
+    'precision': 'precision_coordinate_issues',
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "topology_verdicts",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "features": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string"},
+                            **{key: {"type": "boolean"} for key in _JSON_KEYS.values()},
+                            "explanation": {"type": "string"},
+                        },
+                        "required": ["id", *_JSON_KEYS.values(), "explanation"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["features"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+@dataclass
+class FeatureVerdict:
+    """Parsed answer of one model for one feature"""
+    feature_id: str
+    self_intersection: bool = False
+    invalid_geometry: bool = False
+    ring_orientation: bool = False
+    precision: bool = False
+    explanation: str = ''
+    text: str = ''
+
+    def detected(self):
+        """Labels of the issues the model answered Yes for"""
+        return [label for field, _, label in ISSUES if getattr(self, field)]
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def parse_text(feature_id, text):
+    """
+    Parse a free-text answer in the "<heading>: Yes/No" format in a single
+    pass. An issue counts as detected when any of its heading lines says Yes;
+    the remaining lines form the explanation.
+    """
+    verdict = FeatureVerdict(str(feature_id), text=text)
+    explanation = []
+    for line in text.splitlines():
+        match = _ISSUE_LINE.search(line)
+        if match is None:
+            explanation.append(line)
+        elif _YES.search(match.group(2)):
+            setattr(verdict, _FIELD_BY_HEADING[match.group(1).lower()], True)
+    verdict.explanation = '\n'.join(explanation).strip()
+    return verdict
+
+
+def parse_json(text):
+    """
+    Parse a structured (JSON) answer into {feature id: FeatureVerdict}.
+    Returns None when the text holds no usable JSON.
+    """
+    block = _JSON_BLOCK.search(text)
+    try:
+        data = json.loads(block.group(1) if block else text)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    items = data.get('features') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
+
+    verdicts = {}
+    for item in items:
+        if not isinstance(item, dict) or 'id' not in item:
+            continue
+        feature_id = str(item['id'])
+        verdicts[feature_id] = FeatureVerdict(
+            feature_id,
+            **{field: bool(item.get(key, False)) for field, key in _JSON_KEYS.items()},
+            explanation=str(item.get('explanation', '')),
+            text=json.dumps(item),
+        )
+    return verdicts
+
+
+def parse_response(text, feature_ids):
+    """
+    Parse one model answer covering one or more features into
+    {feature id: FeatureVerdict}. JSON answers are used when present;
+    otherwise batched text answers are split per FEATURE block first.
+    Features the model did not answer are missing from the result.
+    """
+    feature_ids = [str(feature_id) for feature_id in feature_ids]
+    verdicts = parse_json(text) if text.lstrip().startswith(('{', '[', '```')) else None
+    if verdicts is not None:
+        return {feature_id: verdicts[feature_id] for feature_id in feature_ids if feature_id in verdicts}
+
+    if len(feature_ids) == 1:
+        sections = {feature_ids[0]: text}
+    else:
+        sections = split_batch_response(text, feature_ids)
+    return {feature_id: parse_text(feature_id, section) for feature_id, section in sections.items()}
@@ -0,0 +1,277 @@
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from response_parser import ISSUES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT,
+    models TEXT,
+    feature_ids TEXT,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS responses (
+    run_id INTEGER,
+    model TEXT,
+    feature_id TEXT,
+    position INTEGER,
+    valid INTEGER,
+    text TEXT,
+    latency REAL,
+    prompt_tokens REAL,
+    completion_tokens REAL,
+    cached INTEGER
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    run_id INTEGER,
+    model TEXT,
+    feature_id TEXT,
+    issue TEXT,
+    predicted INTEGER,
+    ground_truth INTEGER,
+    latency REAL,
+    prompt_tokens REAL,
+    completion_tokens REAL
+);
+CREATE TABLE IF NOT EXISTS verdict_counts (
+    run_id INTEGER,
+    model TEXT,
+    issue TEXT,
+    verdicts INTEGER,
+    true_positives INTEGER,
+    false_positives INTEGER,
+    false_negatives INTEGER,
+    true_negatives INTEGER,
+    latency_sum REAL,
+    PRIMARY KEY (run_id, model, issue)
+);
+CREATE INDEX IF NOT EXISTS responses_run ON responses (run_id, model);
+CREATE INDEX IF NOT EXISTS verdicts_run ON verdicts (run_id, model);
+"""
+
+RESPONSE_COLUMNS = ['run_id', 'model', 'feature_id', 'position', 'valid', 'text', 'latency',
+                    'prompt_tokens', 'completion_tokens', 'cached']
+VERDICT_COLUMNS = ['run_id', 'model', 'feature_id', 'issue', 'predicted', 'ground_truth', 'latency',
+                   'prompt_tokens', 'completion_tokens']
+
+
+class ResultsStore:
+    """
+    SQLite store of model evaluations, kept across runs. Every run adds one
+    row per (model, feature) answer to `responses` and one row per (model,
+    feature, issue) verdict to `verdicts`, so accuracy can be aggregated over
+    any number of runs with plain SQL. Confusion counts per (run, model,
+    issue) are kept up to date in `verdict_counts`, so cross-run accuracy
+    never has to scan the verdicts themselves. Verdicts of answers stored
+    as invalid are left out of the counts.
+    """
+
+    def __init__(self, path='Results/results.sqlite'):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def start_run(self, models, feature_ids, settings=None):
+        """Register a new run and return its id"""
+        cursor = self.connection.execute(
+            "INSERT INTO runs (started, models, feature_ids, settings) VALUES (?, ?, ?, ?)",
+            (time.strftime('%Y-%m-%dT%H:%M:%S'), json.dumps(list(models)),
+             json.dumps([str(feature_id) for feature_id in feature_ids]), json.dumps(settings or {})))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def _insert(self, table, columns, rows):
+        placeholders = ', '.join('?' * len(columns))
+        self.connection.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            [tuple(row.get(column) for column in columns) for row in rows])
+        self.connection.commit()
+
+    def add_responses(self, rows):
+        """Append answer rows (dicts with the RESPONSE_COLUMNS keys)"""
+        self._insert('responses', RESPONSE_COLUMNS, rows)
+
+    def add_verdicts(self, rows):
+        """Append verdict rows (dicts with the VERDICT_COLUMNS keys)"""
+        self._insert('verdicts', VERDICT_COLUMNS, rows)
+        for run_id in {row['run_id'] for row in rows}:
+            self._update_counts(run_id)
+
+    def _update_counts(self, run_id):
+        self.connection.execute("DELETE FROM verdict_counts WHERE run_id = ?", (run_id,))
+        self.connection.execute(
+            """INSERT INTO verdict_counts
+               SELECT run_id, model, issue, COUNT(*),
+                      SUM(predicted = 1 AND ground_truth = 1), SUM(predicted = 1 AND ground_truth = 0),
+                      SUM(predicted = 0 AND ground_truth = 1), SUM(predicted = 0 AND ground_truth = 0),
+                      SUM(latency)
+               FROM verdicts v
+               WHERE run_id = ? AND ground_truth IS NOT NULL AND NOT EXISTS (
+                   SELECT 1 FROM responses r WHERE r.run_id = v.run_id AND r.model = v.model
+                   AND r.feature_id = v.feature_id AND r.valid = 0)
+               GROUP BY run_id, model, issue""", (run_id,))
+        self.connection.commit()
+
+    def run_info(self, run_id):
+        """(models, feature ids) of a run, in their original order"""
+        models, feature_ids = self.connection.execute(
+            "SELECT models, feature_ids FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(models), json.loads(feature_ids)
+
+    def query(self, sql, params=()):
+        """Run a SELECT and return the result as a DataFrame"""
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def verdict_rows(run_id, model, verdict, ground_truth=None, latency=None, prompt_tokens=None,
+                 completion_tokens=None):
+    """One verdicts row per issue for a parsed FeatureVerdict"""
+    rows = []
+    for field, _, _ in ISSUES:
+        expected = None if ground_truth is None else ground_truth.get(field)
+        rows.append({
+            'run_id': run_id, 'model': model, 'feature_id': verdict.feature_id, 'issue': field,
+            'predicted': int(getattr(verdict, field)),
+            'ground_truth': None if expected is None else int(expected),
+            'latency': latency, 'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+        })
+    return rows
+
+
+def write_reports(store, run_id, model_output_dir='Model_Output', summary_dir='Summary'):
+    """
+    Write the per-model analysis and summary files and the combined comparison
+    of one run, reading everything back from the store.
+    """
+    models, feature_ids = store.run_info(run_id)
+    responses = store.query("SELECT model, feature_id, valid, text FROM responses WHERE run_id = ? "
+                            "ORDER BY position", (run_id,))
+    verdicts = store.query("SELECT model, feature_id, issue, predicted FROM verdicts WHERE run_id = ?", (run_id,))
+    predicted = verdicts.pivot_table(index=['model', 'feature_id'], columns='issue', values='predicted',
+                                     aggfunc='max', fill_value=0)
+    valid_counts = responses.groupby('model')['valid'].sum()
+    texts = {(row.model, row.feature_id): row.text for row in responses.itertuples()}
+
+    def detected(model, feature_id):
+        if (model, feature_id) not in predicted.index:
+            return []
+        row = predicted.loc[(model, feature_id)]
+        return [label for field, _, label in ISSUES if row.get(field, 0)]
+
+    for model in models:
+        model_name = model.replace('/', '_')
+        valid_count = int(valid_counts.get(model, 0))
+
+        output_file = f"{model_output_dir}/{model_name}_analysis.txt"
+        with open(output_file, 'w') as f:
+            f.write(f"ANALYSIS RESULTS FOR {model}\n")
+            f.write("=" * 50 + "\n\n")
+            for feature_id in feature_ids:
+                if (model, feature_id) in texts:
+                    f.write(f"FEATURE {feature_id}:\n")
+                    f.write(texts[(model, feature_id)] + "\n\n")
+        print(f"Results for {model} saved to {output_file}")
+
+        summary_file = f"{summary_dir}/{model_name}_summary.txt"
+        with open(summary_file, 'w') as f:
+            f.write(f"SUMMARY FOR {model}\n")
+            f.write("=" * 50 + "\n\n")
+            if valid_count > 0:
+                detected_issues = [f"Feature {feature_id}: {issue} detected"
+                                   for feature_id in feature_ids for issue in detected(model, feature_id)]
+                if detected_issues:
+                    f.write("Issues detected:\n")
+                    for issue in detected_issues:
+                        f.write(f"- {issue}\n")
+                else:
+                    f.write("No issues detected in any features.\n")
+                f.write(f"\nModel produced {valid_count} valid responses out of {len(feature_ids)} features.")
+            else:
+                f.write("Model did not produce any valid responses.")
+        print(f"Summary for {model} saved to {summary_file}")
+
+    comparison_file = f"{summary_dir}/combined_model_comparison.txt"
+    with open(comparison_file, 'w') as f:
+        f.write("COMBINED SUMMARY OF TOPOLOGICAL ANALYSES\n")
+        f.write("=" * 50 + "\n\n")
+
+        f.write("Feature Analysis by Model:\n")
+        f.write("-" * 30 + "\n\n")
+        for feature_id in feature_ids:
+            f.write(f"FEATURE {feature_id}:\n")
+            f.write("-" * 20 + "\n")
+            for model in models:
+                if (model, feature_id) in predicted.index:
+                    issues = detected(model, feature_id)
+                    if issues:
+                        f.write(f"{model}: Detected issues: {', '.join(issues)}\n")
+                    else:
+                        f.write(f"{model}: No issues detected\n")
+                else:
+                    f.write(f"{model}: No valid response\n")
+            f.write("\n")
+
+        f.write("\nModel Performance Summary:\n")
+        f.write("-" * 30 + "\n\n")
+        counts = verdicts.groupby(['model', 'issue'])['predicted'].sum()
+        for model in models:
+            valid_count = int(valid_counts.get(model, 0))
+            if valid_count > 0:
+                model_counts = {field: int(counts.get((model, field), 0)) for field, _, _ in ISSUES}
+                f.write(f"{model}:\n")
+                f.write(f"- Valid responses: {valid_count}/{len(feature_ids)}\n")
+                f.write(f"- Total issues detected: {sum(model_counts.values())}\n")
+                f.write(f"  - Self-intersections: {model_counts['self_intersection']}\n")
+                f.write(f"  - Invalid geometries: {model_counts['invalid_geometry']}\n")
+                f.write(f"  - Ring orientation: {model_counts['ring_orientation']}\n")
+                f.write(f"  - Precision/coordinate: {model_counts['precision']}\n\n")
+            else:
+                f.write(f"{model}: No valid responses\n\n")
+    print(f"Combined model comparison saved to {comparison_file}")
+
+
+def accuracy_by_model(store, run_ids=None):
+    """
+    Accuracy of every model per issue over the given runs (all runs by
+    default), counting only verdicts that have a ground truth.
+    """
+    where = ""
+    params = ()
+    if run_ids is not None:
+        run_ids = list(run_ids)
+        where = f"WHERE run_id IN ({', '.join('?' * len(run_ids))})"
+        params = tuple(run_ids)
+    return store.query(
+        f"""SELECT model, issue, SUM(verdicts) AS verdicts,
+                   SUM(true_positives) AS true_positives, SUM(false_positives) AS false_positives,
+                   SUM(false_negatives) AS false_negatives, SUM(true_negatives) AS true_negatives,
+                   1.0 * (SUM(true_positives) + SUM(true_negatives)) / SUM(verdicts) AS accuracy,
+                   SUM(latency_sum) / SUM(verdicts) AS mean_latency
+            FROM verdict_counts {where}
+            GROUP BY model, issue ORDER BY model, issue""", params)
+
+
+if __name__ == "__main__":
+    import sys
+
+    store_file = sys.argv[1] if len(sys.argv) > 1 else 'Results/results.sqlite'
+    with ResultsStore(store_file) as store:
+        runs = store.query("SELECT run_id, started FROM runs")
+        print(f"{len(runs)} runs in {store_file}")
+        with pd.option_context('display.width', 200, 'display.max_rows', None, 'display.max_columns', None):
+            print(accuracy_by_model(store))
@@ -0,0 +1,229 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import shape
+
+from topology_checks import polygon_rings
+
+# Rough number of prompt tokens used by one "[x, y]" pair with 8 decimal places
+TOKENS_PER_VERTEX = 12
+
+# Number of bisection steps (on a log scale) used to find each feature's tolerance
+TOLERANCE_STEPS = 12
+
+
+def crossing_vertices(coords, ring_ids, ring_feature):
+    """
+    Find the vertices at both ends of every pair of segments that intersect
+    each other without being neighbours on the same ring. These are the
+    vertices that create self-intersections (or ring-ring intersections), so
+    they must survive simplification.
+
+    coords is the flat coordinate array of all rings, ring_ids gives the ring
+    of every coordinate and ring_feature the feature of every ring. Returns a
+    boolean mask over coords.
+    """
+    protected = np.zeros(len(coords), dtype=bool)
+    if len(coords) < 2:
+        return protected
+
+    # Segment k joins coordinate k to k + 1 when both are on the same ring
+    starts = np.flatnonzero(ring_ids[:-1] == ring_ids[1:])
+    segments = shapely.linestrings(np.stack([coords[starts], coords[starts + 1]], axis=1))
+    left, right = STRtree(segments).query(segments, predicate='intersects')
+
+    keep = left < right
+    left, right = left[keep], right[keep]
+    seg_ring = ring_ids[starts]
+    same_feature = ring_feature[seg_ring[left]] == ring_feature[seg_ring[right]]
+    left, right = left[same_feature], right[same_feature]
+
+    # Neighbouring segments of a ring always share a vertex; that is not a crossing
+    same_ring = seg_ring[left] == seg_ring[right]
+    ring_first = np.searchsorted(seg_ring, seg_ring)
+    ring_last = np.searchsorted(seg_ring, seg_ring, side='right') - 1
+    adjacent = same_ring & ((right - left == 1) | ((left == ring_first[left]) & (right == ring_last[right])))
+    left, right = left[~adjacent], right[~adjacent]
+
+    for seg in (left, right):
+        protected[starts[seg]] = True
+        protected[starts[seg] + 1] = True
+    return protected
+
+
+def simplify_geometries(geoms, max_vertices=64, max_tokens=None):
+    """
+    Simplify an array of (multi)polygons so that each feature has at most
+    max_vertices vertices (or roughly max_tokens prompt tokens).
+
+    Every feature is simplified as a whole with the topology-preserving
+    Douglas-Peucker simplifier from GEOS, so holes can't be pushed across
+    their exterior, using a per-feature tolerance found by bisecting all
+    features at once. Vertices of crossing segments in the original geometry
+    are always kept (and counted in the budget), so self-intersections can't
+    be simplified away; features whose crossings or rings alone exceed the
+    budget keep those vertices anyway.
+
+    A valid feature never comes out invalid: where the kept vertices still
+    form an invalid geometry the tolerance is shrunk (by 10x at a time)
+    until it is valid again, which may leave the feature over budget.
+
+    Returns (rings, coords, ring_ids, ring_feature, part, ring) describing the
+    simplified rings, in the same layout as topology_checks.polygon_rings.
+    """
+    if max_tokens is not None:
+        max_vertices = max(4, max_tokens // TOKENS_PER_VERTEX)
+
+    geoms = np.asarray(geoms, dtype=object)
+    rings, ring_feature, part, ring = polygon_rings(geoms)
+    counts = shapely.get_num_coordinates(rings)
+    coords = shapely.get_coordinates(rings)
+    ring_ids = np.repeat(np.arange(len(rings)), counts)
+    coord_feature = ring_feature[ring_ids]
+    keys = _coordinate_keys(coord_feature, coords)
+    n = len(geoms)
+
+    # Only invalid or non-simple features can contain crossing segments
+    valid = shapely.is_valid(geoms) & shapely.is_simple(geoms)
+    protected = np.zeros(len(coords), dtype=bool)
+    in_suspect = ~valid[coord_feature] if len(coords) else protected
+    protected[in_suspect] = crossing_vertices(coords[in_suspect], ring_ids[in_suspect], ring_feature)
+    # The first and last vertex of every ring are kept so rings stay closed
+    ring_start = np.cumsum(counts) - counts
+    protected[ring_start[counts > 0]] = True
+    protected[(ring_start + counts - 1)[counts > 0]] = True
+
+    def kept_vertices(tolerance, features):
+        """Vertices kept when the given features are simplified (all others keep every vertex)"""
+        simplified = shapely.simplify(geoms[features], tolerance[features], preserve_topology=True)
+        simple_coords, simple_index = shapely.get_coordinates(simplified, return_index=True)
+        simple_keys = _coordinate_keys(np.flatnonzero(features)[simple_index], simple_coords)
+        selected = features[coord_feature]
+        return ~selected | protected | (selected & np.isin(keys, simple_keys))
+
+    total = np.bincount(ring_feature, weights=counts, minlength=n)
+
+    # Bisect the log of the tolerance of all features at once, between
+    # 1e-9 and 1 times the size of the feature's bounding box
+    bounds = shapely.bounds(geoms)
+    size = np.nan_to_num(np.hypot(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]))
+    needs_simplifying = (total > max_vertices) & (size > 0)
+    lo = np.full(n, -9.0)
+    hi = np.zeros(n)
+    for _ in range(TOLERANCE_STEPS):
+        if not needs_simplifying.any():
+            break
+        mid = (lo + hi) / 2
+        keep = kept_vertices(size * 10 ** mid, needs_simplifying)
+        fits = np.bincount(coord_feature[keep], minlength=n) <= max_vertices
+        hi = np.where(needs_simplifying & fits, mid, hi)
+        lo = np.where(needs_simplifying & ~fits, mid, lo)
+    tolerance = np.where(needs_simplifying, size * 10 ** hi, 0.0)
+    keep = kept_vertices(tolerance, needs_simplifying)
+
+    # Shrink the tolerance of valid features that came out invalid until they are valid again
+    checked = needs_simplifying & valid
+    for step in range(TOLERANCE_STEPS + 1):
+        if not checked.any():
+            break
+        result = _assemble(coords[keep], ring_ids[keep], ring_feature, ring, n)
+        broken = checked & ~shapely.is_valid(result)
+        if not broken.any():
+            break
+        selected = broken[coord_feature]
+        if step == TOLERANCE_STEPS:
+            keep[selected] = True
+            break
+        tolerance[broken] /= 10
+        keep[selected] = kept_vertices(tolerance, broken)[selected]
+        checked = broken
+
+    new_counts = np.bincount(ring_ids[keep], minlength=len(rings))
+    new_rings = shapely.linearrings(coords[keep], indices=ring_ids[keep]) if keep.any() else rings[:0]
+    return new_rings, coords[keep], ring_ids[keep], ring_feature[new_counts > 0], part[new_counts > 0], ring[new_counts > 0]
+
+
+def _assemble(coords, ring_ids, ring_feature, ring, n):
+    """
+    MultiPolygons of all n features from the flat coordinates of their rings,
+    laid out as polygon_rings returns them; features without rings are None.
+    """
+    if len(coords) == 0:
+        return np.full(n, None, dtype=object)
+    present, ring_index = np.unique(ring_ids, return_inverse=True)
+    linear = shapely.linearrings(coords, indices=ring_index)
+    # Rings are ordered by feature and part, and every part starts with its exterior
+    ring_part = np.cumsum(ring[present] == 0) - 1
+    polygons = shapely.polygons(linear, indices=ring_part)
+    part_feature = ring_feature[present][ring[present] == 0]
+    result = np.full(n, None, dtype=object)
+    features = np.unique(part_feature)
+    result[features] = shapely.multipolygons(polygons, indices=np.searchsorted(features, part_feature))
+    return result
+
+
+def _coordinate_keys(groups, coords):
+    """One comparable key per (group, x, y) triple, for set operations with np.isin"""
+    stacked = np.ascontiguousarray(np.column_stack([groups.astype(float), coords]))
+    return stacked.view(np.dtype((np.void, stacked.dtype.itemsize * 3))).ravel()
+
+
+def simplify_features(features, max_vertices=64, max_tokens=None):
+    """
+    Simplify a list of GeoJSON features for prompting. Returns new feature
+    dicts in the same reduced form as test.py (id, fclass and geometry only),
+    with MultiPolygon/Polygon coordinates simplified to the vertex budget.
+    Other geometry types are copied unchanged.
+    """
+    geoms = np.array([shape(feature['geometry']) for feature in features], dtype=object)
+    _, coords, ring_ids, ring_feature, part, ring = simplify_geometries(geoms, max_vertices, max_tokens)
+
+    # Split the flat coordinate array back into nested GeoJSON lists
+    ring_coords = np.split(coords, np.flatnonzero(np.diff(ring_ids)) + 1) if len(coords) else []
+    nested = [{} for _ in features]
+    for coords_list, feature_idx, part_idx in zip(ring_coords, ring_feature, part):
+        nested[feature_idx].setdefault(part_idx, []).append(coords_list.tolist())
+
+    simplified_features = []
+    for feature, parts in zip(features, nested):
+        geometry_type = feature['geometry']['type']
+        if geometry_type == 'MultiPolygon':
+            coordinates = [parts[p] for p in sorted(parts)]
+        elif geometry_type == 'Polygon':
+            coordinates = parts.get(0, [])
+        else:
+            coordinates = feature['geometry'].get('coordinates', [])
+        simplified_features.append({
+            "type": "Feature",
+            "id": feature.get('id', None),
+            "properties": {
+                "fclass": feature.get('properties', {}).get('fclass', None)
+            },
+            "geometry": {
+                "type": geometry_type,
+                "coordinates": coordinates
+            }
+        })
+    return simplified_features
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'subset_with_error.json'
+    with open(input_file, 'r') as f:
+        features = json.load(f)['features']
+
+    start = time.time()
+    simplified = simplify_features(features)
+    elapsed = time.time() - start
+    print(f"Simplified {len(features)} features in {elapsed:.3f} seconds")
+
+    for original, simple in zip(features, simplified):
+        before = shape(original['geometry'])
+        after = shape(simple['geometry'])
+        print(f"Feature {original.get('id')}: {shapely.get_num_coordinates(before)} -> "
+              f"{shapely.get_num_coordinates(after)} vertices, self-intersection "
+              f"{'yes' if not before.is_simple else 'no'} -> {'yes' if not after.is_simple else 'no'}")
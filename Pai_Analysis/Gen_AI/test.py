@@ -1,9 +1,15 @@
-import requests
 import json
 import os
 import time
 import shutil
-import re
+from evaluate_models import feature_ground_truth
+from llm_runner import OPENROUTER_URL, run_requests_sync
+from prompt_batching import batch_instructions, build_batch_prompt, pack_features
+from response_parser import JSON_INSTRUCTIONS, RESPONSE_FORMAT, parse_response
+from results_store import ResultsStore, verdict_rows, write_reports
+from response_cache import ResponseCache
+from simplify import simplify_features
+from triage import EXTERIOR, triage_features
 
 # Create directory if it doesn't exist
 def ensure_dir(directory):
@@ -19,6 +25,21 @@ for directory in ["Json", "Logs", "Model_Output", "Summary"]:
 # API key for OpenRouter
 api_key = "[Insert API key here]"
 
+# Chat-completions endpoint; set OPENROUTER_URL to use mock_openrouter.py for local testing
+api_url = os.environ.get("OPENROUTER_URL", OPENROUTER_URL)
+
+# Request rate shared by all models, and concurrent requests allowed per model
+requests_per_second = 2.0
+per_model_concurrency = 4
+
+# Responses are cached by (model, prompts) in Cache/, which is not cleaned up
+# between runs, so unchanged prompts never hit the network twice
+response_cache = ResponseCache('Cache', max_bytes=500 * 1024 * 1024, max_age_days=30)
+
+# Every run's answers and verdicts are appended to this SQLite store (also kept
+# between runs); the text reports are generated from it
+results_store = ResultsStore('Results/results.sqlite')
+
 # Load the subset data with self-intersection
 subset_file = 'subset_with_error.json'
 with open(subset_file, 'r') as f:
@@ -28,66 +49,54 @@ with open(subset_file, 'r') as f:
 feature_ids = [feature.get('id', str(i)) for i, feature in enumerate(geospatial_data['features'])]
 print(f"Loaded {len(feature_ids)} features with IDs: {', '.join(feature_ids)}...")
 
+# Triage: exact shapely checks decide most features on their own. Only flagged
+# or ambiguous features, plus a random audit sample of clean ones, go to the models
+triage_enabled = True
+audit_fraction = 0.05
+triage_results = triage_features(geospatial_data['features'], audit_fraction=audit_fraction, seed=0,
+                                 exterior=EXTERIOR)
+if triage_enabled:
+    candidate_ids = [str(fid) for fid in triage_results.loc[triage_results['forward'], 'id']]
+    print(f"Triage: {triage_results['triage'].value_counts().to_dict()}, "
+          f"forwarding {len(candidate_ids)} of {len(feature_ids)} features to the models")
+else:
+    candidate_ids = feature_ids
+
+# Only the first few features are evaluated to limit API usage
+max_features = 3
+eval_feature_ids = candidate_ids[:max_features]
+
+# Vertex budget per feature sent to the models (roughly 12 prompt tokens per vertex)
+max_vertices_per_feature = 64
+
+# Pack several features into one request, with coordinates written compactly
+# ('delta' integers, 'polyline' strings or plain 'json'), up to roughly
+# batch_max_tokens prompt tokens per request
+batch_prompts = True
+coordinate_encoding = 'delta'
+batch_max_tokens = 6000
+
 # Function to simplify features to reduce token count
 def simplify_feature(feature):
     """
     Simplify a GeoJSON feature to reduce token count while preserving 
     important characteristics like self-intersections.
     """
-    simplified_feature = {
-        "type": "Feature",
-        "id": feature.get('id', None),
-        "properties": {
-            "fclass": feature.get('properties', {}).get('fclass', None)
-        },
-        "geometry": {
-            "type": feature['geometry']['type'],
-            "coordinates": []
-        }
-    }
-    
-    # Handle different geometry types
-    if feature['geometry']['type'] == 'MultiPolygon':
-        simplified_polygons = []
-        
-        for polygon in feature['geometry']['coordinates']:
-            simplified_polygon = []
-            
-            for ring in polygon:
-                # Keep a reasonable stride of points to preserve topology
-                # We sample points from the full ring to ensure any self-intersections are preserved
-                stride = max(1, len(ring) // 15)  # Ensure stride is at least 1
-                simplified_ring = [ring[i] for i in range(0, len(ring), stride)]
-                
-                # Ensure we have the first/last point to close the ring
-                if ring[0] != simplified_ring[-1]:
-                    simplified_ring.append(ring[0])
-                    
-                simplified_polygon.append(simplified_ring)
-            
-            simplified_polygons.append(simplified_polygon)
-            
-        simplified_feature['geometry']['coordinates'] = simplified_polygons
-    
-    # Other geometry types would be handled here if needed
-    
-    return simplified_feature
+    return simplify_features([feature], max_vertices=max_vertices_per_feature)[0]
 
-# Helper function to detect if the response indicates "Yes" for an issue
-def has_issue(response, issue_type):
-    """
-    Check if the response contains a "Yes" answer for the specified issue type,
-    handling different capitalizations and formatting.
-    """
-    # Pattern to match various forms of "Yes" including with asterisks, different capitalization
-    pattern = f"{issue_type}:.*?(yes|YES|Yes|\\*\\*Yes\\*\\*|\\*\\*YES\\*\\*)"
-    return bool(re.search(pattern, response, re.IGNORECASE))
+# Ask the models for JSON answers (response_format) instead of Yes/No headings.
+# Either way every answer is parsed once into a FeatureVerdict
+structured_output = False
 
 # Save the full dataset for reference
 with open('Json/full_dataset.json', 'w') as f:
     json.dump(geospatial_data, f)
 print(f"Saved full dataset to Json/full_dataset.json")
 
+# Save the triage results next to it
+triage_results.to_csv('Json/triage_results.csv', index=False)
+print(f"Saved triage results to Json/triage_results.csv")
+
 # Models to test
 models = [
     "qwen/qwen3-14b:free",
@@ -107,7 +116,7 @@ You are a geospatial data expert analyzing GeoJSON features for topological issu
 Specifically evaluate ONLY the following categories:
 1. Self-intersections: When a polygon boundary crosses over itself, creating an invalid geometry
 2. Invalid geometries: Unclosed rings, duplicate vertices, or other issues that make a geometry invalid
-3. Ring orientation issues: Outer ring not counterclockwise or inner ring not clockwise
+3. Ring orientation issues: Outer ring not clockwise or inner ring not counterclockwise
 4. Precision/coordinate issues: Extreme coordinate values or excessive precision
 
 When checking for self-intersections, carefully trace all polygon boundaries to identify any points where the boundary crosses itself. This often appears like a bowtie or figure-8 shape when visualized. 
@@ -128,10 +137,82 @@ Precision/coordinate issues: [Yes/No]
 Then provide a brief explanation of your findings, focusing on any issues detected.
 """
 
-# Results for each model
+# Simplify every evaluated feature in one batch to reduce token count
+features_by_id = {f.get('id'): f for f in geospatial_data['features']}
+eval_features = [features_by_id[feature_id] for feature_id in eval_feature_ids if feature_id in features_by_id]
+simplified_features = simplify_features(eval_features, max_vertices=max_vertices_per_feature)
+
+# Save each simplified feature for reference
+for simplified_feature in simplified_features:
+    simplified_file = f"Json/simplified_feature_{simplified_feature['id']}.json"
+    with open(simplified_file, 'w') as f:
+        json.dump(simplified_feature, f, indent=2)
+    print(f"Saved simplified feature to {simplified_file}")
+
+# Build the prompts: one per batch of features, or one per feature
+prompt_groups = []
+request_params = None
+if structured_output:
+    system_prompt += JSON_INSTRUCTIONS
+    request_params = {"response_format": RESPONSE_FORMAT}
+if batch_prompts:
+    system_prompt += batch_instructions(coordinate_encoding)
+    for batch_number, (batch_ids, body) in enumerate(pack_features(simplified_features, batch_max_tokens, coordinate_encoding)):
+        prompt_groups.append((f"batch{batch_number}", batch_ids, build_batch_prompt(body, len(batch_ids))))
+    print(f"Packed {len(simplified_features)} features into {len(prompt_groups)} batched prompts")
+else:
+    for simplified_feature in simplified_features:
+        feature_id = simplified_feature['id']
+        user_prompt = f"""
+        Analyze this GeoJSON feature for topological issues. Pay special attention to self-intersections where the polygon boundary crosses over itself.
+
+        ```
+        {json.dumps(simplified_feature)}
+        ```
+        
+        Focus on identifying self-intersections (boundary crosses itself), invalid geometries, ring orientation issues, and precision/coordinate problems.
+        """
+        prompt_groups.append((feature_id, [feature_id], user_prompt))
+
+# Send every (model, prompt) request concurrently. A shared token bucket
+# replaces the fixed sleeps, and 429/5xx responses are retried with backoff.
+jobs = []
+for model in models:
+    for group_key, _, user_prompt in prompt_groups:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        jobs.append(((model, group_key), model, messages))
+
+print(f"\nSending {len(jobs)} requests to {api_url} ({requests_per_second} requests/second, "
+      f"up to {per_model_concurrency} concurrent requests per model)...")
+start_time = time.time()
+responses = run_requests_sync(jobs, api_key, url=api_url, requests_per_second=requests_per_second,
+                              per_model_concurrency=per_model_concurrency, cache=response_cache,
+                              params=request_params)
+print(f"All requests finished in {time.time() - start_time:.1f} seconds "
+      f"({response_cache.hits} served from cache, {response_cache.misses} sent to the API)")
+evicted = response_cache.evict()
+if evicted:
+    print(f"Evicted {evicted} old entries from the response cache")
+
+# Results for each model: the answer text and its parsed verdict per feature
 model_results = {}
+model_verdicts = {}
 valid_responses = {}
 
+# Exact ground truth for the four issue categories, stored next to every verdict
+ground_truth = feature_ground_truth(eval_features, EXTERIOR)
+run_id = results_store.start_run(models, eval_feature_ids, {
+    'subset_file': subset_file, 'batch_prompts': batch_prompts, 'coordinate_encoding': coordinate_encoding,
+    'structured_output': structured_output, 'max_vertices_per_feature': max_vertices_per_feature,
+    'exterior': EXTERIOR,
+})
+feature_positions = {feature_id: i for i, feature_id in enumerate(eval_feature_ids)}
+response_records = []
+verdict_records = []
+
 # Process each model
 for model in models:
     print("\n" + "=" * 30)
@@ -139,246 +220,98 @@ for model in models:
     print("=" * 30 + "\n")
     
     model_results[model] = {}
+    model_verdicts[model] = {}
     valid_count = 0
     
-    # Process only the first 3 features to limit API usage
-    for i, feature_id in enumerate(feature_ids[:3]):
-        # Get the feature
-        feature = next((f for f in geospatial_data['features'] if f.get('id') == feature_id), None)
-        if not feature:
-            continue
-        
-        print(f"Processing feature ID: {feature_id} with {model}")
-        
-        # Simplify the feature to reduce token count
-        simplified_feature = simplify_feature(feature)
+    for group_key, group_ids, _ in prompt_groups:
+        response = responses[(model, group_key)]
+        group_results = {}
+        group_verdicts = {}
+        usage = {}
         
-        # Save the simplified feature for reference
-        simplified_file = f"Json/simplified_feature_{feature_id}.json"
-        with open(simplified_file, 'w') as f:
-            json.dump(simplified_feature, f, indent=2)
-        print(f"Saved simplified feature to {simplified_file}")
-        
-        # Create the user prompt
-        user_prompt = f"""
-        Analyze this GeoJSON feature for topological issues. Pay special attention to self-intersections where the polygon boundary crosses over itself.
-
-        ```
-        {json.dumps(simplified_feature)}
-        ```
-        
-        Focus on identifying self-intersections (boundary crosses itself), invalid geometries, ring orientation issues, and precision/coordinate problems.
-        """
-        
-        # Prepare the API request
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        }
-        
-        # Send the API request
-        print(f"Sending request to {model} for feature {feature_id}...")
-        try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=data
-            )
-            print(f"Response status code: {response.status_code}")
+        if response['error']:
+            print(f"Request error: {response['error']}")
+            group_results = {feature_id: f"FEATURE {feature_id}:\n{response['error']}" for feature_id in group_ids}
+        else:
+            if response['cached']:
+                print(f"Response for {group_key} loaded from cache")
+            else:
+                print(f"Response status code for {group_key}: {response['status']} "
+                      f"({response['attempts']} attempts, {response['latency']:.1f}s)")
             
             # Save the raw API response for debugging
-            log_file = f"Logs/{model.replace('/', '_')}_{feature_id}_response.json"
+            log_file = f"Logs/{model.replace('/', '_')}_{group_key}_response.json"
             with open(log_file, 'w') as f:
-                f.write(response.text)
+                f.write(response['text'])
             
-            if response.status_code == 200:
+            if response['status'] == 200:
                 try:
-                    result = response.json()
+                    result = json.loads(response['text'])
                     model_response = result['choices'][0]['message']['content'].strip()
+                    usage = result.get('usage') or {}
+                    
+                    # Parse the answer once; a batched answer is split back per feature
+                    parsed = parse_response(model_response, group_ids)
                     
-                    # Check if the response is too short (could be an error or limitation)
-                    if len(model_response) < 10:  # Arbitrary threshold
-                        print(f"Warning: Received empty or very short response from {model}")
-                        model_results[model][feature_id] = f"FEATURE {feature_id}:\nNo valid response received from model."
-                    else:
-                        model_results[model][feature_id] = model_response
-                        valid_count += 1
+                    for feature_id in group_ids:
+                        verdict = parsed.get(feature_id)
+                        # Check if the response is too short (could be an error or limitation)
+                        if verdict is None or len(verdict.text) < 10:  # Arbitrary threshold
+                            print(f"Warning: Received empty or very short response from {model} for feature {feature_id}")
+                            group_results[feature_id] = f"FEATURE {feature_id}:\nNo valid response received from model."
+                        else:
+                            group_results[feature_id] = verdict.text
+                            group_verdicts[feature_id] = verdict
+                            valid_count += 1
                 except Exception as e:
                     print(f"Error parsing response: {e}")
-                    model_results[model][feature_id] = f"FEATURE {feature_id}:\nError parsing model response: {str(e)}"
+                    group_results = {feature_id: f"FEATURE {feature_id}:\nError parsing model response: {str(e)}" for feature_id in group_ids}
             else:
                 print("\n=== ERROR ===")
-                print(f"Status code: {response.status_code}")
-                print(response.text)
+                print(f"Status code: {response['status']}")
+                print(response['text'])
                 print("    ", end="")
-                model_results[model][feature_id] = f"FEATURE {feature_id}:\nAPI Error: {response.status_code} - {response.text}"
-                
-        except Exception as e:
-            print(f"Request error: {e}")
-            model_results[model][feature_id] = f"FEATURE {feature_id}:\nRequest error: {str(e)}"
+                group_results = {feature_id: f"FEATURE {feature_id}:\nAPI Error: {response['status']} - {response['text']}" for feature_id in group_ids}
         
-        # Print feature analysis
-        print(f"\n=== ANALYSIS FOR FEATURE {feature_id} ===")
-        print(f" {model_results[model][feature_id]}")
+        # Latency and token usage of a batched request are shared by its features
+        latency = response['latency']
+        prompt_tokens = usage.get('prompt_tokens', 0) / len(group_ids)
+        completion_tokens = usage.get('completion_tokens', 0) / len(group_ids)
         
-        # Wait between requests to avoid rate limiting
-        if i < len(feature_ids[:3]) - 1:  # Don't wait after the last request
-            print(f"Waiting 2 seconds before processing next feature...")
-            time.sleep(2)
+        # Print feature analysis
+        for feature_id in group_ids:
+            model_results[model][feature_id] = group_results[feature_id]
+            print(f"\n=== ANALYSIS FOR FEATURE {feature_id} ===")
+            print(f" {model_results[model][feature_id]}")
+            
+            response_records.append({
+                'run_id': run_id, 'model': model, 'feature_id': feature_id,
+                'position': feature_positions[feature_id], 'valid': int(feature_id in group_verdicts),
+                'text': group_results[feature_id], 'latency': latency, 'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens, 'cached': int(response['cached']),
+            })
+            # Failed requests get no verdicts, so they can't be scored as "no issues detected"
+            if feature_id in group_verdicts:
+                model_verdicts[model][feature_id] = group_verdicts[feature_id]
+                verdict_records.extend(verdict_rows(run_id, model, group_verdicts[feature_id],
+                                                    ground_truth.get(feature_id), latency, prompt_tokens,
+                                                    completion_tokens))
     
     # Track models with valid responses
     valid_responses[model] = valid_count
     
     if valid_count > 0:
-        print(f"Model {model} produced {valid_count} valid responses out of {len(feature_ids[:3])} features")
+        print(f"Model {model} produced {valid_count} valid responses out of {len(eval_feature_ids)} features")
     else:
         print(f"Model {model} did not produce any valid responses")
-    
-    # Save individual model results immediately after processing
-    model_name = model.replace('/', '_')
-    
-    # Save individual model results
-    output_file = f"Model_Output/{model_name}_analysis.txt"
-    with open(output_file, 'w') as f:
-        f.write(f"ANALYSIS RESULTS FOR {model}\n")
-        f.write("=" * 50 + "\n\n")
-        
-        for feature_id in feature_ids[:3]:
-            if feature_id in model_results[model]:
-                f.write(f"FEATURE {feature_id}:\n")
-                f.write(model_results[model][feature_id] + "\n\n")
-    
-    print(f"\nResults for {model} saved to {output_file}")
-    
-    # Create a summary for this model
-    summary_file = f"Summary/{model_name}_summary.txt"
-    with open(summary_file, 'w') as f:
-        f.write(f"SUMMARY FOR {model}\n")
-        f.write("=" * 50 + "\n\n")
-        
-        # If the model produced valid responses
-        if valid_responses[model] > 0:
-            detected_issues = []
-            
-            for feature_id in feature_ids[:3]:
-                if feature_id in model_results[model]:
-                    response = model_results[model][feature_id]
-                    
-                    # Check for issue detection using the helper function
-                    if has_issue(response, "Self-intersections"):
-                        detected_issues.append(f"Feature {feature_id}: Self-intersection detected")
-                    if has_issue(response, "Invalid geometries"):
-                        detected_issues.append(f"Feature {feature_id}: Invalid geometry detected")
-                    if has_issue(response, "Ring orientation issues"):
-                        detected_issues.append(f"Feature {feature_id}: Ring orientation issue detected")
-                    if has_issue(response, "Precision/coordinate issues"):
-                        detected_issues.append(f"Feature {feature_id}: Precision/coordinate issue detected")
-            
-            if detected_issues:
-                f.write("Issues detected:\n")
-                for issue in detected_issues:
-                    f.write(f"- {issue}\n")
-            else:
-                f.write("No issues detected in any features.\n")
-            
-            f.write(f"\nModel produced {valid_responses[model]} valid responses out of {len(feature_ids[:3])} features.")
-        else:
-            f.write("Model did not produce any valid responses.")
-    
-    print(f"Summary for {model} saved to {summary_file}")
-    
-    # Wait between models to avoid rate limiting
-    if model != models[-1]:  # Don't wait after the last model
-        print(f"Waiting 5 seconds before trying next model...")
-        time.sleep(5)
 
 # Save debug logs
 print("Debug logs saved to Logs/ directory")
 
-# Create a combined comparison summary at the end
-comparison_file = "Summary/combined_model_comparison.txt"
-with open(comparison_file, 'w') as f:
-    f.write("COMBINED SUMMARY OF TOPOLOGICAL ANALYSES\n")
-    f.write("=" * 50 + "\n\n")
-    
-    f.write("Feature Analysis by Model:\n")
-    f.write("-" * 30 + "\n\n")
-    
-    for feature_id in feature_ids[:3]:
-        f.write(f"FEATURE {feature_id}:\n")
-        f.write("-" * 20 + "\n")
-        
-        for model in models:
-            if valid_responses[model] > 0 and feature_id in model_results[model]:
-                model_response = model_results[model][feature_id]
-                
-                # Extract the key issues using the helper function
-                si_detected = has_issue(model_response, "Self-intersections")
-                geom_detected = has_issue(model_response, "Invalid geometries")
-                ring_detected = has_issue(model_response, "Ring orientation issues")
-                prec_detected = has_issue(model_response, "Precision/coordinate issues")
-                
-                issues = []
-                if si_detected:
-                    issues.append("Self-intersection")
-                if geom_detected:
-                    issues.append("Invalid geometry")
-                if ring_detected:
-                    issues.append("Ring orientation issue")
-                if prec_detected:
-                    issues.append("Precision/coordinate issue")
-                
-                if issues:
-                    issues_str = ", ".join(issues)
-                    f.write(f"{model}: Detected issues: {issues_str}\n")
-                else:
-                    f.write(f"{model}: No issues detected\n")
-            else:
-                f.write(f"{model}: No valid response\n")
-        
-        f.write("\n")
-    
-    f.write("\nModel Performance Summary:\n")
-    f.write("-" * 30 + "\n\n")
-    
-    for model in models:
-        valid_count = valid_responses[model]
-        if valid_count > 0:
-            detected_counts = {'si': 0, 'geom': 0, 'ring': 0, 'prec': 0}
-            
-            for feature_id in feature_ids[:3]:
-                if feature_id in model_results[model]:
-                    response = model_results[model][feature_id]
-                    
-                    # Use helper function for consistent issue detection
-                    if has_issue(response, "Self-intersections"):
-                        detected_counts['si'] += 1
-                    if has_issue(response, "Invalid geometries"):
-                        detected_counts['geom'] += 1
-                    if has_issue(response, "Ring orientation issues"):
-                        detected_counts['ring'] += 1
-                    if has_issue(response, "Precision/coordinate issues"):
-                        detected_counts['prec'] += 1
-            
-            total_issues = sum(detected_counts.values())
-            
-            f.write(f"{model}:\n")
-            f.write(f"- Valid responses: {valid_count}/{len(feature_ids[:3])}\n")
-            f.write(f"- Total issues detected: {total_issues}\n")
-            f.write(f"  - Self-intersections: {detected_counts['si']}\n")
-            f.write(f"  - Invalid geometries: {detected_counts['geom']}\n")
-            f.write(f"  - Ring orientation: {detected_counts['ring']}\n")
-            f.write(f"  - Precision/coordinate: {detected_counts['prec']}\n\n")
-        else:
-            f.write(f"{model}: No valid responses\n\n")
-
-print(f"\nCombined model comparison saved to {comparison_file}")
-print("\nAnalysis complete!")
\ No newline at end of file
+# Store the results of this run and generate the reports from the store
+results_store.add_responses(response_records)
+results_store.add_verdicts(verdict_records)
+print(f"\nStored {len(verdict_records)} verdicts of run {run_id} in {results_store.path}\n")
+write_reports(results_store, run_id)
+results_store.close()
+print("\nAnalysis complete!")
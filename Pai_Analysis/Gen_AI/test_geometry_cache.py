@@ -0,0 +1,48 @@
+import json
+
+import geopandas as gpd
+import shapely
+
+from geometry_cache import GeometryCache, _CacheWriter, open_cache, read_geodataframe
+
+POLYGON = [[[0, 0], [1, 0], [1, 1], [0, 0]]]
+
+
+def write_collection(path, geometries):
+    features = [{"type": "Feature", "id": i, "properties": {"n": i}, "geometry": geometry}
+                for i, geometry in enumerate(geometries)]
+    with open(path, 'w') as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def test_empty_polygon_round_trips(tmp_path):
+    # POLYGON EMPTY used to be stored as a multipolygon with a part without rings,
+    # which crashed from_ragged_array on load
+    path = str(tmp_path / 'empty.json')
+    write_collection(path, [{"type": "Polygon", "coordinates": POLYGON},
+                            {"type": "Polygon", "coordinates": []},
+                            {"type": "MultiPolygon", "coordinates": [POLYGON]},
+                            None])
+    cache_dir = str(tmp_path / 'cache')
+    geoms = read_geodataframe(path, cache_dir=cache_dir).geometry.values.to_numpy()
+    assert shapely.to_wkt(geoms[:3]).tolist() == ['POLYGON ((0 0, 1 0, 1 1, 0 0))', 'POLYGON EMPTY',
+                                                  'MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)))']
+    assert geoms[3] is None
+
+    cache = open_cache(path, cache_dir=cache_dir)
+    assert cache.meta['format'] == 'ragged'
+    assert shapely.to_wkt(cache.take([1, 0])).tolist() == ['POLYGON EMPTY', 'POLYGON ((0 0, 1 0, 1 1, 0 0))']
+
+
+def test_multipolygon_with_empty_part_switches_to_wkb(tmp_path):
+    # from_ragged_array crashes on empty parts too; GeoJSON can't express one, so the chunks are written directly
+    directory = tmp_path / 'written'
+    directory.mkdir()
+    writer = _CacheWriter(str(directory), 1)
+    writer.write_chunk(gpd.GeoDataFrame({'id': [0]}, geometry=shapely.from_wkt(['POLYGON ((0 0, 1 0, 1 1, 0 0))'])))
+    writer.write_chunk(gpd.GeoDataFrame({'id': [1]}, geometry=shapely.from_wkt(
+        ['MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), EMPTY)'])))
+    meta = writer.finish()
+    assert meta['format'] == 'wkb'
+    assert shapely.to_wkt(GeometryCache(str(directory), meta).geometries()).tolist() == [
+        'POLYGON ((0 0, 1 0, 1 1, 0 0))', 'MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)), EMPTY)']
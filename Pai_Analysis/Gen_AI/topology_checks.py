@@ -0,0 +1,425 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+# Number of candidate pairs refined at once by the exact predicates
+PAIR_BATCH_SIZE = 100000
+
+# A polygon part is a sliver when its Polsby-Popper compactness and its
+# minimum rotated rectangle thinness (short side / long side) are both below these
+SLIVER_COMPACTNESS = 0.1
+SLIVER_THINNESS = 0.1
+
+
+def _as_geometry_array(geometries):
+    """Return (numpy array of geometries, index labels) for a GeoSeries, list or array"""
+    if isinstance(geometries, pd.Series):
+        return np.asarray(geometries.values, dtype=object), np.asarray(geometries.index)
+    geometries = np.asarray(geometries, dtype=object)
+    return geometries, np.arange(len(geometries))
+
+
+def find_overlaps(geometries, min_area=0.0):
+    """
+    Find every pair of geometries whose interiors overlap.
+
+    Candidate pairs come from a single bulk STRtree query, so only pairs with
+    intersecting bounding boxes are refined with the exact predicates. A pair
+    counts as overlapping when the geometries intersect, do not merely touch,
+    and their intersection area is larger than min_area.
+
+    Returns a DataFrame with one row per pair: index_1, index_2 (labels of the
+    input) and intersection_area. Pairs that GEOS cannot process (usually
+    because one of the geometries is invalid) are returned with an "error"
+    message instead of an area.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    tree = STRtree(geoms)
+    left, right = tree.query(geoms, predicate='intersects')
+
+    # Each unordered pair is reported once
+    keep = left < right
+    left, right = left[keep], right[keep]
+
+    rows = []
+    for start in range(0, len(left), PAIR_BATCH_SIZE):
+        l = left[start:start + PAIR_BATCH_SIZE]
+        r = right[start:start + PAIR_BATCH_SIZE]
+        try:
+            touching = shapely.touches(geoms[l], geoms[r])
+            l, r = l[~touching], r[~touching]
+            areas = shapely.area(shapely.intersection(geoms[l], geoms[r]))
+        except shapely.errors.GEOSException:
+            # Fall back to checking the batch pair by pair to isolate the bad geometries
+            rows.append(_overlaps_pairwise(geoms, labels, l, r, min_area))
+            continue
+        significant = areas > min_area
+        rows.append(pd.DataFrame({
+            'index_1': labels[l[significant]],
+            'index_2': labels[r[significant]],
+            'intersection_area': areas[significant],
+            'error': None,
+        }))
+
+    if not rows:
+        return pd.DataFrame(columns=['index_1', 'index_2', 'intersection_area', 'error'])
+    return pd.concat(rows, ignore_index=True)
+
+
+def _overlaps_pairwise(geoms, labels, left, right, min_area):
+    records = []
+    for i, j in zip(left, right):
+        try:
+            if geoms[i].touches(geoms[j]):
+                continue
+            area = geoms[i].intersection(geoms[j]).area
+            if area > min_area:
+                records.append((labels[i], labels[j], area, None))
+        except shapely.errors.GEOSException as e:
+            records.append((labels[i], labels[j], np.nan, str(e)))
+    return pd.DataFrame(records, columns=['index_1', 'index_2', 'intersection_area', 'error'])
+
+
+def find_nearby_pairs(geometries, tolerance=1e-4, batch_size=PAIR_BATCH_SIZE):
+    """
+    Find every pair of distinct geometries closer than tolerance (touching
+    and intersecting pairs have distance 0).
+
+    The geometries are indexed once in an STRtree and queried in batches with
+    the "dwithin" predicate, so only pairs within tolerance are ever returned
+    by the tree and memory is bounded by the batch size rather than by the
+    number of features squared. Each unordered pair is reported once.
+
+    Returns a DataFrame with index_1, index_2 (labels of the input, index_1
+    coming first in the input) and distance, sorted by distance and then by
+    position, so the result is the same on every run.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    tree = STRtree(geoms)
+
+    lefts, rights, distances = [], [], []
+    for start in range(0, len(geoms), batch_size):
+        left, right = tree.query(geoms[start:start + batch_size], predicate='dwithin', distance=tolerance)
+        left = left + start
+        keep = left < right
+        left, right = left[keep], right[keep]
+        lefts.append(left)
+        rights.append(right)
+        distances.append(shapely.distance(geoms[left], geoms[right]))
+
+    if not lefts:
+        return pd.DataFrame(columns=['index_1', 'index_2', 'distance'])
+    left, right, distance = np.concatenate(lefts), np.concatenate(rights), np.concatenate(distances)
+    order = np.lexsort((right, left, distance))
+    return pd.DataFrame({
+        'index_1': labels[left[order]],
+        'index_2': labels[right[order]],
+        'distance': distance[order],
+    })
+
+
+def polygon_rings(geoms):
+    """
+    Explode polygons and multipolygons into their rings (exteriors and holes).
+    Returns the rings plus, for every ring, the position of its feature in
+    geoms, the part number within the feature and the ring number within the
+    part (0 is the exterior, 1.. are holes).
+    """
+    parts, part_feature = shapely.get_parts(geoms, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == 3
+    parts, part_feature = parts[is_polygon], part_feature[is_polygon]
+
+    # Number each part within its feature
+    part_number = np.arange(len(parts)) - np.searchsorted(part_feature, part_feature)
+
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    ring_number = np.arange(len(rings)) - np.searchsorted(ring_part, ring_part)
+    return rings, part_feature[ring_part], part_number[ring_part], ring_number
+
+
+def vertex_precision_check(geometries, close_threshold=1e-8):
+    """
+    Count duplicate and near-duplicate consecutive vertices for every feature.
+
+    All rings of all features (holes included) are flattened into one
+    coordinate array and the distance between consecutive vertices is
+    computed in a single vectorised pass. Returns a DataFrame indexed like the
+    input with the columns duplicate_vertices (distance == 0),
+    close_vertices (0 < distance < close_threshold) and
+    min_vertex_distance.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    rings, ring_feature, _, _ = polygon_rings(geoms)
+
+    counts = shapely.get_num_coordinates(rings)
+    rings, ring_feature, counts = rings[counts > 0], ring_feature[counts > 0], counts[counts > 0]
+    coords = shapely.get_coordinates(rings)
+    ring_ends = np.cumsum(counts)
+
+    # Segments join vertex k to k + 1, except across the boundary between two rings
+    dist = np.hypot(*np.diff(coords, axis=0).T)
+    segment_ring = np.repeat(np.arange(len(rings)), counts)[:-1]
+    within_ring = np.ones(len(dist), dtype=bool)
+    within_ring[ring_ends[:-1] - 1] = False
+    dist, segment_feature = dist[within_ring], ring_feature[segment_ring[within_ring]]
+
+    n = len(geoms)
+    duplicate = np.bincount(segment_feature, weights=dist == 0, minlength=n).astype(int)
+    close = np.bincount(segment_feature, weights=(dist > 0) & (dist < close_threshold), minlength=n).astype(int)
+    min_dist = np.full(n, np.inf)
+    np.minimum.at(min_dist, segment_feature, dist)
+    min_dist[np.isinf(min_dist)] = np.nan
+
+    return pd.DataFrame({
+        'duplicate_vertices': duplicate,
+        'close_vertices': close,
+        'min_vertex_distance': min_dist,
+    }, index=labels)
+
+
+def ring_orientation_check(geometries, exterior='cw'):
+    """
+    Audit the orientation of every ring of every (multi)polygon at once.
+
+    The signed area of each ring is computed with the shoelace formula over
+    the packed coordinate buffer (coordinates are shifted to the first vertex
+    of their ring to keep the products small). Exterior rings are expected to
+    run in the `exterior` direction ('cw' or 'ccw') and holes the opposite way.
+
+    Returns a DataFrame with one row per ring: index, part, ring (0 is the
+    exterior, 1.. are holes), expected and actual orientation.
+    """
+    if exterior not in ('cw', 'ccw'):
+        raise ValueError(f"exterior must be 'cw' or 'ccw', not {exterior!r}")
+
+    geoms, labels = _as_geometry_array(geometries)
+    rings, ring_feature, ring_part, ring_number = polygon_rings(geoms)
+
+    counts = shapely.get_num_coordinates(rings)
+    ring_ids = np.repeat(np.arange(len(rings)), counts)
+    coords = shapely.get_coordinates(rings)
+    if len(coords):
+        first = np.cumsum(counts) - counts
+        coords = coords - coords[first[ring_ids]]
+
+    # Shoelace terms for each segment that stays inside its ring
+    cross = coords[:-1, 0] * coords[1:, 1] - coords[1:, 0] * coords[:-1, 1]
+    same_ring = ring_ids[:-1] == ring_ids[1:]
+    signed_area = np.bincount(ring_ids[:-1][same_ring], weights=cross[same_ring], minlength=len(rings)) / 2
+
+    # Zero-area rings count as clockwise, like LinearRing.is_ccw
+    actual = np.where(signed_area > 0, 'ccw', 'cw')
+    other = 'ccw' if exterior == 'cw' else 'cw'
+    expected = np.where(ring_number == 0, exterior, other)
+
+    return pd.DataFrame({
+        'index': labels[ring_feature],
+        'part': ring_part,
+        'ring': ring_number,
+        'expected': expected,
+        'actual': actual,
+    })
+
+
+def orient_rings(geometries, exterior='cw'):
+    """
+    Return the geometries with every ring re-oriented so that exteriors run in
+    the `exterior` direction and holes the opposite way. Non-polygonal
+    geometries are returned unchanged.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    oriented = shapely.orient_polygons(geoms, exterior_cw=(exterior == 'cw'))
+    if hasattr(geometries, 'index'):
+        return geometries.__class__(oriented, index=geometries.index, crs=getattr(geometries, 'crs', None))
+    return oriented
+
+
+def connected_components(n, left, right):
+    """
+    Label the connected components of an undirected graph with n nodes and
+    edges left[k] - right[k]. Every node gets the smallest node number of its
+    component, found by repeated min-label propagation with pointer jumping.
+    """
+    labels = np.arange(n)
+    left, right = np.asarray(left, dtype=np.int64), np.asarray(right, dtype=np.int64)
+    while True:
+        previous = labels.copy()
+        smallest = np.minimum(labels[left], labels[right])
+        np.minimum.at(labels, labels[left], smallest)
+        np.minimum.at(labels, labels[right], smallest)
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def geometry_fingerprints(geometries, grid_size=None):
+    """
+    Hashable fingerprint of every geometry, as a group number: geometries
+    with the same number have the same fingerprint. The geometries are
+    normalized first (ring start points, ring direction and part order are
+    made canonical), so copies that differ only by vertex order or starting
+    point share a fingerprint. With a grid_size the coordinates are also
+    snapped to that grid, so copies differing by precision noise smaller than
+    the grid usually share one too. Missing and empty geometries get -1.
+    """
+    geoms, _ = _as_geometry_array(geometries)
+    normalized = shapely.normalize(geoms)
+    if grid_size:
+        coords = shapely.get_coordinates(normalized)
+        normalized = shapely.set_coordinates(normalized.copy(), np.round(coords / grid_size) * grid_size)
+    wkb = shapely.to_wkb(normalized)
+    wkb[shapely.is_missing(geoms) | shapely.is_empty(geoms)] = None
+    codes, _ = pd.factorize(wkb)
+    return codes
+
+
+def find_duplicates(geometries, tolerance=1e-9, batch_size=PAIR_BATCH_SIZE):
+    """
+    Find exact and near-duplicate geometries.
+
+    Candidates are found in near-linear time in two ways: geometries sharing
+    a normalized and quantized fingerprint (hashing, see
+    geometry_fingerprints), and geometries whose bounding boxes agree within
+    tolerance on all four sides (an STRtree over the lower-left corners, which
+    also catches copies whose noise straddles a grid line). Every candidate
+    pair is then confirmed with equals_exact, falling back to the Hausdorff
+    distance, so two geometries are near duplicates when no point of either
+    is further than tolerance from the other.
+
+    Returns a DataFrame with one row per geometry that duplicates an earlier
+    one: index, duplicate_of (label of the first geometry of its group) and
+    match, which is 'exact' (identical coordinates), 'normalized' (identical
+    after normalization, e.g. another starting point or vertex order) or
+    'near' (within tolerance).
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    n = len(geoms)
+    if n == 0:
+        return pd.DataFrame(columns=['index', 'duplicate_of', 'match'])
+    present = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    normalized = shapely.normalize(geoms)
+
+    # Candidate pairs from the quantized fingerprints: every member is paired with the first of its group
+    quantized = geometry_fingerprints(geoms, tolerance)
+    first_member = np.full(quantized.max() + 1, n)
+    np.minimum.at(first_member, quantized[present], np.arange(n)[present])
+    members = np.flatnonzero(present)
+    leader = first_member[quantized[members]]
+    pairs = [np.stack([leader[leader != members], members[leader != members]])]
+
+    # Candidate pairs from the bounding boxes, looked up by lower-left corner
+    bounds = shapely.bounds(normalized)
+    corners = shapely.points(bounds[:, :2])
+    tree = STRtree(corners)
+    search = np.flatnonzero(present)
+    for start in range(0, len(search), batch_size):
+        batch = search[start:start + batch_size]
+        left, right = tree.query(corners[batch], predicate='dwithin', distance=tolerance * np.sqrt(2))
+        left = batch[left]
+        keep = (left < right) & present[right]
+        left, right = left[keep], right[keep]
+        same_box = (np.abs(bounds[left] - bounds[right]) <= tolerance).all(axis=1)
+        same_type = shapely.get_type_id(geoms[left]) == shapely.get_type_id(geoms[right])
+        keep = same_box & same_type
+        pairs.append(np.stack([left[keep], right[keep]]))
+
+    left, right = np.unique(np.concatenate(pairs, axis=1), axis=1)
+
+    # Confirm the candidates, with the cheap vertex-by-vertex comparison first
+    confirmed = shapely.equals_exact(normalized[left], normalized[right], tolerance)
+    unsure = np.flatnonzero(~confirmed)
+    if len(unsure):
+        confirmed[unsure] = shapely.hausdorff_distance(geoms[left[unsure]], geoms[right[unsure]]) <= tolerance
+    left, right = left[confirmed], right[confirmed]
+
+    group = connected_components(n, left, right)
+    duplicate = np.flatnonzero(group != np.arange(n))
+    first = group[duplicate]
+    match = np.where(shapely.equals_exact(geoms[duplicate], geoms[first], 0), 'exact',
+                     np.where(shapely.equals_exact(normalized[duplicate], normalized[first], 0), 'normalized', 'near'))
+    return pd.DataFrame({'index': labels[duplicate], 'duplicate_of': labels[first], 'match': match})
+
+
+def polygon_part_shapes(geometries):
+    """
+    Shape measures of every part of every (multi)polygon, computed with one
+    vectorised call per measure: area, perimeter, Polsby-Popper compactness
+    (4 pi area / perimeter^2, 1 for a circle and close to 0 for a sliver) and
+    thinness (short side / long side of the minimum rotated rectangle).
+    Returns a DataFrame with one row per part: index (label of the input),
+    part and the four measures.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    parts, part_feature = shapely.get_parts(geoms, return_index=True)
+    is_polygon = shapely.get_type_id(parts) == 3
+    parts, part_feature = parts[is_polygon], part_feature[is_polygon]
+    part_number = np.arange(len(parts)) - np.searchsorted(part_feature, part_feature)
+
+    area = shapely.area(parts)
+    perimeter = shapely.length(parts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        compactness = np.where(perimeter > 0, 4 * np.pi * area / perimeter ** 2, np.nan)
+
+    # Collinear parts have a line or point as their rectangle, which counts as infinitely thin
+    rectangles = shapely.minimum_rotated_rectangle(parts)
+    thinness = np.zeros(len(parts))
+    boxes = (shapely.get_type_id(rectangles) == 3) & (shapely.get_num_coordinates(rectangles) == 5)
+    if boxes.any():
+        corners = shapely.get_coordinates(rectangles[boxes]).reshape(-1, 5, 2)
+        side_1 = np.hypot(*(corners[:, 1] - corners[:, 0]).T)
+        side_2 = np.hypot(*(corners[:, 2] - corners[:, 1]).T)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            thinness[boxes] = np.minimum(side_1, side_2) / np.maximum(side_1, side_2)
+    thinness[perimeter == 0] = np.nan
+
+    return pd.DataFrame({
+        'index': labels[part_feature],
+        'part': part_number,
+        'area': area,
+        'perimeter': perimeter,
+        'compactness': compactness,
+        'thinness': thinness,
+    })
+
+
+def sliver_check(geometries, max_compactness=SLIVER_COMPACTNESS, max_thinness=SLIVER_THINNESS, max_area=None):
+    """
+    Flag sliver polygons: parts whose compactness and thinness are both
+    below the thresholds (and, with max_area, whose area is below it too).
+
+    Returns a DataFrame indexed like the input with sliver_parts (number of
+    sliver parts), compactness and thinness (the lowest of any part, NaN for
+    features without polygon parts) and is_sliver. Use rank_slivers to order
+    the flagged features from the thinnest.
+    """
+    geoms, labels = _as_geometry_array(geometries)
+    # Passing the bare array makes the "index" column the position of each feature
+    shapes = polygon_part_shapes(geoms)
+    part_feature = shapes['index'].to_numpy(dtype=np.int64)
+
+    sliver = (shapes['compactness'] < max_compactness) & (shapes['thinness'] < max_thinness)
+    if max_area is not None:
+        sliver &= shapes['area'] < max_area
+
+    n = len(geoms)
+    compactness = np.full(n, np.inf)
+    thinness = np.full(n, np.inf)
+    np.fmin.at(compactness, part_feature, shapes['compactness'].to_numpy())
+    np.fmin.at(thinness, part_feature, shapes['thinness'].to_numpy())
+    compactness[np.isinf(compactness)] = np.nan
+    thinness[np.isinf(thinness)] = np.nan
+    sliver_parts = np.bincount(part_feature, weights=sliver.to_numpy(), minlength=n).astype(int)
+
+    return pd.DataFrame({
+        'sliver_parts': sliver_parts,
+        'compactness': compactness,
+        'thinness': thinness,
+        'is_sliver': sliver_parts > 0,
+    }, index=labels)
+
+
+def rank_slivers(results):
+    """Flagged slivers of a sliver_check result, least compact first"""
+    return results[results['is_sliver']].sort_values(['compactness', 'thinness'], kind='stable')
+
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+from topology_checks import ring_orientation_check, vertex_precision_check
+
+# Ring orientation convention of the data (exterior clockwise in the OSM extracts, as in
+# analyze_topology.py). The ground truth in evaluate_models.py and the system prompt in
+# test.py use the same one, so triage and scoring agree on what a wrong ring is
+EXTERIOR = 'cw'
+
+CLOSE_VERTICES_THRESHOLD = 1e-8
+SMALL_AREA_THRESHOLD = 1e-10
+
+# Vertices closer than this multiple of the threshold are too close to call.
+# OSM coordinates carry 7-8 decimals, so ordinary vertex spacing is around
+# 1e-7: the borderline band only covers rounding noise around the threshold
+BORDERLINE_FACTOR = 2
+
+
+def triage_geometries(geoms, exterior=EXTERIOR, close_threshold=CLOSE_VERTICES_THRESHOLD,
+                      small_area_threshold=SMALL_AREA_THRESHOLD):
+    """
+    Run the exact, cheap checks from analyze_topology.py on every geometry at
+    once and classify each one.
+
+    Returns a DataFrame with the check results and a "triage" column:
+    'flagged' when a check found an issue, 'ambiguous' when the checks can't
+    settle it (missing or empty geometry, vertex spacing just above the
+    precision threshold) and 'clean' otherwise. Ring orientation is checked
+    against the convention of the data (exterior clockwise in the OSM
+    extracts, as in analyze_topology.py), so correctly stored rings don't
+    get every feature forwarded.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    missing = shapely.is_missing(geoms)
+    empty = missing | shapely.is_empty(geoms)
+
+    valid = shapely.is_valid(geoms)
+    reason = np.full(len(geoms), None, dtype=object)
+    if not valid.all():
+        reason[~valid] = shapely.is_valid_reason(geoms[~valid])
+    simple = shapely.is_simple(geoms)
+    # Only polygons can be too small; lines and points always have zero area
+    area = shapely.area(geoms)
+    polygonal = np.isin(shapely.get_type_id(geoms), (3, 6))
+
+    rings = ring_orientation_check(geoms, exterior=exterior)
+    wrong = rings[rings['expected'] != rings['actual']]
+    orientation_issues = np.bincount(wrong['index'].to_numpy(dtype=int), minlength=len(geoms))
+
+    precision = vertex_precision_check(geoms, close_threshold)
+
+    results = pd.DataFrame({
+        'is_valid': valid & ~missing,
+        'validity_reason': reason,
+        'is_simple': simple & ~missing,
+        'orientation_issues': orientation_issues,
+        'duplicate_vertices': precision['duplicate_vertices'].to_numpy(),
+        'close_vertices': precision['close_vertices'].to_numpy(),
+        'min_vertex_distance': precision['min_vertex_distance'].to_numpy(),
+        'is_small': polygonal & (area < small_area_threshold) & ~empty,
+    })
+
+    flagged = (~results['is_valid'] | ~results['is_simple'] | (results['orientation_issues'] > 0)
+               | (results['duplicate_vertices'] > 0) | (results['close_vertices'] > 0) | results['is_small'])
+    borderline = results['min_vertex_distance'] < close_threshold * BORDERLINE_FACTOR
+    results['triage'] = np.where(empty, 'ambiguous', np.where(flagged, 'flagged',
+                                 np.where(borderline, 'ambiguous', 'clean')))
+    # Empty geometries are reported as ambiguous rather than invalid
+    results.loc[empty, ['is_valid', 'is_simple']] = True
+    return results
+
+
+def triage_features(features, audit_fraction=0.0, seed=0, **kwargs):
+    """
+    Triage a list of GeoJSON features. Flagged and ambiguous features are
+    marked to be forwarded to the models, plus a seeded random audit sample of
+    audit_fraction of the clean ones so the models can still be checked on
+    features without issues.
+    """
+    geoms = np.array([shape(f['geometry']) if f.get('geometry') else None for f in features], dtype=object)
+    results = triage_geometries(geoms, **kwargs)
+    results.insert(0, 'id', [feature.get('id') for feature in features])
+
+    rng = np.random.default_rng(seed)
+    audit = (results['triage'] == 'clean').to_numpy() & (rng.random(len(results)) < audit_fraction)
+    results.loc[audit, 'triage'] = 'audit'
+    results['forward'] = results['triage'] != 'clean'
+    return results
+
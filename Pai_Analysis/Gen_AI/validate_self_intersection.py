@@ -1,8 +1,5 @@
-import json
-import geopandas as gpd
-from shapely.geometry import shape, mapping
 import matplotlib.pyplot as plt
-import numpy as np
+from geometry_cache import read_geodataframe
 
 def validate_self_intersection():
     """
@@ -15,15 +12,11 @@ def validate_self_intersection():
     """
     print("Validating self-intersections in subset_with_error.json...")
     
-    # Load the GeoJSON file
-    with open('subset_with_error.json', 'r') as f:
-        data = json.load(f)
+    # Load the GeoJSON file as a GeoDataFrame, from the binary cache after the first run
+    gdf = read_geodataframe('subset_with_error.json')
     
     # Print basic info about the dataset
-    print(f"Dataset has {len(data['features'])} features")
-    
-    # Convert to GeoDataFrame for analysis
-    gdf = gpd.GeoDataFrame.from_features(data['features'])
+    print(f"Dataset has {len(gdf)} features")
     
     # Check each geometry for self-intersections
     self_intersections = []
@@ -79,8 +72,9 @@ def validate_self_intersection():
     
     # Explain why the Mistral 7B model might have missed the self-intersection
     print("\nExplanation of why Mistral 7B missed the self-intersection:")
-    print("1. Feature Simplification: The test.py code simplifies features by taking every nth point")
-    print("   to reduce token count. This might have removed the self-intersection points.")
+    print("1. Feature Simplification: The test.py code used to simplify features by taking every nth point")
+    print("   to reduce token count, which could remove the self-intersection points. simplify.py now")
+    print("   keeps the vertices of crossing segments, so this only applies to older runs.")
     print("2. Resolution Issues: Small self-intersections might be undetectable at certain scales.")
     print("3. Model Limitations: The 7B model has less parameter capacity to correctly identify")
     print("   complex geometric issues compared to larger models.")
@@ -103,8 +97,9 @@ def explain_simplification():
     print("     (like self-intersections) might be removed during simplification.")
     print("   - Modified Spatial Relationships: Simplification might change the relationships")
     print("     between features (e.g., removing overlap or creating artificial gaps).")
-    print("4. Simplification Methods: The code uses a stride-based approach, taking every nth point")
-    print("   rather than Douglas-Peucker or other topology-preserving methods.")
+    print("4. Simplification Methods: simplify.py uses topology-preserving Douglas-Peucker with a")
+    print("   per-feature vertex budget, and always keeps the vertices of crossing segments so")
+    print("   self-intersections in the original geometry survive simplification.")
     print("5. Trade-offs: There's always a balance between keeping token count low and preserving")
     print("   enough detail to enable accurate topological analysis.")
 
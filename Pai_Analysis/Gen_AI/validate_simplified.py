@@ -1,9 +1,9 @@
 import json
-import geopandas as gpd
-from shapely.geometry import shape, mapping
+from shapely.geometry import shape
 import matplotlib.pyplot as plt
 import os
 import glob
+from geometry_cache import read_geodataframe
 
 def validate_simplified_features():
     """
@@ -16,17 +16,12 @@ def validate_simplified_features():
     """
     print("Validating simplified features for self-intersections...")
     
-    # 1. Load the original dataset with known self-intersections
-    with open('subset_with_error.json', 'r') as f:
-        original_data = json.load(f)
+    # 1. Load the original dataset with known self-intersections, as a GeoDataFrame
+    # with the feature ids in an "id" column (from the binary cache after the first run)
+    original_gdf = read_geodataframe('subset_with_error.json')
     
-    # Convert to GeoDataFrame for analysis and make sure to get the id as a column
-    original_gdf = gpd.GeoDataFrame.from_features(original_data['features'])
-    
-    # Get the IDs from the properties or feature itself
-    feature_ids = []
-    for feature in original_data['features']:
-        feature_ids.append(feature.get('id', str(len(feature_ids))))
+    # Get the IDs from the feature itself, or its position when it has none
+    feature_ids = [str(i) if feature_id is None else feature_id for i, feature_id in enumerate(original_gdf['id'])]
     
     # Add the id column explicitly
     original_gdf['feature_id'] = feature_ids